@@ -0,0 +1,250 @@
+from datetime import datetime
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from database import FILE_PATH, engine
+
+# Default backup folder path
+BACKUP_DIR = os.path.abspath(os.path.join("data", "backups"))
+
+
+class BackupStats:
+    """
+    Timing information about an online backup or restore
+    """
+
+    def __init__(self) -> None:
+        self.total_pages = 0
+        self.step_times = []
+        self.total_time = 0.0
+        self.restarts = 0
+        self.completed = False
+
+    @property
+    def max_step_time(self) -> float:
+        """
+        The longest time (in seconds) a single step held the database lock, blocking writers
+        """
+        return max(self.step_times, default=0.0)
+
+    @property
+    def mean_step_time(self) -> float:
+        """
+        The average time (in seconds) a single step held the database lock
+        """
+        return sum(self.step_times) / len(self.step_times) if self.step_times else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.total_pages} pages in {len(self.step_times)} steps ({self.restarts} restarts), {self.total_time:.3f}s total, "
+            f"writer blocked {self.mean_step_time * 1000.0:.2f}ms on average and {self.max_step_time * 1000.0:.2f}ms at most per step")
+
+
+class _TooManyRestarts(Exception):
+    """
+    Raised to stop a stepped copy that keeps restarting because of concurrent writes
+    """
+
+
+class DatabaseBackup:
+    """
+    Copies the database while the app is running using the SQLite online backup API.
+
+    The database is copied a few pages at a time. Each step only holds the database lock while its pages are copied,
+    and the backup pauses between steps so the GUI's session can keep reading and writing.
+    If another connection writes to the database during the backup, SQLite restarts the copy from the first page,
+    so the result is never a torn copy. After a few restarts, the copy is finished in a single step instead.
+    """
+
+    def __init__(self, source_path: str=FILE_PATH, pages_per_step: int=64, pause: float=0.005, max_restarts: int=3) -> None:
+        """
+        Parameters
+        ----------
+        source_path : str
+            The path of the database file to back up or restore
+        pages_per_step : int
+            The number of pages copied while holding the database lock
+        pause : float
+            The time in seconds to release the lock between steps
+        max_restarts : int
+            The number of times the copy may restart because of writes before
+            the rest of the database is copied in a single step (blocking writers until it ends)
+
+        Returns
+        -------
+        None
+        """
+        self.source_path = source_path
+        self.pages_per_step = pages_per_step
+        self.pause = pause
+        self.max_restarts = max_restarts
+        self.thread = None
+        self.stats = None
+
+    def backup(self, backup_path: Optional[str]=None, progress_callback: Optional[Callable]=None) -> Optional[str]:
+        """
+        Backs up the database to a file (blocks the calling thread, but not other connections)
+
+        Parameters
+        ----------
+        backup_path : str, optional
+            The path of the backup file. If not specified, creates a timestamped file in the backups folder
+        progress_callback : Callable, optional
+            The function that is called after each step with the number of copied pages and the total number of pages
+
+        Returns
+        -------
+        str, optional
+            The backup file path, or None if the backup failed
+        """
+        if not backup_path:
+            os.makedirs(BACKUP_DIR, exist_ok=True)
+            backup_path = os.path.join(BACKUP_DIR, f"appdata-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+
+        try:
+            self.stats = self._copy(self.source_path, backup_path, progress_callback)
+        except sqlite3.Error as e:
+            print(f"Could not back up the database. Error: {e}")
+            return None
+        return backup_path
+
+    def backup_in_background(self, backup_path: Optional[str]=None, progress_callback: Optional[Callable]=None,
+        done_callback: Optional[Callable]=None) -> threading.Thread:
+        """
+        Backs up the database to a file on a background thread
+
+        Parameters
+        ----------
+        backup_path : str, optional
+            The path of the backup file. If not specified, creates a timestamped file in the backups folder
+        progress_callback : Callable, optional
+            The function that is called after each step with the number of copied pages and the total number of pages
+        done_callback : Callable, optional
+            The function that is called with the backup file path (None if the backup failed) when the backup ends
+
+        Returns
+        -------
+        Thread
+            The backup thread
+        """
+        def run() -> None:
+            path = self.backup(backup_path, progress_callback)
+            if done_callback:
+                done_callback(path)
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def restore(self, backup_path: str, progress_callback: Optional[Callable]=None) -> bool:
+        """
+        Restores the database from a backup file.
+        Open sessions should be closed or expired afterwards, since their loaded objects are out of date
+
+        Parameters
+        ----------
+        backup_path : str
+            The path of the backup file
+        progress_callback : Callable, optional
+            The function that is called after each step with the number of copied pages and the total number of pages
+
+        Returns
+        -------
+        bool
+            Whether the database was restored
+        """
+        if not os.path.exists(backup_path):
+            print(f"Could not restore the database; {backup_path} does not exist!")
+            return False
+
+        try:
+            connection = sqlite3.connect(backup_path)
+            try:
+                result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                connection.close()
+            if result != "ok":
+                print(f"Could not restore the database; the backup is corrupt: {result}")
+                return False
+
+            self.stats = self._copy(backup_path, self.source_path, progress_callback)
+        except sqlite3.Error as e:
+            print(f"Could not restore the database. Error: {e}")
+            return False
+
+        # Drop pooled connections that may have cached the old schema
+        engine.dispose()
+        return True
+
+    def _copy(self, source_path: str, destination_path: str, progress_callback: Optional[Callable]=None) -> BackupStats:
+        """
+        Copies a database to another in steps, measuring how long each step holds the lock
+
+        Parameters
+        ----------
+        source_path : str
+            The path of the database to copy
+        destination_path : str
+            The path of the database to overwrite
+        progress_callback : Callable, optional
+            The function that is called after each step with the number of copied pages and the total number of pages
+
+        Returns
+        -------
+        BackupStats
+            The timing information of the copy
+        """
+        stats = BackupStats()
+        start = time.perf_counter()
+        step_start = start
+        previous_remaining = None
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal step_start, previous_remaining
+            # The lock is only held inside the step, which ends right before this callback
+            stats.step_times.append(time.perf_counter() - step_start)
+            stats.total_pages = total
+            if progress_callback:
+                progress_callback(total - remaining, total)
+
+            # A write from another connection restarts the copy from the first page
+            if previous_remaining is not None and remaining > previous_remaining:
+                stats.restarts += 1
+                if stats.restarts > self.max_restarts:
+                    raise _TooManyRestarts
+            previous_remaining = remaining
+
+            # Release the lock for a moment so the app's connections can write
+            if remaining:
+                time.sleep(self.pause)
+            step_start = time.perf_counter()
+
+        source = sqlite3.connect(source_path)
+        destination = sqlite3.connect(destination_path)
+        try:
+            try:
+                source.backup(destination, pages=self.pages_per_step, progress=progress)
+            except _TooManyRestarts:
+                # The database is written to too often to finish in steps, so copy it in a single step
+                step_start = time.perf_counter()
+                source.backup(destination, pages=-1)
+                stats.step_times.append(time.perf_counter() - step_start)
+        finally:
+            destination.close()
+            source.close()
+
+        stats.total_time = time.perf_counter() - start
+        stats.completed = True
+        return stats
+
+
+def test():
+    database_backup = DatabaseBackup()
+    database_backup.backup_in_background(done_callback=lambda path: print(f"Backed up to {path}"))
+    database_backup.thread.join()
+    print(database_backup.stats)
+
+if __name__ == "__main__":
+    test()
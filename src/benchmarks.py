@@ -0,0 +1,1044 @@
+"""
+Performance benchmarks. Run a single benchmark by name, e.g.
+
+python src/benchmarks.py similarity_rebuild
+"""
+
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+import sqlalchemy as db
+
+from database import Base
+
+
+def _create_temporary_engine(directory: str) -> db.engine.Engine:
+    """
+    Creates a database engine for an empty, temporary database (so benchmarks never touch the user's library)
+
+    Parameters
+    ----------
+    directory : str
+        The directory to create the database file in
+
+    Returns
+    -------
+    Engine
+        The database engine
+    """
+    bench_engine = db.create_engine(f"sqlite:///{os.path.join(directory, 'benchmark.db')}")
+    Base.metadata.create_all(bench_engine)
+    return bench_engine
+
+def similarity_rebuild(n_tracks: int=100_000, n_playlists: int=4_000, seed: int=0) -> None:
+    """
+    Times a full rebuild of the similar tracks on a synthetic library
+
+    Parameters
+    ----------
+    n_tracks : int
+        The number of tracks in the library
+    n_playlists : int
+        The number of playlists (sizes are log-normally distributed, plus one large "Liked Songs" playlist)
+    seed : int
+        The random seed of the synthetic library
+
+    Returns
+    -------
+    None
+    """
+    import numpy as np
+    from recommendation import SimilarityIndex
+
+    rng = np.random.default_rng(seed)
+    sizes = np.clip(rng.lognormal(3.0, 1.0, n_playlists).astype(int), 2, 2_000)
+    sizes[0] = min(10_000, n_tracks)
+    memberships = {
+        (playlist_id + 1, track_id + 1)
+        for playlist_id, size in enumerate(sizes)
+        for track_id in rng.choice(n_tracks, size, replace=False).tolist()
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_engine = _create_temporary_engine(directory)
+        with bench_engine.begin() as connection:
+            connection.exec_driver_sql("INSERT INTO playlist_track (playlist_id, track_id) VALUES (?, ?)", list(memberships))
+
+        index = SimilarityIndex(bind=bench_engine)
+        start = time.perf_counter()
+        rows = index.rebuild()
+        elapsed = time.perf_counter() - start
+        print(f"Similarity rebuild: {n_tracks} tracks, {len(memberships)} memberships, {rows} rows in {elapsed:.2f}s")
+
+        n_lookups = 1000
+        with bench_engine.connect() as connection:
+            start = time.perf_counter()
+            for track_id in range(1, n_lookups + 1):
+                connection.execute(
+                    db.text("SELECT similar_track_id FROM track_similarity WHERE track_id = :id ORDER BY rank LIMIT 10"),
+                    {"id": track_id},
+                ).fetchall()
+            elapsed = time.perf_counter() - start
+            print(f"Similar track lookup: {elapsed * 1000.0 / n_lookups:.3f}ms average")
+        bench_engine.dispose()
+
+def backup_writer_latency(n_tracks: int=200_000, pages_per_step: int=64) -> None:
+    """
+    Times an online backup of a synthetic library while another thread keeps writing to it,
+    and compares the writer's latency with the time each backup step holds the lock
+
+    Parameters
+    ----------
+    n_tracks : int
+        The number of tracks in the library
+    pages_per_step : int
+        The number of pages copied per backup step
+
+    Returns
+    -------
+    None
+    """
+    import threading
+    from backup import DatabaseBackup
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_engine = _create_temporary_engine(directory)
+        with bench_engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO track (title, artist, album, duration, liked) VALUES (?, ?, ?, ?, 0)",
+                [(f"Track {i}", f"Artist {i % 500}", f"Album {i % 2000}", 180) for i in range(n_tracks)],
+            )
+
+        write_times = []
+        backup_done = threading.Event()
+
+        def writer() -> None:
+            with bench_engine.connect() as connection:
+                while not backup_done.is_set():
+                    start = time.perf_counter()
+                    with connection.begin():
+                        connection.exec_driver_sql("UPDATE track SET duration = duration + 1 WHERE id = 1")
+                    write_times.append(time.perf_counter() - start)
+                    time.sleep(0.1)
+
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        database_backup = DatabaseBackup(os.path.join(directory, "benchmark.db"), pages_per_step=pages_per_step)
+        database_backup.backup(os.path.join(directory, "backup.db"))
+        backup_done.set()
+        writer_thread.join()
+
+        print(f"Backup: {database_backup.stats}")
+        print(f"Writer: {len(write_times)} writes during the backup, "
+            f"{max(write_times, default=0.0) * 1000.0:.2f}ms slowest, {sum(write_times) / max(len(write_times), 1) * 1000.0:.2f}ms average")
+        bench_engine.dispose()
+
+def bulk_playlist_operations(n_tracks: int=10_000, n_loop_tracks: int=500) -> None:
+    """
+    Times the set-based playlist operations on 10k-track playlists against adding tracks one at a time
+
+    Parameters
+    ----------
+    n_tracks : int
+        The number of tracks in each playlist
+    n_loop_tracks : int
+        The number of tracks to add one at a time (the per-track time is extrapolated to n_tracks)
+
+    Returns
+    -------
+    None
+    """
+    from database import PlaylistManager, Track
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_engine = _create_temporary_engine(directory)
+        manager = PlaylistManager(bind=bench_engine)
+
+        # Two playlists that share half of their tracks
+        source, target = manager.get_or_create_playlist("Source"), manager.get_or_create_playlist("Target")
+        with bench_engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO track (id, title, artist, album, duration, liked) VALUES (?, ?, 'Artist', 'Album', 180, 0)",
+                [(i, f"Track {i}") for i in range(1, n_tracks * 2)],
+            )
+            connection.exec_driver_sql(
+                "INSERT INTO playlist_track (playlist_id, track_id) VALUES (?, ?)",
+                [(source.id, i) for i in range(1, n_tracks + 1)] + [(target.id, i) for i in range(n_tracks // 2, n_tracks // 2 + n_tracks)],
+            )
+        manager.session.expire_all()
+
+        def timed(description: str, function: Callable) -> Any:
+            start = time.perf_counter()
+            result = function()
+            print(f"{description}: {(time.perf_counter() - start) * 1000.0:.1f}ms ({result})")
+            return result
+
+        loop_playlist = manager.get_or_create_playlist("Loop")
+        tracks = manager.session.query(Track).limit(n_loop_tracks).all()
+        start = time.perf_counter()
+        for track in tracks:
+            manager.add_track_to_playlist(track, loop_playlist)
+        per_track = (time.perf_counter() - start) / n_loop_tracks
+        print(f"add_track_to_playlist loop: {per_track * 1000.0:.2f}ms per track, ~{per_track * n_tracks:.1f}s for {n_tracks} tracks")
+
+        timed("merge_playlists", lambda: manager.merge_playlists(source, target))
+        copy = timed("duplicate_playlist", lambda: manager.duplicate_playlist(target))
+        timed("subtract_playlist", lambda: manager.subtract_playlist(copy, source))
+        selection = manager.session.query(Track).limit(n_tracks).all()
+        timed("like_tracks", lambda: manager.like_tracks(selection))
+        timed("unlike_tracks", lambda: manager.unlike_tracks(selection))
+        manager.close_session()
+        bench_engine.dispose()
+
+def vlc_probe_latency(n_streams: int=50) -> None:
+    """
+    Times probing streams with VLC using a new libVLC instance per probe (the previous approach)
+    against the shared instance and player pool. Reports the instance startup time and the time until
+    each stream is playing. Uses the downloaded tracks as the streams
+
+    Parameters
+    ----------
+    n_streams : int
+        The number of streams to probe
+
+    Returns
+    -------
+    None
+    """
+    import vlc
+    import vlc_pool
+    from stream import StreamUtility
+
+    track_dir = os.path.abspath(os.path.join("data", "tracks"))
+    tracks = [os.path.join(track_dir, name) for name in sorted(os.listdir(track_dir))]
+    streams = [tracks[i % len(tracks)] for i in range(n_streams)]
+
+    def report(name: str, total: float, startup: str, latencies: list[float]) -> None:
+        latencies = sorted(latencies)
+        print(f"{name}: {total:.2f}s total, {startup}, "
+            f"{latencies[len(latencies) // 2]:.1f}ms median and {latencies[int(len(latencies) * 0.95)]:.1f}ms p95 time to playing")
+
+    startup = 0.0
+    latencies = []
+    start = time.perf_counter()
+    for stream_url in streams:
+        instance_start = time.perf_counter()
+        instance = vlc.Instance()
+        startup += time.perf_counter() - instance_start
+        player = instance.media_player_new()
+        player.audio_set_mute(True)
+        player.set_media(instance.media_new(stream_url))
+        latencies.append(StreamUtility.play_until_ready(player)[1])
+        player.stop()
+        player.release()
+        instance.release()
+    report("New instance per probe", time.perf_counter() - start, f"{startup * 1000.0 / n_streams:.1f}ms instance startup per probe", latencies)
+
+    latencies = []
+    start = time.perf_counter()
+    vlc_pool.get_instance()
+    startup = time.perf_counter() - start
+    for stream_url in streams:
+        with vlc_pool.player_pool.checkout() as player:
+            player.set_media(vlc_pool.get_instance().media_new(stream_url))
+            latencies.append(StreamUtility.play_until_ready(player)[1])
+    report("Shared instance and player pool", time.perf_counter() - start, f"{startup * 1000.0:.1f}ms instance startup once", latencies)
+
+def duration_probe_corpus(directory: str=os.path.join("data", "tracks")) -> None:
+    """
+    Times reading the durations of a local file corpus from the container headers
+    against playing each file in VLC, and compares the results
+
+    Parameters
+    ----------
+    directory : str
+        The folder of audio files
+
+    Returns
+    -------
+    None
+    """
+    from duration import get_duration
+    import vlc_pool
+    from vlc_pool import player_pool
+    from stream import StreamUtility
+
+    files = [os.path.abspath(os.path.join(directory, name)) for name in sorted(os.listdir(directory))]
+    header_time, vlc_time = 0.0, 0.0
+    for path in files:
+        start = time.perf_counter()
+        header_duration = get_duration(path)
+        header_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with player_pool.checkout() as player:
+            player.set_media(vlc_pool.get_instance().media_new(path))
+            StreamUtility.play_until_ready(player)
+            vlc_duration = max(player.get_length(), 0) / 1000.0
+        vlc_time += time.perf_counter() - start
+        print(f"{os.path.basename(path)}: headers {header_duration}s, VLC {vlc_duration}s")
+
+    print(f"Headers: {header_time * 1000.0 / len(files):.2f}ms per file, VLC: {vlc_time * 1000.0 / len(files):.2f}ms per file")
+
+def _find_streams_multi_pass(page: str) -> list[str]:
+    """
+    The previous stream search, which scans the page once per search term
+    """
+    import re
+    from stream_scanner import SUPPORTED_EXTENSIONS
+
+    streams = []
+    terms = [f"{term}\":\"(.*?)\"" for term in ("stream", "file", "@id", "fileURL", "streamURL", "mediaURL", "associatedMedia")]
+    terms += [r"assetUrl\\\":\\\"(.*?)\"", r"jsdata=\"Kwyn5e;(.*?);", r"url\":\"(.*?)\"", r"src=\"(.*?)\"", r"href=\"(.*?)\""]
+    for term in terms:
+        if streams:
+            return streams
+        streams = re.findall(term, page)
+        streams[:] = [stream for stream in streams if any(extension in stream for extension in SUPPORTED_EXTENSIONS)]
+    return streams
+
+def stream_scanner_pages(directory: str="", n_repeats: int=20) -> None:
+    """
+    Times finding the stream urls in saved web pages with the single-pass scanner against the previous multi-pass search.
+    If no directory is specified, uses a large synthetic podcast page (where only the last search term finds streams)
+
+    Parameters
+    ----------
+    directory : str, optional
+        The folder of saved web pages (.html)
+    n_repeats : int
+        The number of times each page is scanned
+
+    Returns
+    -------
+    None
+    """
+    from stream_scanner import find_streams
+
+    if directory:
+        pages = []
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+    else:
+        episodes = "".join(f'<div class="episode"><a href="/episodes/{i}">Episode {i}</a><img src="/covers/{i}.jpg">'
+            f'<script>{{"name":"Episode {i}","image":"/covers/{i}.jpg","description":"{"x" * 400}"}}</script>'
+            f'<a href="https://cdn.example.com/{i}.mp3">Download</a></div>' for i in range(5_000))
+        pages = [f"<html><head><title>Podcast</title></head><body>{episodes}</body></html>"]
+    print(f"{len(pages)} pages, {sum(len(page) for page in pages) / 1e6:.1f}M characters")
+
+    for name, function in (("Multi-pass", _find_streams_multi_pass), ("Single-pass", find_streams)):
+        start = time.perf_counter()
+        for _ in range(n_repeats):
+            n_streams = sum(len(function(page)) for page in pages)
+        print(f"{name}: {(time.perf_counter() - start) * 1000.0 / n_repeats:.1f}ms per scan, {n_streams} streams")
+
+def _serve_thumbnails(n_thumbnails: int, size: int) -> Any:
+    """
+    Starts a local keep-alive HTTP server on a background thread that serves random thumbnail-sized files
+    at /thumbnails/<index>.jpg, and returns the server
+    """
+    import http.server
+    import threading
+
+    thumbnails = [os.urandom(size) for _ in range(n_thumbnails)]
+
+    class ThumbnailHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Send the body without waiting for the headers to be acknowledged, like production servers
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            index = int(self.path.rsplit("/", 1)[-1].split(".")[0])
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(thumbnails[index])))
+            self.end_headers()
+            self.wfile.write(thumbnails[index])
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ThumbnailHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def http_thumbnails(n_thumbnails: int=100, size: int=30_000) -> None:
+    """
+    Times fetching cover art thumbnails from a local server with a new connection per request (the previous approach)
+    against the shared HTTP client's pooled keep-alive connections
+
+    Parameters
+    ----------
+    n_thumbnails : int
+        The number of thumbnails to fetch
+    size : int
+        The size of each thumbnail in bytes
+
+    Returns
+    -------
+    None
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import requests
+    from http_client import HttpClient
+
+    server = _serve_thumbnails(n_thumbnails, size)
+    urls = [f"http://127.0.0.1:{server.server_address[1]}/thumbnails/{i}.jpg" for i in range(n_thumbnails)]
+    client = HttpClient()
+    timings = []
+    client.add_timing_hook(timings.append)
+
+    try:
+        start = time.perf_counter()
+        for url in urls:
+            requests.get(url).content
+        print(f"New connection per request: {(time.perf_counter() - start) * 1000.0:.1f}ms")
+
+        start = time.perf_counter()
+        for url in urls:
+            client.get(url).content
+        print(f"Pooled connections: {(time.perf_counter() - start) * 1000.0:.1f}ms")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda url: client.get(url).content, urls))
+        print(f"Pooled connections, 8 threads: {(time.perf_counter() - start) * 1000.0:.1f}ms")
+
+        elapsed = sorted(timing.elapsed for timing in timings)
+        print(f"Time to response headers: {elapsed[len(elapsed) // 2]:.2f}ms median, {elapsed[-1]:.2f}ms max")
+    finally:
+        client.close()
+        server.shutdown()
+
+def _serve_hls(n_segments: int, segment_size: int, latency: float) -> Any:
+    """
+    Starts a local HLS fixture server on a background thread that serves a media playlist at /index.m3u8
+    and its segments at /segment<index>.ts, delaying each segment response to simulate network latency
+    """
+    import http.server
+    import threading
+
+    segment = os.urandom(segment_size)
+    playlist = "#EXTM3U\n#EXT-X-TARGETDURATION:6\n" + "".join(f"#EXTINF:6.0,\nsegment{i}.ts\n" for i in range(n_segments)) + "#EXT-X-ENDLIST\n"
+
+    class HlsHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            if self.path.endswith(".m3u8"):
+                body = playlist.encode()
+            else:
+                time.sleep(latency)
+                body = segment
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), HlsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def hls_download(n_segments: int=60, segment_size: int=100_000, latency: float=0.05) -> None:
+    """
+    Times downloading an HLS stream from a local fixture server with sequential and parallel segment fetching
+
+    Parameters
+    ----------
+    n_segments : int
+        The number of segments in the playlist
+    segment_size : int
+        The size of each segment in bytes
+    latency : float
+        The simulated latency of each segment request in seconds
+
+    Returns
+    -------
+    None
+    """
+    from hls import download_hls
+
+    server = _serve_hls(n_segments, segment_size, latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}/index.m3u8"
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for max_workers in (1, 2, 4, 8):
+                start = time.perf_counter()
+                file_path = download_hls(url, os.path.join(directory, f"download-{max_workers}.mp3"), max_workers)
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(file_path)
+                print(f"{max_workers} workers: {elapsed * 1000.0:.0f}ms, {size / elapsed / 1e6:.1f}MB/s")
+    finally:
+        server.shutdown()
+
+def import_pipeline(n_urls: int=200, latency: float=0.05) -> None:
+    """
+    Times importing urls into a playlist with different numbers of workers,
+    using a resolver that simulates the network latency of resolving each url
+
+    Parameters
+    ----------
+    n_urls : int
+        The number of urls to import
+    latency : float
+        The simulated time in seconds to resolve each url
+
+    Returns
+    -------
+    None
+    """
+    from types import SimpleNamespace
+    from importer import TrackImporter
+
+    def resolve(url: str) -> SimpleNamespace:
+        time.sleep(latency)
+        return SimpleNamespace(url=url, title=url, artist="Artist", album="Album", duration=180,
+            default_stream=url, youtube_streams=None, genres=[])
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_engine = _create_temporary_engine(directory)
+        for max_workers in (1, 2, 4, 8, 16):
+            urls = [f"https://example.com/{max_workers}/{i}" for i in range(n_urls)]
+            importer = TrackImporter(f"Import {max_workers}", max_workers=max_workers, resolver=resolve, bind=bench_engine)
+            start = time.perf_counter()
+            results = importer.run(urls)
+            elapsed = time.perf_counter() - start
+            print(f"{max_workers} workers: {n_urls / elapsed:.1f} urls/s, {sum(result.succeeded for result in results)} imported")
+        bench_engine.dispose()
+
+
+def _serve_page(page: bytes) -> Any:
+    """
+    Starts a local HTTP server on a background thread that serves a single page at every path, and returns the server
+    """
+    import http.server
+    import threading
+
+    class PageHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            try:
+                self.wfile.write(page)
+            except ConnectionError:
+                # The client stopped reading after the title
+                pass
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def page_titles(page_size: int=5_000_000, n_repeats: int=3) -> None:
+    """
+    Times getting the title of a large station page by parsing the whole page with BeautifulSoup (the previous approach)
+    against the streaming title extractor, both from a page in memory and fetched from a local server
+
+    Parameters
+    ----------
+    page_size : int
+        The approximate size of the page in bytes
+    n_repeats : int
+        The number of times the title is extracted
+
+    Returns
+    -------
+    None
+    """
+    import gc
+    import tracemalloc
+    from bs4 import BeautifulSoup
+    from http_client import http_client
+    from page_title import extract_title, fetch_title
+
+    row = '<div class="station"><a href="/stations/{0}">Station {0}</a><img src="/logos/{0}.png"><p>{1}</p></div>'
+    rows = "".join(row.format(i, "x" * 200) for i in range(page_size // 280))
+    page = (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>\n  Radio Stations | Example FM\n</title>"
+        f"<link rel='stylesheet' href='/style.css'></head><body>{rows}</body></html>")
+    server = _serve_page(page.encode("utf-8"))
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    print(f"Page size: {len(page) / 1e6:.1f}MB")
+
+    def parse_whole_page() -> str:
+        return BeautifulSoup(page, features="html.parser").title.text
+
+    def fetch_whole_page() -> str:
+        return BeautifulSoup(http_client.get(url).text, features="html.parser").title.text
+
+    for name, function in (("BeautifulSoup (in memory)", parse_whole_page), ("Streaming (in memory)", lambda: extract_title(page)),
+        ("BeautifulSoup (fetched)", fetch_whole_page), ("Streaming (fetched)", lambda: fetch_title(url))):
+        # Free the previous parse trees first, so their collection isn't timed
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(n_repeats):
+            title = function()
+        elapsed = (time.perf_counter() - start) * 1000.0 / n_repeats
+        # Memory is traced separately, since tracing slows down allocations
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name}: {elapsed:.1f}ms per title, {peak / 1e6:.1f}MB peak memory ({' '.join(title.split())!r})")
+    server.shutdown()
+
+def charset_resolution(page_size: int=2_000_000, n_repeats: int=3) -> None:
+    """
+    Times resolving the encoding of large pages with charset detection over the whole page (requests' apparent_encoding,
+    the previous approach) against the header, BOM and <meta charset> checks with detection on a bounded prefix
+
+    Parameters
+    ----------
+    page_size : int
+        The approximate size of each page in bytes
+    n_repeats : int
+        The number of times each encoding is resolved
+
+    Returns
+    -------
+    None
+    """
+    from requests.compat import chardet
+    from charset import charset_stats, resolve_encoding
+
+    def make_page(head: str, text: str, encoding: str) -> bytes:
+        rows = "".join(f'<div class="station"><a href="/stations/{i}">{text} {i}</a></div>' for i in range(page_size // 60))
+        return f"<!DOCTYPE html><html><head>{head}<title>{text}</title></head><body>{rows}</body></html>".encode(encoding)
+
+    pages = [
+        ("Content-Type charset", "text/html; charset=utf-8", make_page("", "Radio Café", "utf-8")),
+        ("<meta charset>", "text/html", make_page("<meta charset='windows-1252'>", "Radio Café", "cp1252")),
+        ("Undeclared UTF-8", "text/html", make_page("", "Радио станции", "utf-8")),
+        ("Undeclared Windows-1251", "text/html", make_page("", "Радио станции", "cp1251")),
+    ]
+    for name, content_type, page in pages:
+        start = time.perf_counter()
+        for _ in range(n_repeats):
+            apparent_encoding = chardet.detect(page)["encoding"]
+        full_time = (time.perf_counter() - start) * 1000.0 / n_repeats
+
+        start = time.perf_counter()
+        for _ in range(n_repeats):
+            encoding, source = resolve_encoding(content_type, page)
+        print(f"{name} ({len(page) / 1e6:.1f}MB): apparent_encoding {apparent_encoding} in {full_time:.1f}ms, "
+            f"resolved {encoding} from {source} in {(time.perf_counter() - start) * 1000.0 / n_repeats:.2f}ms")
+    print(charset_stats)
+
+def _serve_feeds(n_episodes: int) -> tuple[Any, dict[int, int]]:
+    """
+    Starts a local HTTP server on a background thread that serves RSS feeds at /feeds/<index>.xml with n_episodes
+    (plus the number of new episodes of the feed) episodes each, newest first, with ETags.
+    Returns the server and the dictionary of new episodes per feed index
+    """
+    import http.server
+    import threading
+
+    new_episodes = {}
+
+    def make_feed(index: int, count: int) -> bytes:
+        items = "".join(f"<item><title>Episode {number}</title><guid>feed-{index}-episode-{number}</guid>"
+            f"<enclosure url='https://cdn.example.com/{index}/{number}.mp3' type='audio/mpeg' length='1000'/>"
+            f"<itunes:duration>45:{number % 60:02d}</itunes:duration><pubDate>Mon, 02 Jan 2023 10:00:00 GMT</pubDate>"
+            f"<description>{'x' * 300}</description></item>" for number in range(count, 0, -1))
+        return (f"<?xml version='1.0' encoding='UTF-8'?><rss version='2.0' xmlns:itunes='http://www.itunes.com/dtds/podcast-1.0.dtd'>"
+            f"<channel><title>Podcast {index}</title><itunes:author>Host {index}</itunes:author>"
+            f"<itunes:image href='https://cdn.example.com/{index}.jpg'/>{items}</channel></rss>").encode("utf-8")
+
+    class FeedHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def handle(self) -> None:
+            try:
+                super().handle()
+            except ConnectionError:
+                # The client closed the connection after reading up to the first known episode
+                pass
+
+        def do_GET(self) -> None:
+            index = int(self.path.rsplit("/", 1)[-1].split(".")[0])
+            count = n_episodes + new_episodes.get(index, 0)
+            etag = f'"{index}-{count}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            feed = make_feed(index, count)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/rss+xml")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(feed)))
+            self.end_headers()
+            self.wfile.write(feed)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, new_episodes
+
+def podcast_sync(n_feeds: int=200, n_episodes: int=100, large_feed_episodes: int=20_000) -> None:
+    """
+    Times subscribing to podcast feeds from a local server, re-syncing them when they are unchanged (ETags)
+    and when a few have a new episode, and compares the peak memory of parsing a large feed incrementally
+    against parsing the whole document
+
+    Parameters
+    ----------
+    n_feeds : int
+        The number of subscribed feeds
+    n_episodes : int
+        The number of episodes per feed
+    large_feed_episodes : int
+        The number of episodes of the large feed
+
+    Returns
+    -------
+    None
+    """
+    import tracemalloc
+    from xml.etree import ElementTree
+    from http_client import http_client
+    from podcast import PodcastSync, _parse_episode, iter_episodes
+    from rate_limit import page_limiter
+
+    server, new_episodes = _serve_feeds(n_episodes)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/feeds"
+    # Every feed is on the same local host, so don't throttle it like a scraped website
+    page_limiter.rate, page_limiter.burst = 1e9, 10**9
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_engine = _create_temporary_engine(directory)
+        sync = PodcastSync(bench_engine)
+
+        start = time.perf_counter()
+        results = [sync.subscribe(f"{base_url}/{index}.xml") for index in range(n_feeds)]
+        print(f"Subscribe: {time.perf_counter() - start:.2f}s, {sum(result.new_episodes for result in results)} episodes")
+
+        start = time.perf_counter()
+        sync.sync_all()
+        print(f"Unchanged re-sync: {time.perf_counter() - start:.2f}s")
+
+        for index in range(0, n_feeds, 20):
+            new_episodes[index] = 1
+        start = time.perf_counter()
+        sync.sync_all()
+        print(f"Re-sync with {len(new_episodes)} new episodes: {time.perf_counter() - start:.2f}s")
+        bench_engine.dispose()
+
+    new_episodes[0] = large_feed_episodes - n_episodes
+    for name, parse in (("Whole document", lambda source: len([_parse_episode(item) for item in ElementTree.parse(source).iter("item")])),
+        ("Incremental", lambda source: sum(1 for _ in iter_episodes(source)))):
+        with http_client.get(f"{base_url}/0.xml", stream=True) as response:
+            start = time.perf_counter()
+            count = parse(response.raw)
+            elapsed = time.perf_counter() - start
+        # Memory is traced separately, since tracing slows down allocations
+        with http_client.get(f"{base_url}/0.xml", stream=True) as response:
+            tracemalloc.start()
+            parse(response.raw)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        print(f"{name} ({count} episodes): {elapsed:.2f}s, {peak / 1e6:.1f}MB peak memory")
+    server.shutdown()
+
+def _serve_stations(latency: float) -> Any:
+    """
+    Starts a local HTTP server on a background thread that serves short MP3 streams at /stations/<index>,
+    404s at /dead/<index> and web pages at /page/<index>, each after a simulated latency, and returns the server
+    """
+    import http.server
+    import threading
+
+    audio = b"ID3\x04\x00\x00\x00\x00\x00\x00" + os.urandom(4086)
+    page = b"<!DOCTYPE html><html><head><title>Station</title></head><body></body></html>"
+
+    class StationHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def handle(self) -> None:
+            try:
+                super().handle()
+            except ConnectionError:
+                pass
+
+        def do_GET(self) -> None:
+            time.sleep(latency)
+            kind = self.path.split("/")[1]
+            if kind == "dead":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body, content_type = (audio, "audio/mpeg") if kind == "stations" else (page, "text/html")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    class StationServer(http.server.ThreadingHTTPServer):
+        # Accept many concurrent probes without refusing connections
+        request_queue_size = 256
+
+    server = StationServer(("127.0.0.1", 0), StationHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def radio_import(n_stations: int=1_000, latency: float=0.05) -> None:
+    """
+    Times importing a station directory (with 10% duplicates, 5% dead streams and 5% web pages) from a local server
+    with different numbers of validation workers
+
+    Parameters
+    ----------
+    n_stations : int
+        The number of stations in the directory
+    latency : float
+        The simulated time in seconds until each stream responds
+
+    Returns
+    -------
+    None
+    """
+    import json
+    from radio_import import RadioImporter
+
+    server = _serve_stations(latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        for max_workers in (1, 8, 32, 64):
+            stations = []
+            for index in range(n_stations):
+                kind = "dead" if index % 20 == 1 else "page" if index % 20 == 2 else "stations"
+                # Every tenth station is a duplicate of the previous one, written differently
+                url = f"{base_url}/{kind}/{max_workers}-{index}" if index % 10 != 9 else f"{base_url.upper().replace('HTTP', 'http')}/{kind}/{max_workers}-{index - 1}/"
+                stations.append({"name": f"Station {index}", "url": url, "tags": "jazz,lounge" if index % 2 else "news"})
+            path = os.path.join(directory, f"stations-{max_workers}.json")
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(stations, file)
+
+            bench_engine = _create_temporary_engine(directory)
+            report = RadioImporter(max_workers=max_workers, bind=bench_engine).import_file(path)
+            print(f"{max_workers} workers: {report.stations_per_second:.1f} stations/s")
+            bench_engine.dispose()
+    server.shutdown()
+
+def _serve_discovery_page(page: bytes) -> Any:
+    """
+    Starts a local HTTP server on a background thread that serves a page at /etag/<index> (with an ETag)
+    and /plain/<index> (without validators), and returns the server
+    """
+    import http.server
+    import threading
+
+    etag = '"page-1"'
+
+    class DiscoveryHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            with_etag = self.path.startswith("/etag/")
+            if with_etag and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            if with_etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), DiscoveryHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def page_cache_discovery(n_pages: int=20, n_refreshes: int=3) -> None:
+    """
+    Times discovering the streams of large podcast pages from a local server without a cache (the previous approach),
+    on the first cached fetch, and on refreshes of pages that are revalidated with ETags (304) or served again unchanged
+
+    Parameters
+    ----------
+    n_pages : int
+        The number of pages
+    n_refreshes : int
+        The number of times each page is refreshed
+
+    Returns
+    -------
+    None
+    """
+    from http_client import http_client
+    from page_cache import PageCache, hash_page
+    from stream_scanner import find_streams
+
+    episodes = "".join(f'<div class="episode"><a href="/episodes/{i}">Episode {i}</a>'
+        f'<script>{{"name":"Episode {i}","description":"{"x" * 400}"}}</script>'
+        f'<a href="https://cdn.example.com/{i}.mp3">Download</a></div>' for i in range(2_000))
+    page = f"<html><head><title>Podcast</title></head><body>{episodes}</body></html>".encode("utf-8")
+    server = _serve_discovery_page(page)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Page size: {len(page) / 1e6:.1f}MB")
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = PageCache(directory)
+
+        def discover(url: str) -> int:
+            source = cache.fetch(url)
+            page_hash = hash_page(source)
+            streams = cache.get_streams(url, page_hash)
+            if streams is None:
+                streams = find_streams(source)
+                cache.put_streams(url, page_hash, streams)
+            return len(streams)
+
+        def discover_uncached(url: str) -> int:
+            return len(find_streams(http_client.get(url).text))
+
+        for name, function, kind, repeats in (("No cache", discover_uncached, "etag", 1), ("First fetch", discover, "etag", 1),
+            ("Refresh (304)", discover, "etag", n_refreshes), ("First fetch without validators", discover, "plain", 1),
+            ("Refresh without validators", discover, "plain", n_refreshes)):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                n_streams = sum(function(f"{base_url}/{kind}/{index}") for index in range(n_pages))
+            print(f"{name}: {(time.perf_counter() - start) * 1000.0 / (repeats * n_pages):.1f}ms per page, {n_streams // n_pages} streams")
+
+        # A cache that only fits half of the pages evicts the least recently used ones
+        small_cache = PageCache(os.path.join(directory, "small"), max_bytes=len(page) * n_pages // 2)
+        for index in range(n_pages):
+            small_cache.fetch(f"{base_url}/etag/{index}")
+        print(f"Bounded cache: {small_cache}")
+    server.shutdown()
+
+def _serve_resolution_pages(latency: float) -> Any:
+    """
+    Starts a local HTTP server on a background thread that serves web pages at /page/<name> linking to
+    a short WAV file at /audio/<name>.wav, each after a simulated latency, and returns the server
+    """
+    import http.server
+    import struct
+    import threading
+
+    # One second of 8 kHz, 8-bit mono audio
+    samples = bytes(8_000)
+    audio = (b"RIFF" + struct.pack("<I", 36 + len(samples)) + b"WAVEfmt " + struct.pack("<IHHIIHH", 16, 1, 1, 8_000, 8_000, 1, 8)
+        + b"data" + struct.pack("<I", len(samples)) + samples)
+    filler = "".join(f'<div class="show"><a href="/shows/{i}">Show {i}</a><p>{"x" * 200}</p></div>' for i in range(200))
+
+    class ResolutionHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def handle(self) -> None:
+            try:
+                super().handle()
+            except ConnectionError:
+                pass
+
+        def do_GET(self) -> None:
+            time.sleep(latency)
+            name = self.path.split("/", 2)[-1]
+            if self.path.startswith("/audio/"):
+                body, content_type = audio, "audio/wav"
+            else:
+                base_url = f"http://{self.headers.get('Host')}"
+                body = (f"<html><head><title>Station | {name}</title></head><body>{filler}"
+                    f'<audio src="{base_url}/audio/{name}.wav"></audio></body></html>').encode("utf-8")
+                content_type = "text/html; charset=utf-8"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    class ResolutionServer(http.server.ThreadingHTTPServer):
+        # Accept many concurrent requests without refusing connections
+        request_queue_size = 256
+
+    server = ResolutionServer(("127.0.0.1", 0), ResolutionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def async_stream_resolution(n_urls: int=200, latency: float=0.05) -> None:
+    """
+    Times resolving website urls into stream data (page, streams, title and duration) from a local server,
+    one at a time with StreamData(url) and concurrently on one event loop with StreamData.create(url)
+
+    Parameters
+    ----------
+    n_urls : int
+        The number of urls to resolve
+    latency : float
+        The simulated time in seconds until each page and stream responds
+
+    Returns
+    -------
+    None
+    """
+    import asyncio
+    import gc
+    from page_cache import PageCache
+    from rate_limit import page_limiter
+    import stream
+    from stream import StreamData
+
+    server = _serve_resolution_pages(latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    # Every page is on the same host, so the per-host rate limit would dominate the timings
+    page_limiter.rate, page_limiter.burst = 1e9, 10**9
+
+    async def resolve_all(urls: list[str]) -> list[StreamData]:
+        return await asyncio.gather(*(StreamData.create(url) for url in urls))
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Resolve fresh pages, without the app's page cache
+        stream.page_cache = PageCache(directory)
+        for name, resolve in (("Sequential", lambda urls: [StreamData(url) for url in urls]),
+            ("Concurrent (asyncio)", lambda urls: asyncio.run(resolve_all(urls)))):
+            urls = [f"{base_url}/page/{name.split()[0].lower()}-{i}" for i in range(n_urls)]
+            gc.collect()
+            start = time.perf_counter()
+            results = resolve(urls)
+            elapsed = time.perf_counter() - start
+            resolved = sum(1 for data in results if data.default_stream and data.duration == 1)
+            print(f"{name}: {n_urls / elapsed:.1f} urls/s ({elapsed:.2f}s), {resolved} of {n_urls} resolved, e.g. {results[0].title!r}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    for name in sys.argv[1:]:
+        globals()[name]()
@@ -0,0 +1,154 @@
+"""
+Resolves the character encoding of downloaded web pages without running charset detection over the whole page.
+
+The encoding is taken from (in order) a byte order mark, the charset of the Content-Type header, or a <meta charset>
+in the first few KB of the page. Without any of them, pages that decode as UTF-8 are UTF-8, and only then is
+statistical detection run, on a bounded prefix of the page. The timing stats count which of these paths was taken.
+"""
+
+import codecs
+import re
+import threading
+import time
+from typing import Optional
+
+from requests.compat import chardet
+
+# The number of bytes searched for a <meta charset> (the HTML spec requires it in the first 1024 bytes, but many pages are late)
+META_SCAN_BYTES = 4096
+# The maximum number of bytes given to statistical detection
+DETECT_BYTES = 16384
+
+BOMS = [(codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be")]
+
+_HEADER_CHARSET_REGEX = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.IGNORECASE)
+# Matches both <meta charset="..."> and <meta http-equiv="Content-Type" content="text/html; charset=...">
+_META_CHARSET_REGEX = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+
+
+class CharsetStats:
+    """
+    Counts how page encodings were resolved and the time spent resolving them
+    """
+
+    SOURCES = ("bom", "header", "meta", "utf-8", "detected", "default")
+
+    def __init__(self) -> None:
+        self.counts = {source: 0 for source in CharsetStats.SOURCES}
+        self.times = {source: 0.0 for source in CharsetStats.SOURCES}
+        self._lock = threading.Lock()
+
+    def record(self, source: str, elapsed: float) -> None:
+        """
+        Records a resolved encoding
+
+        Parameters
+        ----------
+        source : str
+            How the encoding was resolved (one of CharsetStats.SOURCES)
+        elapsed : float
+            The time in milliseconds it took
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self.counts[source] += 1
+            self.times[source] += elapsed
+
+    def __str__(self) -> str:
+        return ", ".join(f"{source}: {self.counts[source]} ({self.times[source] / self.counts[source]:.2f}ms average)"
+            for source in CharsetStats.SOURCES if self.counts[source]) or "No pages"
+
+
+charset_stats = CharsetStats()
+
+
+def _lookup(encoding: Optional[str]) -> Optional[str]:
+    """
+    Returns the normalized name of an encoding, or None if Python doesn't support it
+    """
+    if not encoding:
+        return None
+    try:
+        return codecs.lookup(encoding.strip()).name
+    except LookupError:
+        return None
+
+def _is_utf8(data: bytes) -> bool:
+    """
+    Returns whether a prefix of a page is valid UTF-8 (allowing a character cut off at the end)
+    """
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(data, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def resolve_encoding(content_type: str, body: bytes, detect_bytes: int=DETECT_BYTES) -> tuple[str, str]:
+    """
+    Resolves the character encoding of a page from its BOM, Content-Type header or <meta charset>,
+    falling back to statistical detection on a bounded prefix
+
+    Parameters
+    ----------
+    content_type : str
+        The Content-Type header value
+    body : bytes
+        The page (or at least its first few KB)
+    detect_bytes : int
+        The maximum number of bytes given to statistical detection
+
+    Returns
+    -------
+    str
+        The encoding
+    str
+        How the encoding was resolved ("bom", "header", "meta", "utf-8", "detected" or "default")
+    """
+    start = time.perf_counter()
+    encoding, source = _resolve(content_type, body, detect_bytes)
+    charset_stats.record(source, (time.perf_counter() - start) * 1000.0)
+    return encoding, source
+
+def _resolve(content_type: str, body: bytes, detect_bytes: int) -> tuple[str, str]:
+    """
+    Resolves the encoding of a page (see resolve_encoding)
+    """
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return encoding, "bom"
+
+    match = _HEADER_CHARSET_REGEX.search(content_type or "")
+    encoding = _lookup(match.group(1)) if match else None
+    if encoding:
+        return encoding, "header"
+
+    match = _META_CHARSET_REGEX.search(body[:META_SCAN_BYTES])
+    encoding = _lookup(match.group(1).decode("ascii", errors="ignore")) if match else None
+    # A page can't declare itself UTF-16 in ASCII, so the declaration is wrong (the HTML spec uses UTF-8 instead)
+    if encoding and encoding.startswith("utf-16"):
+        encoding = "utf-8"
+    if encoding:
+        return encoding, "meta"
+
+    prefix = body[:detect_bytes]
+    if _is_utf8(prefix):
+        return "utf-8", "utf-8"
+
+    encoding = _lookup(chardet.detect(prefix).get("encoding")) if chardet else None
+    if encoding:
+        return encoding, "detected"
+    return "utf-8", "default"
+
+
+def test():
+    print(resolve_encoding("text/html; charset=ISO-8859-1", b"<html>"))
+    print(resolve_encoding("text/html", b"<html><head><meta charset='windows-1252'>"))
+    print(resolve_encoding("text/html", "<html><head><title>Café</title>".encode("utf-8")))
+    print(resolve_encoding("text/html", "<html><head><title>Радио станции</title>".encode("cp1251") * 20))
+    print(charset_stats)
+
+if __name__ == "__main__":
+    test()
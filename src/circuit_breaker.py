@@ -0,0 +1,250 @@
+"""
+Per-host circuit breakers, so requests to a host that keeps failing fail fast instead of each waiting for the full
+connection time out (e.g. a batch import of many stations on the same dead server).
+
+A breaker starts closed. After failure_threshold consecutive failures (connection errors, time outs and server errors)
+it opens, and requests to the host fail immediately with CircuitOpenError. After the cool down period it is half open:
+a single trial request is let through, which closes the breaker if it succeeds or opens it again if it fails.
+"""
+
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of sending a request to a host whose circuit breaker is open.
+    It is a ConnectionError, so it is handled wherever connection failures are
+    """
+
+    def __init__(self, host: str, retry_after: float) -> None:
+        """
+        Parameters
+        ----------
+        host : str
+            The host that is failing
+        retry_after : float
+            The time in seconds until a trial request is allowed
+
+        Returns
+        -------
+        None
+        """
+        super().__init__(f"{host} is failing; skipping requests for {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    The circuit breaker of a single host
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half open"
+
+    def __init__(self, host: str, failure_threshold: int=3, cool_down: float=30.0) -> None:
+        """
+        Parameters
+        ----------
+        host : str
+            The host
+        failure_threshold : int
+            The number of consecutive failures that open the breaker
+        cool_down : float
+            The time in seconds the breaker stays open before a trial request is allowed
+
+        Returns
+        -------
+        None
+        """
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        # The number of requests that failed fast while the breaker was open
+        self.rejected = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """
+        Checks whether a request can be sent to the host
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        CircuitOpenError
+            If the breaker is open, or half open with a trial request already in progress
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+            remaining = self.opened_at + self.cool_down - time.monotonic()
+            if remaining <= 0 and not self._trial_in_progress:
+                # Let a single trial request through
+                self.state = CircuitBreaker.HALF_OPEN
+                self._trial_in_progress = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.host, max(remaining, 0.0))
+
+    def record_success(self) -> None:
+        """
+        Closes the breaker after a successful request
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if self.state != CircuitBreaker.CLOSED:
+                print(f"Circuit breaker closed: {self.host} is responding again")
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        """
+        Counts a failed request, opening the breaker when the threshold is reached or the trial request failed
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state == CircuitBreaker.CLOSED:
+                    print(f"Circuit breaker opened: {self.host} failed {self.failures} times in a row")
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """
+        Ends a request whose outcome says nothing about the host (e.g. an invalid url), allowing another trial request
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._trial_in_progress = False
+
+    def __str__(self) -> str:
+        return f"{self.host}: {self.state} ({self.failures} consecutive failures, {self.rejected} requests rejected)"
+
+
+class CircuitBreakers:
+    """
+    A thread-safe collection of circuit breakers, one per host
+    """
+
+    def __init__(self, failure_threshold: int=3, cool_down: float=30.0) -> None:
+        """
+        Parameters
+        ----------
+        failure_threshold : int
+            The number of consecutive failures that open a host's breaker
+        cool_down : float
+            The time in seconds a host's breaker stays open before a trial request is allowed
+
+        Returns
+        -------
+        None
+        """
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> CircuitBreaker:
+        """
+        Returns the circuit breaker of the host of a url
+
+        Parameters
+        ----------
+        url : str
+            The requested url
+
+        Returns
+        -------
+        CircuitBreaker
+            The breaker of the host (and port)
+        """
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.cool_down)
+            return breaker
+
+    def get_state(self, url: str) -> Optional[str]:
+        """
+        Returns the state of the breaker of the host of a url, without creating one
+
+        Parameters
+        ----------
+        url : str
+            The url
+
+        Returns
+        -------
+        str, optional
+            CircuitBreaker.CLOSED, CircuitBreaker.OPEN or CircuitBreaker.HALF_OPEN, or None if the host wasn't requested
+        """
+        with self._lock:
+            breaker = self._breakers.get(urlsplit(url).netloc.lower())
+        return breaker.state if breaker else None
+
+    def reset(self) -> None:
+        """
+        Forgets the state of all of the hosts
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._breakers.clear()
+
+    @property
+    def open_hosts(self) -> list[str]:
+        """
+        The hosts whose breakers are open or half open
+        """
+        with self._lock:
+            return [host for host, breaker in self._breakers.items() if breaker.state != CircuitBreaker.CLOSED]
+
+
+# Shared by all of the HTTP clients
+circuit_breakers = CircuitBreakers()
+
+
+def test():
+    breaker = CircuitBreaker("example.com", failure_threshold=2, cool_down=0.5)
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure()
+    try:
+        breaker.before_request()
+    except CircuitOpenError as e:
+        print(f"Failed fast: {e}")
+    time.sleep(0.5)
+    breaker.before_request()
+    breaker.record_success()
+    print(breaker)
+
+if __name__ == "__main__":
+    test()
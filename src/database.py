@@ -3,13 +3,15 @@
 from datetime import datetime
 import os
 import time
-from typing import Optional
+from typing import Any, Optional
 
 import sqlalchemy as db
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, DateTime, Boolean, Index, Float
 from sqlalchemy.orm import relationship, backref, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+import migrations
+
 # Database file path
 FILE_PATH = os.path.abspath(os.path.join("data", "appdata.db"))
 
@@ -23,6 +25,86 @@ playlist_track = Table(
     Base.metadata,
     Column("playlist_id", Integer, ForeignKey("playlist.id")),
     Column("track_id", Integer, ForeignKey("track.id")),
+    # Covering indexes for membership lookups in both directions
+    Index("ix_playlist_track_playlist_id_track_id", "playlist_id", "track_id"),
+    Index("ix_playlist_track_track_id_playlist_id", "track_id", "playlist_id"),
+)
+
+# A table to store track-tag relationships (many-to-many)
+# The primary key covers (track_id, tag_id) and the extra index covers (tag_id, track_id),
+# so facet counts are answered from the indexes alone without reading the table
+track_tag = Table(
+    "track_tag",
+    Base.metadata,
+    Column("track_id", Integer, ForeignKey("track.id"), primary_key=True),
+    Column("tag_id", Integer, ForeignKey("tag.id"), primary_key=True),
+    Index("ix_track_tag_tag_id_track_id", "tag_id", "track_id"),
+)
+
+# A table to store the most similar tracks of each track (computed by recommendation.SimilarityIndex)
+# The primary key (track_id, rank) serves the "more like this" lookup
+track_similarity = Table(
+    "track_similarity",
+    Base.metadata,
+    Column("track_id", Integer, primary_key=True),
+    Column("rank", Integer, primary_key=True),
+    Column("similar_track_id", Integer, nullable=False),
+    Column("score", Float, nullable=False),
+)
+
+# A table to store the tracks whose similar tracks are out of date after a playlist membership change
+track_similarity_stale = Table(
+    "track_similarity_stale",
+    Base.metadata,
+    Column("track_id", Integer, primary_key=True),
+)
+
+# A table to store the latest health check of each saved radio station stream (see station_monitor.StationMonitor)
+station_health = Table(
+    "station_health",
+    Base.metadata,
+    Column("stream_id", Integer, ForeignKey("stream.id"), primary_key=True),
+    Column("url", String, nullable=False),
+    # The best entry of station playlists
+    Column("resolved_url", String),
+    Column("healthy", Boolean, nullable=False),
+    Column("status_code", Integer),
+    # Milliseconds from sending the request to the first byte of audio
+    Column("time_to_first_byte", Float),
+    # The bitrate in kbps advertised by the server (icy-br)
+    Column("bitrate", Integer),
+    Column("content_type", String),
+    Column("error", String),
+    Column("checked_at", DateTime, nullable=False),
+    Column("last_healthy_at", DateTime),
+    Column("consecutive_failures", Integer, nullable=False, default=0),
+)
+
+# A table to store the podcast feed subscriptions (see podcast.PodcastSync)
+podcast_feed = Table(
+    "podcast_feed",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("url", String, nullable=False, unique=True),
+    Column("title", String),
+    # The playlist the episodes are added to
+    Column("playlist_id", Integer, ForeignKey("playlist.id")),
+    # The validators of the last response, sent back so unchanged feeds aren't downloaded again
+    Column("etag", String),
+    Column("last_modified", String),
+    Column("checked_at", DateTime),
+    # When a sync last read the whole feed (until then, every episode is checked instead of stopping at the first stored one)
+    Column("synced_at", DateTime),
+)
+
+# A table to store the episodes of each podcast feed, keyed by the feed's episode guid, and their tracks
+podcast_episode = Table(
+    "podcast_episode",
+    Base.metadata,
+    Column("feed_id", Integer, ForeignKey("podcast_feed.id"), primary_key=True),
+    Column("guid", String, primary_key=True),
+    Column("track_id", Integer, ForeignKey("track.id"), nullable=False),
+    Column("published_at", DateTime),
 )
 
 class Playlist(Base):
@@ -32,6 +114,8 @@ class Playlist(Base):
     description = Column(String)
     date_created = Column(DateTime)
     downloaded = Column(Boolean)
+    # Kept up to date by database triggers (see migrations.py)
+    track_count = Column(Integer)
     tracks = relationship(
         "Track", secondary=playlist_track, back_populates="playlists"
     )
@@ -56,6 +140,7 @@ class Playlist(Base):
         self.title = title
         self.date_created = date_created
         self.downloaded = downloaded
+        self.track_count = 0
 
         if not description:
             description = ""
@@ -70,6 +155,9 @@ class Playlist(Base):
         int
             The number of tracks in the playlist
         """
+        # Use the stored count unless it hasn't been backfilled yet, to avoid loading the tracks
+        if self.track_count is not None:
+            return self.track_count
         return len(self.tracks)
 
     def get_total_duration(self) -> int:
@@ -86,7 +174,7 @@ class Playlist(Base):
 class Track(Base):
     __tablename__ = "track"
     id = Column(Integer, primary_key=True)
-    title = Column(String)
+    title = Column(String, index=True)
     artist = Column(String)
     album = Column(String)
     duration = Column(Integer)
@@ -98,6 +186,9 @@ class Track(Base):
     playlists = relationship(
         "Playlist", secondary=playlist_track, back_populates="tracks"
     )
+    tags = relationship(
+        "Tag", secondary=track_tag, back_populates="tracks"
+    )
 
     def __init__(self, title: str, artist: str, album: str, duration: int, playlists: list[Playlist], liked: bool=False,
         path: Optional[str]=None, stream_url: Optional[str]=None, cover_art_url: Optional[str]=None) -> None:
@@ -159,16 +250,47 @@ class Stream(Base):
         """
         self.url = url
 
+class Tag(Base):
+    __tablename__ = "tag"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(collation="NOCASE"), unique=True)
+    tracks = relationship(
+        "Track", secondary=track_tag, back_populates="tags"
+    )
+
+    def __init__(self, name: str) -> None:
+        """
+        Parameters
+        ----------
+        name : str
+            The tag or genre name (case-insensitive)
+
+        Returns
+        -------
+        None
+        """
+        self.name = name
+
 class PlaylistManager:
-    def __init__(self) -> None:
+    def __init__(self, bind: Optional[db.engine.Engine]=None) -> None:
         """
         Creates the engine and a new session
 
+        Parameters
+        ----------
+        bind : Engine, optional
+            The database engine to use. If not specified, uses the app database
+
         Returns
         -------
         None
         """
-        Base.metadata.create_all(engine)
+        self.engine = bind if bind else engine
+        if not migrations.is_upgraded(self.engine):
+            Base.metadata.create_all(self.engine)
+            # create_all only creates missing tables, so apply schema changes to existing databases
+            migrations.upgrade(self.engine)
         self.session = None
         self.open_session()
 
@@ -230,6 +352,49 @@ class PlaylistManager:
             self.session.commit()
         return track
 
+    def get_or_create_tracks(self, track_details: list[dict[str, Any]], commit: bool=True) -> list[Track]:
+        """
+        Returns the first track with the corresponding title for each set of track details.
+        The missing tracks are created and committed together, instead of one commit per track
+
+        Parameters
+        ----------
+        track_details : list[dict]
+            The details of each track: the keyword arguments of get_or_create_track
+            (title, artist, album, duration, stream_url and optionally cover_art_url)
+        commit : bool
+            Whether to commit the session. If set to false, the changes are only flushed, so the caller can commit
+            several changes together
+
+        Returns
+        -------
+        list[Track]
+            The tracks in the same order as the details
+        """
+        titles = list({details["title"] for details in track_details})
+        tracks_by_title = {}
+        # Keep the number of bound parameters under SQLite's limit
+        for index in range(0, len(titles), 500):
+            for track in self.session.query(Track).filter(Track.title.in_(titles[index:index + 500])).order_by(Track.id):
+                tracks_by_title.setdefault(track.title, track)
+
+        new_tracks = []
+        for details in track_details:
+            if details["title"] in tracks_by_title:
+                continue
+            track = Track(title=details["title"], artist=details["artist"], album=details["album"], duration=details["duration"],
+                playlists=[], stream_url=details["stream_url"], cover_art_url=details.get("cover_art_url") or "")
+            tracks_by_title[track.title] = track
+            new_tracks.append(track)
+
+        if new_tracks:
+            self.session.add_all(new_tracks)
+            if commit:
+                self.session.commit()
+            else:
+                self.session.flush()
+        return [tracks_by_title[details["title"]] for details in track_details]
+
     def add_track_cover_art(self, track: Track, cover_art_url: str) -> None:
         """
         Adds a cover art url to an existing track object
@@ -387,6 +552,7 @@ class PlaylistManager:
             return
         playlists.append(playlist)
         track.playlists = playlists
+        self.mark_similarity_stale(track, playlist)
         self.session.commit()
 
     def create_and_add_track_to_playlist(self, title: str, artist: str, album: str, duration: int,
@@ -481,6 +647,7 @@ class PlaylistManager:
         """
         playlists = track.playlists
         if playlist in playlists:
+            self.mark_similarity_stale(track, playlist)
             playlists.remove(playlist)
             track.playlists = playlists
             self.session.commit()
@@ -517,6 +684,510 @@ class PlaylistManager:
         """
         return self.get_or_create_playlist("Liked Songs") in track.playlists
 
+    def merge_playlists(self, source: Playlist, target: Playlist) -> int:
+        """
+        Adds the tracks of a playlist to another playlist (union), skipping tracks the target already contains.
+        Uses a single INSERT ... SELECT statement instead of adding the tracks one at a time
+
+        Parameters
+        ----------
+        source : Playlist
+            The playlist database object to copy the tracks from
+        target : Playlist
+            The playlist database object to add the tracks to
+
+        Returns
+        -------
+        int
+            The number of tracks added to the target playlist
+        """
+        if not source or not target or source.id == target.id:
+            return 0
+
+        self.session.flush()
+        existing = playlist_track.alias("existing")
+        added = self.session.execute(
+            playlist_track.insert().from_select(
+                ["playlist_id", "track_id"],
+                db.select(db.literal(target.id), playlist_track.c.track_id)
+                .where(playlist_track.c.playlist_id == source.id)
+                .where(~db.exists().where(existing.c.playlist_id == target.id).where(existing.c.track_id == playlist_track.c.track_id))
+                .distinct()
+            )
+        ).rowcount
+        if added:
+            self.mark_playlist_similarity_stale(target)
+        self.session.commit()
+        return added
+
+    def duplicate_playlist(self, playlist: Playlist, title: Optional[str]=None) -> Optional[Playlist]:
+        """
+        Creates a copy of a playlist with the same description and tracks
+
+        Parameters
+        ----------
+        playlist : Playlist
+            The playlist database object to copy
+        title : str, optional
+            The title of the copy. If not specified, adds "(Copy)" to the original title
+
+        Returns
+        -------
+        Playlist, optional
+            The new playlist
+        """
+        if not playlist:
+            return None
+
+        if not title:
+            title = f"{playlist.title} (Copy)"
+        copy = Playlist(title=title, date_created=datetime.now(), downloaded=playlist.downloaded, description=playlist.description)
+        self.session.add(copy)
+        self.session.flush()
+
+        self.merge_playlists(playlist, copy)
+        return copy
+
+    def subtract_playlist(self, playlist: Playlist, other: Playlist) -> int:
+        """
+        Removes the tracks that are also in another playlist from a playlist (difference).
+        Uses a single DELETE ... WHERE statement instead of removing the tracks one at a time
+
+        Parameters
+        ----------
+        playlist : Playlist
+            The playlist database object to remove the tracks from
+        other : Playlist
+            The playlist database object that contains the tracks to remove
+
+        Returns
+        -------
+        int
+            The number of tracks removed from the playlist
+        """
+        if not playlist or not other:
+            return 0
+
+        self.session.flush()
+        # The similar tracks of every track in the playlist may change
+        self.mark_playlist_similarity_stale(playlist)
+        other_tracks = db.select(playlist_track.c.track_id).where(playlist_track.c.playlist_id == other.id)
+        removed = self.session.execute(
+            playlist_track.delete()
+            .where(playlist_track.c.playlist_id == playlist.id)
+            .where(playlist_track.c.track_id.in_(other_tracks.scalar_subquery()))
+        ).rowcount
+        self.session.commit()
+        return removed
+
+    def add_tracks_to_playlist(self, tracks: list[Track], playlist: Playlist, commit: bool=True) -> int:
+        """
+        Adds a selection of existing tracks to a playlist, skipping tracks the playlist already contains
+
+        Parameters
+        ----------
+        tracks : list[Track]
+            The track database objects
+        playlist : Playlist
+            The playlist database object to add the tracks to
+        commit : bool
+            Whether to commit the session. If set to false, the changes are only flushed, so the caller can commit
+            several changes together
+
+        Returns
+        -------
+        int
+            The number of tracks added to the playlist
+        """
+        if not playlist:
+            return 0
+
+        self.session.flush()
+        track_ids = self._get_track_ids(tracks)
+        added = 0
+        # Keep the number of bound parameters under SQLite's limit
+        for index in range(0, len(track_ids), 500):
+            added += self.session.execute(
+                playlist_track.insert().from_select(
+                    ["playlist_id", "track_id"],
+                    db.select(db.literal(playlist.id), Track.id)
+                    .where(Track.id.in_(track_ids[index:index + 500]))
+                    .where(~db.exists().where(playlist_track.c.playlist_id == playlist.id).where(playlist_track.c.track_id == Track.id))
+                )
+            ).rowcount
+        if added:
+            self.mark_playlist_similarity_stale(playlist)
+        if commit:
+            self.session.commit()
+        return added
+
+    def remove_tracks_from_playlist(self, tracks: list[Track], playlist: Playlist) -> int:
+        """
+        Removes a selection of tracks from a playlist
+
+        Parameters
+        ----------
+        tracks : list[Track]
+            The track database objects
+        playlist : Playlist
+            The playlist database object to remove the tracks from
+
+        Returns
+        -------
+        int
+            The number of tracks removed from the playlist
+        """
+        if not playlist:
+            return 0
+
+        self.session.flush()
+        self.mark_playlist_similarity_stale(playlist)
+        track_ids = self._get_track_ids(tracks)
+        removed = 0
+        for index in range(0, len(track_ids), 500):
+            removed += self.session.execute(
+                playlist_track.delete()
+                .where(playlist_track.c.playlist_id == playlist.id)
+                .where(playlist_track.c.track_id.in_(track_ids[index:index + 500]))
+            ).rowcount
+        self.session.commit()
+        return removed
+
+    @staticmethod
+    def _get_track_ids(tracks: list[Track]) -> list[int]:
+        """
+        Returns the unique ids of persisted tracks without reloading tracks that were expired by a commit
+
+        Parameters
+        ----------
+        tracks : list[Track]
+            The track database objects
+
+        Returns
+        -------
+        list[int]
+            The track ids
+        """
+        identities = (db.inspect(track).identity for track in tracks)
+        return list({identity[0] for identity in identities if identity})
+
+    def like_tracks(self, tracks: list[Track]) -> int:
+        """
+        Adds a selection of tracks to the "Liked Songs" playlist
+
+        Parameters
+        ----------
+        tracks : list[Track]
+            The track database objects
+
+        Returns
+        -------
+        int
+            The number of newly liked tracks
+        """
+        return self.add_tracks_to_playlist(tracks, self.get_or_create_playlist("Liked Songs"))
+
+    def unlike_tracks(self, tracks: list[Track]) -> int:
+        """
+        Removes a selection of tracks from the "Liked Songs" playlist
+
+        Parameters
+        ----------
+        tracks : list[Track]
+            The track database objects
+
+        Returns
+        -------
+        int
+            The number of unliked tracks
+        """
+        return self.remove_tracks_from_playlist(tracks, self.get_or_create_playlist("Liked Songs"))
+
+    def get_or_create_tag(self, name: str) -> Tag:
+        """
+        Returns the tag with the specified name (case-insensitive).
+        If the tag doesn't exist, creates a new tag with the specified name.
+
+        Parameters
+        ----------
+        name : str
+            The tag or genre name
+
+        Returns
+        -------
+        Tag
+            The tag with the specified name
+        """
+        name = " ".join(name.split())
+        tag = self.session.query(Tag).filter_by(name=name).first()
+        if tag:
+            return tag
+
+        tag = Tag(name)
+        self.session.add(tag)
+        self.session.commit()
+        return tag
+
+    def add_tags_to_track(self, track: Track, tag_names: list[str], commit: bool=True) -> None:
+        """
+        Adds tags (e.g. genres) to an existing track. Tags the track already has are ignored
+
+        Parameters
+        ----------
+        track : Track
+            The track database object
+        tag_names : list[str]
+            The names of the tags to add
+        commit : bool
+            Whether to commit the session. If set to false, the changes are only flushed, so the caller can commit
+            several changes together
+
+        Returns
+        -------
+        None
+        """
+        if not track:
+            return
+
+        for name in tag_names:
+            name = " ".join(name.split())
+            if not name:
+                continue
+            tag = self.session.query(Tag).filter_by(name=name).first()
+            if not tag:
+                tag = Tag(name)
+                self.session.add(tag)
+            if tag not in track.tags:
+                track.tags.append(tag)
+        if commit:
+            self.session.commit()
+        else:
+            self.session.flush()
+
+    def remove_tag_from_track(self, track: Track, tag: Tag) -> None:
+        """
+        Removes a tag from a track
+
+        Parameters
+        ----------
+        track : Track
+            The track database object
+        tag : Tag
+            The tag database object to remove
+
+        Returns
+        -------
+        None
+        """
+        if tag in track.tags:
+            track.tags.remove(tag)
+            self.session.commit()
+
+    def get_tag_facets(self, playlist: Optional[Playlist]=None, limit: Optional[int]=None) -> list[tuple[str, int]]:
+        """
+        Returns the tags and the number of tracks with each tag (e.g. [("Rock", 1203), ...]), most common first.
+        The counts are computed from the covering indexes on track_tag and playlist_track,
+        so only the index entries of the counted tracks are read.
+
+        Parameters
+        ----------
+        playlist : Playlist, optional
+            Only count the tracks in this playlist. If not specified, counts all tracks
+        limit : int, optional
+            The maximum number of facets to return
+
+        Returns
+        -------
+        list[tuple[str, int]]
+            The tag names and track counts
+        """
+        track_count = db.func.count().label("track_count")
+        if playlist:
+            counts = (
+                self.session.query(track_tag.c.tag_id, track_count)
+                .join(playlist_track, playlist_track.c.track_id == track_tag.c.track_id)
+                .filter(playlist_track.c.playlist_id == playlist.id)
+            )
+        else:
+            counts = self.session.query(track_tag.c.tag_id, track_count)
+        counts = counts.group_by(track_tag.c.tag_id).subquery()
+
+        query = (
+            self.session.query(Tag.name, counts.c.track_count)
+            .join(counts, counts.c.tag_id == Tag.id)
+            .order_by(counts.c.track_count.desc(), Tag.name)
+        )
+        if limit:
+            query = query.limit(limit)
+        return [(name, count) for name, count in query]
+
+    def get_playlist_tracks_by_tags(self, playlist: Playlist, tag_names: list[str], match_all: bool=False) -> list[Track]:
+        """
+        Returns the tracks in a playlist that have the specified tags (facet filtering)
+
+        Parameters
+        ----------
+        playlist : Playlist
+            The playlist database object to filter
+        tag_names : list[str]
+            The names of the tags to filter by (case-insensitive)
+        match_all : bool
+            If set to true, only returns tracks that have all of the tags.
+            Otherwise, returns tracks that have any of the tags
+
+        Returns
+        -------
+        list[Track]
+            The tracks in the playlist that match the tags
+        """
+        if not playlist or not tag_names:
+            return []
+
+        tag_names = {" ".join(name.split()).lower() for name in tag_names}
+        tagged_tracks = (
+            self.session.query(track_tag.c.track_id)
+            .join(Tag, Tag.id == track_tag.c.tag_id)
+            .filter(Tag.name.in_(tag_names))
+            .group_by(track_tag.c.track_id)
+        )
+        if match_all:
+            tagged_tracks = tagged_tracks.having(db.func.count(db.distinct(track_tag.c.tag_id)) == len(tag_names))
+
+        return (
+            self.session.query(Track)
+            .join(playlist_track, playlist_track.c.track_id == Track.id)
+            .filter(playlist_track.c.playlist_id == playlist.id)
+            .filter(Track.id.in_(tagged_tracks))
+            .all()
+        )
+
+    def mark_similarity_stale(self, track: Track, playlist: Playlist) -> None:
+        """
+        Marks the similar tracks of a track and of the tracks in a playlist as out of date,
+        after the track was added to or removed from the playlist.
+        The track's playlist vector changed, so the tracks that share any of its other playlists are marked too.
+        Does not commit the session.
+
+        Parameters
+        ----------
+        track : Track
+            The track database object whose membership changed
+        playlist : Playlist
+            The playlist database object that the track was added to or removed from
+
+        Returns
+        -------
+        None
+        """
+        self.session.flush()
+        shared_playlist_track = playlist_track.alias()
+        self.session.execute(
+            track_similarity_stale.insert().prefix_with("OR IGNORE").from_select(
+                ["track_id"],
+                db.select(playlist_track.c.track_id)
+                .where(playlist_track.c.playlist_id == playlist.id)
+                .union(
+                    db.select(db.literal(track.id)),
+                    db.select(shared_playlist_track.c.track_id)
+                    .join(playlist_track, playlist_track.c.playlist_id == shared_playlist_track.c.playlist_id)
+                    .where(playlist_track.c.track_id == track.id)
+                )
+            )
+        )
+
+    def mark_playlist_similarity_stale(self, playlist: Playlist) -> None:
+        """
+        Marks the similar tracks of every track in a playlist as out of date, after a bulk membership change.
+        Unlike mark_similarity_stale, the tracks that only share another playlist with a changed track aren't marked
+        (that could be most of the library), so their scores are only updated by SimilarityIndex.rebuild.
+        Does not commit the session.
+
+        Parameters
+        ----------
+        playlist : Playlist
+            The playlist database object whose tracks changed
+
+        Returns
+        -------
+        None
+        """
+        self.session.execute(
+            track_similarity_stale.insert().prefix_with("OR IGNORE").from_select(
+                ["track_id"],
+                db.select(playlist_track.c.track_id).where(playlist_track.c.playlist_id == playlist.id)
+            )
+        )
+
+    def get_similar_tracks(self, track: Track, limit: int=10) -> list[Track]:
+        """
+        Returns the tracks most similar to a track ("more like this"), most similar first.
+        The similar tracks are precomputed by recommendation.SimilarityIndex
+
+        Parameters
+        ----------
+        track : Track
+            The track database object
+        limit : int
+            The maximum number of similar tracks to return
+
+        Returns
+        -------
+        list[Track]
+            The most similar tracks
+        """
+        if not track:
+            return []
+
+        return (
+            self.session.query(Track)
+            .join(track_similarity, track_similarity.c.similar_track_id == Track.id)
+            .filter(track_similarity.c.track_id == track.id)
+            .order_by(track_similarity.c.rank)
+            .limit(limit)
+            .all()
+        )
+
+    def get_station_health(self, track: Track) -> Optional[db.engine.Row]:
+        """
+        Returns the latest health check of a radio station track (recorded by station_monitor.StationMonitor)
+
+        Parameters
+        ----------
+        track : Track
+            The track database object
+
+        Returns
+        -------
+        Row, optional
+            The station_health row, or None if the station hasn't been checked
+        """
+        if not track or not track.stream_id:
+            return None
+        return self.session.execute(db.select(station_health).where(station_health.c.stream_id == track.stream_id)).first()
+
+    def get_stations_by_health(self, playlist: Optional[Playlist]=None) -> list[Track]:
+        """
+        Returns the checked radio station tracks, healthy stations first and then by time to first byte (fastest first)
+
+        Parameters
+        ----------
+        playlist : Playlist, optional
+            Only returns the stations in this playlist. If not specified, returns all of the checked stations
+
+        Returns
+        -------
+        list[Track]
+            The station tracks
+        """
+        query = self.session.query(Track).join(station_health, station_health.c.stream_id == Track.stream_id)
+        if playlist:
+            query = query.join(playlist_track, playlist_track.c.track_id == Track.id).filter(playlist_track.c.playlist_id == playlist.id)
+        return query.order_by(
+            station_health.c.healthy.desc(),
+            station_health.c.time_to_first_byte.is_(None),
+            station_health.c.time_to_first_byte,
+        ).all()
+
     def open_session(self) -> None:
         """
         Opens a new SQL session
@@ -529,7 +1200,7 @@ class PlaylistManager:
             return
 
         Session = sessionmaker()
-        Session.configure(bind=engine)
+        Session.configure(bind=self.engine)
         self.session = Session()
 
     def commit_session(self) -> None:
@@ -0,0 +1,358 @@
+"""
+Reads the duration of audio files and streams from their container headers, using a few small (ranged) reads
+instead of playing the stream. Supports MP3 (Xing/Info, VBRI and constant bitrate), MP4/M4A, Ogg (Vorbis/Opus),
+FLAC and WAV, with a Content-Length / bitrate estimate as the fallback.
+"""
+
+import os
+import struct
+from typing import Optional
+
+import requests
+
+from http_client import http_client
+
+# MPEG audio bitrates in kbps, indexed by [version is MPEG-1][layer][bitrate index]
+MPEG_BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+# MPEG audio sample rates, indexed by version bits (0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1)
+MPEG_SAMPLE_RATES = {0: [11025, 12000, 8000], 2: [22050, 24000, 16000], 3: [44100, 48000, 32000]}
+
+HEAD_SIZE = 16384
+TAIL_SIZE = 65536
+
+
+class RangeReader:
+    """
+    Reads byte ranges of a local file or a url (using HTTP Range requests)
+    """
+
+    def __init__(self, source: str, timeout: tuple[float, float]=(3.05, 5.0)) -> None:
+        """
+        Parameters
+        ----------
+        source : str
+            The local file path or url
+        timeout : tuple[float, float]
+            The connect and read time outs in seconds for urls
+
+        Returns
+        -------
+        None
+        """
+        self.source = source
+        self.timeout = timeout
+        self.is_url = source.startswith(("http://", "https://"))
+        self.size = os.path.getsize(source) if not self.is_url else None
+        self.supports_ranges = True
+        self.headers = {}
+        self.bytes_read = 0
+
+    def read(self, offset: int, length: int) -> bytes:
+        """
+        Returns up to length bytes starting at offset (negative offsets are relative to the end)
+
+        Parameters
+        ----------
+        offset : int
+            The position of the first byte
+        length : int
+            The maximum number of bytes to read
+
+        Returns
+        -------
+        bytes
+            The bytes read (empty if the range can't be read)
+        """
+        if offset < 0:
+            if self.size is None:
+                return b""
+            offset = max(self.size + offset, 0)
+        if self.size is not None and offset >= self.size:
+            return b""
+
+        if not self.is_url:
+            with open(self.source, "rb") as file:
+                file.seek(offset)
+                data = file.read(length)
+        else:
+            data = self._read_url(offset, length)
+        self.bytes_read += len(data)
+        return data
+
+    def _read_url(self, offset: int, length: int) -> bytes:
+        """
+        Reads a byte range of the url. If the server ignores Range requests, only the start of the body can be read
+        """
+        if offset and not self.supports_ranges:
+            return b""
+
+        headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+        with http_client.get(self.source, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if not self.headers:
+                self.headers = response.headers
+
+            if response.status_code == 206:
+                # Content-Range: bytes 0-16383/4194304
+                total = response.headers.get("Content-Range", "").rpartition("/")[-1]
+                if total.isdigit():
+                    self.size = int(total)
+            else:
+                self.supports_ranges = False
+                length_header = response.headers.get("Content-Length", "")
+                if length_header.isdigit():
+                    self.size = int(length_header)
+                if offset:
+                    return b""
+            return response.raw.read(length, decode_content=False) or b""
+
+
+def get_duration(source: str) -> Optional[float]:
+    """
+    Returns the duration of an audio file or stream in seconds from its container headers
+
+    Parameters
+    ----------
+    source : str
+        The local file path or url
+
+    Returns
+    -------
+    float, optional
+        The duration in seconds, or None if it can't be determined (e.g. live radio streams)
+    """
+    reader = RangeReader(source)
+    try:
+        head = reader.read(0, HEAD_SIZE)
+        if not head:
+            return None
+
+        if head[4:8] == b"ftyp":
+            duration = _mp4_duration(reader)
+        elif head[:4] == b"OggS":
+            duration = _ogg_duration(reader, head)
+        elif head[:4] == b"fLaC":
+            duration = _flac_duration(head)
+        elif head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            duration = _wav_duration(reader, head)
+        else:
+            duration = _mp3_duration(reader, head)
+
+        if duration is None:
+            duration = _estimate_duration(reader)
+        return duration
+    except (requests.exceptions.RequestException, OSError, struct.error, ValueError) as e:
+        print(f"Could not read the duration from the headers. Error: {e}")
+        return None
+
+def _estimate_duration(reader: RangeReader) -> Optional[float]:
+    """
+    Estimates the duration from the size and the bitrate advertised by the server (e.g. icy-br)
+    """
+    bitrate = reader.headers.get("icy-br", "").split(",")[0].strip()
+    if reader.size and bitrate.isdigit() and int(bitrate):
+        return reader.size * 8 / (int(bitrate) * 1000)
+    return None
+
+def _id3_size(head: bytes) -> int:
+    """
+    Returns the size of an ID3v2 tag at the start of a file (0 if there is none)
+    """
+    if head[:3] != b"ID3" or len(head) < 10:
+        return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    # The footer flag adds another 10 bytes
+    return size + (20 if head[5] & 0x10 else 10)
+
+def _parse_mpeg_header(data: bytes, offset: int) -> Optional[tuple[int, int, int, int, int, int]]:
+    """
+    Parses an MPEG audio frame header
+
+    Returns
+    -------
+    tuple[int, int, int, int, int, int], optional
+        (version bits, layer, bitrate in kbps, sample rate, channel mode, frame length in bytes),
+        or None if it isn't a valid header
+    """
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = (b2 >> 4) & 0x0F
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = MPEG_BITRATES[version == 3][layer][bitrate_index]
+    sample_rate = MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        frame_length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        frame_length = (144 if version == 3 or layer == 2 else 72) * bitrate * 1000 // sample_rate + padding
+    return version, layer, bitrate, sample_rate, (b3 >> 6) & 0x03, frame_length
+
+def _mp3_duration(reader: RangeReader, head: bytes) -> Optional[float]:
+    """
+    Returns the duration of an MP3 from its Xing/Info or VBRI header, or from its bitrate for constant bitrate files
+    """
+    # The audio frames start after the ID3v2 tag, which can be larger than the first read (e.g. embedded cover art)
+    audio_start = _id3_size(head)
+    data = head[audio_start:] if audio_start + 4096 <= len(head) else reader.read(audio_start, HEAD_SIZE)
+
+    # Find the first frame header that is followed by another valid header (to skip false syncs)
+    for offset in range(len(data) - 4):
+        header = _parse_mpeg_header(data, offset)
+        if not header:
+            continue
+        version, layer, bitrate, sample_rate, channel_mode, frame_length = header
+        if offset + frame_length + 4 <= len(data) and not _parse_mpeg_header(data, offset + frame_length):
+            continue
+        break
+    else:
+        return None
+
+    samples_per_frame = 384 if layer == 1 else (1152 if version == 3 or layer == 2 else 576)
+
+    # Xing/Info header after the side information
+    side_info = (32 if channel_mode != 3 else 17) if version == 3 else (17 if channel_mode != 3 else 9)
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+        if flags & 0x01:
+            frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+            return frames * samples_per_frame / sample_rate
+
+    # VBRI header 32 bytes after the frame header
+    vbri = offset + 36
+    if data[vbri:vbri + 4] == b"VBRI":
+        frames = struct.unpack(">I", data[vbri + 14:vbri + 18])[0]
+        return frames * samples_per_frame / sample_rate
+
+    # Constant bitrate: the audio size divided by the bitrate
+    if not reader.size:
+        return None
+    audio_size = reader.size - audio_start - offset
+    if reader.read(-128, 3) == b"TAG":
+        audio_size -= 128
+    return audio_size * 8 / (bitrate * 1000)
+
+def _mp4_duration(reader: RangeReader) -> Optional[float]:
+    """
+    Returns the duration of an MP4/M4A from the movie header (mvhd) box, which can be at the start or the end of the file
+    """
+    offset = 0
+    # Walk the top-level boxes, reading only their headers until the moov box is found
+    while reader.size is None or offset < reader.size:
+        header = reader.read(offset, 16)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = (reader.size - offset) if reader.size else HEAD_SIZE
+        if size < header_size:
+            return None
+
+        if box_type == b"moov":
+            moov = reader.read(offset + header_size, min(size - header_size, HEAD_SIZE))
+            return _parse_mvhd(moov)
+        offset += size
+    return None
+
+def _parse_mvhd(moov: bytes) -> Optional[float]:
+    """
+    Parses the movie header (mvhd) box from the contents of a moov box
+    """
+    offset = 0
+    while offset + 8 <= len(moov):
+        size, box_type = struct.unpack(">I4s", moov[offset:offset + 8])
+        if box_type == b"mvhd":
+            version = moov[offset + 8]
+            if version == 1:
+                timescale, duration = struct.unpack(">IQ", moov[offset + 28:offset + 40])
+            else:
+                timescale, duration = struct.unpack(">II", moov[offset + 20:offset + 28])
+            return duration / timescale if timescale else None
+        if size < 8:
+            return None
+        offset += size
+    return None
+
+def _ogg_duration(reader: RangeReader, head: bytes) -> Optional[float]:
+    """
+    Returns the duration of an Ogg Vorbis/Opus file from the granule position of its last page
+    """
+    # The identification header is in the first page, after the 27-byte page header and the segment table
+    segments = head[26]
+    packet = head[27 + segments:]
+    if packet[:7] == b"\x01vorbis":
+        sample_rate = struct.unpack("<I", packet[12:16])[0]
+        pre_skip = 0
+    elif packet[:8] == b"OpusHead":
+        # Opus granule positions always count 48kHz samples
+        sample_rate = 48000
+        pre_skip = struct.unpack("<H", packet[10:12])[0]
+    else:
+        return None
+
+    tail = reader.read(-TAIL_SIZE, TAIL_SIZE)
+    page = len(tail)
+    while True:
+        page = tail.rfind(b"OggS", 0, page)
+        if page < 0:
+            return None
+        if page + 14 > len(tail):
+            continue
+        granule = struct.unpack("<q", tail[page + 6:page + 14])[0]
+        # A granule position of -1 means no packet ends on the page, so step back to the previous page
+        if granule >= 0:
+            return max(granule - pre_skip, 0) / sample_rate if sample_rate else None
+
+def _flac_duration(head: bytes) -> Optional[float]:
+    """
+    Returns the duration of a FLAC file from its STREAMINFO block
+    """
+    # STREAMINFO is the first metadata block: 4-byte marker, 4-byte block header, then the block
+    info = head[8:42]
+    if len(info) < 18:
+        return None
+    sample_rate = (info[10] << 12) | (info[11] << 4) | (info[12] >> 4)
+    total_samples = ((info[13] & 0x0F) << 32) | struct.unpack(">I", info[14:18])[0]
+    return total_samples / sample_rate if sample_rate and total_samples else None
+
+def _wav_duration(reader: RangeReader, head: bytes) -> Optional[float]:
+    """
+    Returns the duration of a WAV file from its fmt and data chunks
+    """
+    offset = 12
+    byte_rate = None
+    while offset + 8 <= len(head):
+        chunk_id, chunk_size = struct.unpack("<4sI", head[offset:offset + 8])
+        if chunk_id == b"fmt ":
+            byte_rate = struct.unpack("<I", head[offset + 16:offset + 20])[0]
+        elif chunk_id == b"data" and byte_rate:
+            # Streamed WAV files may not know their data size when the header is written
+            if chunk_size in (0, 0xFFFFFFFF) and reader.size:
+                chunk_size = reader.size - offset - 8
+            return chunk_size / byte_rate
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
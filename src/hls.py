@@ -0,0 +1,277 @@
+"""
+Downloads HTTP Live Streaming (HLS, .m3u8) audio. The media playlist is parsed and its segments are downloaded with
+bounded parallelism, then written to a single file in playlist order. Master playlists are followed to the best
+audio rendition or variant stream. Encrypted streams aren't supported.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import Callable, Optional
+from urllib.parse import urljoin
+
+from http_client import http_client
+
+
+class HlsPlaylist:
+    """
+    A parsed HLS master or media playlist
+    """
+
+    def __init__(self, url: str) -> None:
+        """
+        Parameters
+        ----------
+        url : str
+            The url of the playlist
+
+        Returns
+        -------
+        None
+        """
+        self.url = url
+        # Media playlists: the segment urls in playlist order and the initialization segment (fragmented MP4)
+        self.segments = []
+        self.init_segment = None
+        # The total duration of the segments in seconds
+        self.duration = 0.0
+        # Whether the playlist is complete (live playlists only list the latest segments)
+        self.ended = False
+        self.encrypted = False
+        # Master playlists: (bandwidth, url) of the variant streams and the urls of the audio renditions
+        self.variants = []
+        self.audio_renditions = []
+
+    @property
+    def is_master(self) -> bool:
+        """
+        Whether the playlist lists variant streams instead of segments
+        """
+        return bool(self.variants or self.audio_renditions)
+
+    @property
+    def segment_extension(self) -> str:
+        """
+        The file extension of the segments (e.g. ".ts", ".aac", ".mp4")
+        """
+        if not self.segments:
+            return ".ts"
+        extension = os.path.splitext(self.segments[0].split("?")[0].split("#")[0])[-1].lower()
+        if extension in {".m4s", ".mp4", ".m4a", ".cmfa"} or self.init_segment:
+            return ".mp4"
+        return extension if extension in {".ts", ".aac", ".mp3"} else ".ts"
+
+
+def _parse_attributes(attributes: str) -> dict[str, str]:
+    """
+    Parses an attribute list (e.g. BANDWIDTH=128000,CODECS="mp4a.40.2",URI="audio.m3u8")
+    """
+    result = {}
+    key, value, quoted, in_value = "", "", False, False
+    for char in attributes + ",":
+        if in_value:
+            if char == '"':
+                quoted = not quoted
+            elif char == "," and not quoted:
+                result[key.strip().upper()] = value.strip()
+                key, value, in_value = "", "", False
+            else:
+                value += char
+        elif char == "=":
+            in_value = True
+        else:
+            key += char
+    return result
+
+def parse_hls_playlist(text: str, url: str) -> HlsPlaylist:
+    """
+    Parses an HLS master or media playlist
+
+    Parameters
+    ----------
+    text : str
+        The playlist contents
+    url : str
+        The url of the playlist, used to resolve relative urls
+
+    Returns
+    -------
+    HlsPlaylist
+        The parsed playlist
+    """
+    playlist = HlsPlaylist(url)
+    variant_bandwidth = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith("#"):
+            tag, _, value = line.partition(":")
+            if tag == "#EXTINF":
+                duration = value.split(",")[0].strip()
+                playlist.duration += float(duration) if duration.replace(".", "", 1).isdigit() else 0.0
+            elif tag == "#EXT-X-ENDLIST":
+                playlist.ended = True
+            elif tag == "#EXT-X-KEY":
+                playlist.encrypted = playlist.encrypted or _parse_attributes(value).get("METHOD", "NONE") != "NONE"
+            elif tag == "#EXT-X-MAP":
+                uri = _parse_attributes(value).get("URI")
+                playlist.init_segment = urljoin(url, uri) if uri else None
+            elif tag == "#EXT-X-STREAM-INF":
+                bandwidth = _parse_attributes(value).get("BANDWIDTH", "0")
+                variant_bandwidth = int(bandwidth) if bandwidth.isdigit() else 0
+            elif tag == "#EXT-X-MEDIA":
+                attributes = _parse_attributes(value)
+                if attributes.get("TYPE") == "AUDIO" and attributes.get("URI"):
+                    rendition = urljoin(url, attributes["URI"])
+                    # The default rendition comes first
+                    if attributes.get("DEFAULT") == "YES":
+                        playlist.audio_renditions.insert(0, rendition)
+                    else:
+                        playlist.audio_renditions.append(rendition)
+            continue
+
+        # A uri line belongs to the preceding #EXT-X-STREAM-INF (variant) or #EXTINF (segment)
+        if variant_bandwidth is not None:
+            playlist.variants.append((variant_bandwidth, urljoin(url, line)))
+            variant_bandwidth = None
+        else:
+            playlist.segments.append(urljoin(url, line))
+    return playlist
+
+def load_media_playlist(url: str, depth: int=3) -> Optional[HlsPlaylist]:
+    """
+    Downloads a playlist, following master playlists to their default audio rendition
+    (or the variant stream with the highest bandwidth)
+
+    Parameters
+    ----------
+    url : str
+        The url of the playlist
+    depth : int
+        The maximum number of master playlists to follow
+
+    Returns
+    -------
+    HlsPlaylist, optional
+        The media playlist, or None if it couldn't be downloaded
+    """
+    try:
+        response = http_client.get(url)
+        response.raise_for_status()
+    except Exception as e:
+        print(f"Could not download the HLS playlist. Error: {e}")
+        return None
+
+    playlist = parse_hls_playlist(response.text, response.url)
+    if not playlist.is_master:
+        return playlist
+    if depth <= 0:
+        print("Could not download the HLS playlist; too many nested master playlists")
+        return None
+
+    if playlist.audio_renditions:
+        return load_media_playlist(playlist.audio_renditions[0], depth - 1)
+    return load_media_playlist(max(playlist.variants)[1], depth - 1)
+
+def _download_segment(url: str) -> bytes:
+    """
+    Downloads a single segment
+    """
+    response = http_client.get(url, timeout=(3.05, 30.0))
+    response.raise_for_status()
+    return response.content
+
+def download_segments(segment_urls: list[str], file_path: str, max_workers: int=4,
+    progress_callback: Optional[Callable[[int, int], None]]=None) -> bool:
+    """
+    Downloads segments in parallel and writes them to a file in order.
+    At most max_workers segments are downloaded at the same time, and at most twice as many are held in memory
+
+    Parameters
+    ----------
+    segment_urls : list[str]
+        The urls of the segments in playlist order
+    file_path : str
+        The path of the file to write
+    max_workers : int
+        The maximum number of concurrent segment downloads
+    progress_callback : Callable, optional
+        The function that is called with the number of written segments and the total number of segments
+
+    Returns
+    -------
+    bool
+        Whether all of the segments were downloaded
+    """
+    pending = deque()
+    next_index = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, open(file_path, "wb") as file:
+        try:
+            for written in range(1, len(segment_urls) + 1):
+                # Keep the download window full
+                while next_index < len(segment_urls) and len(pending) < max_workers * 2:
+                    pending.append(executor.submit(_download_segment, segment_urls[next_index]))
+                    next_index += 1
+
+                file.write(pending.popleft().result())
+                if progress_callback:
+                    progress_callback(written, len(segment_urls))
+        except Exception as e:
+            print(f"Could not download the HLS segments. Error: {e}")
+            for future in pending:
+                future.cancel()
+            return False
+    return True
+
+def download_hls(url: str, file_path: str, max_workers: int=4, progress_callback: Optional[Callable[[int, int], None]]=None) -> Optional[str]:
+    """
+    Downloads an HLS stream to a single file. The extension of the file path is replaced by the segments' extension,
+    since the segments are concatenated without converting them
+
+    Parameters
+    ----------
+    url : str
+        The url of the master or media playlist
+    file_path : str
+        The path of the file to write
+    max_workers : int
+        The maximum number of concurrent segment downloads
+    progress_callback : Callable, optional
+        The function that is called with the number of written segments and the total number of segments
+
+    Returns
+    -------
+    str, optional
+        The path of the downloaded file, or None if the download failed
+    """
+    playlist = load_media_playlist(url)
+    if not playlist:
+        return None
+    if playlist.encrypted:
+        print("Can't download the HLS stream; encrypted streams are not supported!")
+        return None
+    if not playlist.segments:
+        print("Can't download the HLS stream; the playlist has no segments!")
+        return None
+    if not playlist.ended:
+        print("The HLS stream is live; only the segments that are currently available will be downloaded")
+
+    file_path = os.path.splitext(file_path)[0] + playlist.segment_extension
+    # Fragmented MP4 segments need their initialization segment first
+    segment_urls = ([playlist.init_segment] if playlist.init_segment else []) + playlist.segments
+    if not download_segments(segment_urls, file_path, max_workers, progress_callback):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return None
+    return file_path
+
+
+def test():
+    playlist = parse_hls_playlist("#EXTM3U\n#EXT-X-TARGETDURATION:10\n#EXTINF:10.0,\nsegment0.ts\n#EXTINF:9.5,\nsegment1.ts\n#EXT-X-ENDLIST\n",
+        "https://example.com/audio/index.m3u8")
+    print(playlist.segments, playlist.duration, playlist.ended, playlist.segment_extension)
+
+if __name__ == "__main__":
+    test()
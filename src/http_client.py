@@ -0,0 +1,259 @@
+"""
+A shared HTTP client for all of the app's network requests.
+
+Requests made through the client reuse pooled keep-alive connections (per host), so repeated requests to the same
+server skip the TCP and TLS handshakes. Every request has a connect and read time out, and idempotent requests
+(GET and HEAD) are retried with exponential backoff on connection errors and temporary server errors.
+Hosts that keep failing after the retries are skipped for a cool down period by per-host circuit breakers.
+"""
+
+import http.client
+import threading
+import time
+from typing import Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from circuit_breaker import CircuitBreakers, circuit_breakers
+
+# Retry on rate limits and temporary server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RequestTiming:
+    """
+    Timing information about a completed request
+    """
+
+    def __init__(self, method: str, url: str, status_code: Optional[int], elapsed: float, error: Optional[str]=None) -> None:
+        """
+        Parameters
+        ----------
+        method : str
+            The HTTP method
+        url : str
+            The requested url
+        status_code : int, optional
+            The response status code, or None if the request failed
+        elapsed : float
+            The time in milliseconds until the response headers were received (including retries)
+        error : str, optional
+            The error message if the request failed
+
+        Returns
+        -------
+        None
+        """
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.error = error
+
+    def __str__(self) -> str:
+        return f"{self.method} {self.url}: {self.error or self.status_code} in {self.elapsed:.1f}ms"
+
+
+class HttpClient:
+    """
+    A thread-safe HTTP client with pooled connections, default time outs, retries and timing hooks
+    """
+
+    def __init__(self, timeout: tuple[float, float]=(3.05, 10.0), retries: int=3, backoff_factor: float=0.3,
+        pool_connections: int=16, pool_maxsize: int=16, verify: bool=False, breakers: Optional[CircuitBreakers]=circuit_breakers) -> None:
+        """
+        Parameters
+        ----------
+        timeout : tuple[float, float]
+            The default connect and read time outs in seconds
+        retries : int
+            The maximum number of retries of GET and HEAD requests
+        backoff_factor : float
+            The backoff between retries in seconds (doubled after each retry)
+        pool_connections : int
+            The number of hosts to keep connection pools for
+        pool_maxsize : int
+            The maximum number of keep-alive connections per host
+        verify : bool
+            Whether to verify TLS certificates (many radio stations use invalid certificates)
+        breakers : CircuitBreakers, optional
+            The per-host circuit breakers (shared by default). If None, requests are always sent
+
+        Returns
+        -------
+        None
+        """
+        self.timeout = timeout
+        self.verify = verify
+        self.breakers = breakers
+        self._hooks = []
+        self._hooks_lock = threading.Lock()
+
+        # Retry-After isn't followed, since it is uncapped (e.g. an hour) and requests are sent from the GUI thread.
+        # Retries use the short exponential backoff instead, and hosts that keep failing are handled by the circuit breakers
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES, allowed_methods=frozenset({"GET", "HEAD"}), raise_on_status=False,
+            respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def add_timing_hook(self, hook: Callable[[RequestTiming], None]) -> None:
+        """
+        Adds a function that is called with the timing information of every request
+
+        Parameters
+        ----------
+        hook : Callable
+            The function to call with a RequestTiming
+
+        Returns
+        -------
+        None
+        """
+        with self._hooks_lock:
+            self._hooks.append(hook)
+
+    def remove_timing_hook(self, hook: Callable[[RequestTiming], None]) -> None:
+        """
+        Removes a timing hook
+
+        Parameters
+        ----------
+        hook : Callable
+            The function that was added
+
+        Returns
+        -------
+        None
+        """
+        with self._hooks_lock:
+            if hook in self._hooks:
+                self._hooks.remove(hook)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request using the pooled connections.
+        Uses the client's time out and certificate verification unless they are passed in
+
+        Parameters
+        ----------
+        method : str
+            The HTTP method
+        url : str
+            The url
+        **kwargs
+            The keyword arguments of requests.Session.request (e.g. headers, stream)
+
+        Returns
+        -------
+        Response
+            The response (close it, or use it in a with block, when streaming so the connection returns to the pool)
+
+        Raises
+        ------
+        requests.exceptions.RequestException
+            If the request failed after the retries, or the host's circuit breaker is open (CircuitOpenError)
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        breaker = self.breakers.get(url) if self.breakers else None
+        if breaker:
+            breaker.before_request()
+
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception as e:
+            # Only failures of the host count (not e.g. invalid urls or Shoutcast servers that reply with "ICY 200 OK")
+            if breaker and isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)) \
+                and not is_bad_status_line(e):
+                breaker.record_failure()
+            elif breaker:
+                breaker.release()
+            self._call_hooks(RequestTiming(method, url, None, (time.perf_counter() - start) * 1000.0, str(e)))
+            raise
+        if breaker:
+            # Server errors that remain after the retries count as failures; any other response means the host is up
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        self._call_hooks(RequestTiming(method, url, response.status_code, (time.perf_counter() - start) * 1000.0))
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a GET request (see request)
+        """
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a HEAD request (see request)
+        """
+        kwargs.setdefault("allow_redirects", True)
+        return self.request("HEAD", url, **kwargs)
+
+    def close(self) -> None:
+        """
+        Closes the pooled connections
+
+        Returns
+        -------
+        None
+        """
+        self.session.close()
+
+    def _call_hooks(self, timing: RequestTiming) -> None:
+        """
+        Calls the timing hooks, ignoring their errors
+        """
+        with self._hooks_lock:
+            hooks = list(self._hooks)
+        for hook in hooks:
+            try:
+                hook(timing)
+            except Exception as e:
+                print(f"Timing hook error: {e}")
+
+
+def is_bad_status_line(error: Optional[BaseException]) -> bool:
+    """
+    Returns whether an error was caused by a status line that isn't HTTP (e.g. Shoutcast's "ICY 200 OK")
+
+    Parameters
+    ----------
+    error : BaseException, optional
+        The error raised by a request
+
+    Returns
+    -------
+    bool
+        Whether the error (or an error it wraps) is a BadStatusLine
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, http.client.BadStatusLine):
+            return True
+        nested = [arg for arg in error.args if isinstance(arg, BaseException)]
+        error = nested[-1] if nested else error.__context__
+    return False
+
+
+http_client = HttpClient()
+# Stream probes should fail fast (e.g. Shoutcast servers that reply with "ICY 200 OK"), so they are not retried
+probe_client = HttpClient(retries=0)
+
+
+def test():
+    http_client.add_timing_hook(print)
+    for _ in range(3):
+        http_client.get("https://www.example.com").close()
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,359 @@
+"""
+Reads the now playing titles of Shoutcast/Icecast radio streams from their in-band ICY metadata.
+
+When a request has the "Icy-MetaData: 1" header, the server inserts a metadata block after every icy-metaint bytes
+of audio: one length byte (in 16 byte units), followed by e.g. StreamTitle='Artist - Title';StreamUrl='';
+The reader skips the audio without decoding it and only reports a title when it changes.
+"""
+
+import asyncio
+from datetime import datetime
+import re
+import ssl
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urljoin, urlsplit
+
+REDIRECT_STATUS_CODES = {301, 302, 303, 307, 308}
+USER_AGENT = "Libretto"
+
+_METADATA_FIELD_REGEX = re.compile(rb"(\w+)='(.*?)';", re.DOTALL)
+
+
+class IcyMetadata:
+    """
+    A now playing title change
+    """
+
+    def __init__(self, title: str, url: Optional[str], timestamp: datetime) -> None:
+        """
+        Parameters
+        ----------
+        title : str
+            The now playing title (usually "Artist - Title")
+        url : str, optional
+            The StreamUrl field (e.g. the cover art or website of the song)
+        timestamp : datetime
+            The time the title changed
+
+        Returns
+        -------
+        None
+        """
+        self.title = title
+        self.url = url
+        self.timestamp = timestamp
+
+    def __str__(self) -> str:
+        return f"[{self.timestamp.strftime('%H:%M:%S')}] {self.title}"
+
+
+class IcyStats:
+    """
+    The amount of data read by an ICY metadata reader
+    """
+
+    def __init__(self) -> None:
+        self.audio_bytes = 0
+        self.metadata_bytes = 0
+        self.metadata_blocks = 0
+        self.title_changes = 0
+        self.reconnects = 0
+
+    @property
+    def bytes_read(self) -> int:
+        """
+        The total number of body bytes read
+        """
+        return self.audio_bytes + self.metadata_bytes
+
+    @property
+    def metadata_overhead(self) -> float:
+        """
+        The fraction of the bytes read that were metadata (including the length bytes)
+        """
+        return self.metadata_bytes / self.bytes_read if self.bytes_read else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.bytes_read / 1e6:.2f}MB read ({self.metadata_overhead * 100.0:.3f}% metadata), "
+            f"{self.metadata_blocks} metadata blocks, {self.title_changes} title changes, {self.reconnects} reconnects")
+
+
+async def open_stream(url: str, timeout: float, max_redirects: int=3, icy_metadata: bool=False,
+    headers: Optional[dict[str, str]]=None) -> tuple[str, asyncio.StreamReader, asyncio.StreamWriter, int, dict[str, str]]:
+    """
+    Sends a GET request for a stream, following redirects, and reads the status line and headers.
+    Unlike HTTP clients, accepts Shoutcast's "ICY 200 OK" status line
+
+    Parameters
+    ----------
+    url : str
+        The url of the stream
+    timeout : float
+        The maximum time in seconds for connecting and for reading each line
+    max_redirects : int
+        The maximum number of redirects to follow
+    icy_metadata : bool
+        Whether to ask the server to insert ICY metadata blocks into the stream
+    headers : dict[str, str], optional
+        Extra request headers (e.g. If-None-Match)
+
+    Returns
+    -------
+    str
+        The final url (after redirects)
+    StreamReader
+        The reader of the response body
+    StreamWriter
+        The writer of the connection (close it when done)
+    int
+        The status code (0 if the status line couldn't be parsed)
+    dict[str, str]
+        The response headers, with lowercase names
+
+    Raises
+    ------
+    OSError, ValueError, asyncio.TimeoutError
+        If the connection failed or timed out, or there were too many redirects
+    """
+    extra_headers = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    for _ in range(max_redirects + 1):
+        parts = urlsplit(url)
+        if parts.scheme not in {"http", "https"}:
+            raise ValueError(f"Unsupported url scheme: {parts.scheme}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        context = None
+        if parts.scheme == "https":
+            # Many stations use invalid certificates
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(parts.hostname, port, ssl=context), timeout)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        # HTTP/1.0 responses are never chunked
+        writer.write((f"GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\nUser-Agent: {USER_AGENT}\r\n"
+            f"Accept: */*\r\nIcy-MetaData: {int(icy_metadata)}\r\n{extra_headers}Connection: close\r\n\r\n").encode())
+        await writer.drain()
+
+        status_line = (await asyncio.wait_for(reader.readline(), timeout)).decode("latin-1").split()
+        status_code = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else 0
+        headers = {}
+        while True:
+            line = (await asyncio.wait_for(reader.readline(), timeout)).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if status_code in REDIRECT_STATUS_CODES and headers.get("location"):
+            writer.close()
+            url = urljoin(url, headers["location"])
+            continue
+        return url, reader, writer, status_code, headers
+    raise ValueError("Too many redirects")
+
+def parse_metadata(block: bytes) -> dict[str, str]:
+    """
+    Parses an ICY metadata block (e.g. StreamTitle='Artist - Title';StreamUrl='';)
+
+    Parameters
+    ----------
+    block : bytes
+        The metadata block (without the length byte)
+
+    Returns
+    -------
+    dict[str, str]
+        The metadata fields
+    """
+    fields = {}
+    for name, value in _METADATA_FIELD_REGEX.findall(block.rstrip(b"\x00")):
+        # Most servers send UTF-8, but older ones send Latin-1
+        try:
+            fields[name.decode("ascii")] = value.decode("utf-8").strip()
+        except UnicodeDecodeError:
+            fields[name.decode("ascii")] = value.decode("latin-1").strip()
+    return fields
+
+async def read_icy_metadata(url: str, callback: Callable[[IcyMetadata], None], stats: Optional[IcyStats]=None,
+    timeout: float=10.0) -> bool:
+    """
+    Reads the ICY metadata of a stream until the connection ends, calling the callback whenever the title changes.
+    Many streams can be read concurrently on the same event loop
+
+    Parameters
+    ----------
+    url : str
+        The url of the stream
+    callback : Callable
+        The function that is called with an IcyMetadata when the title changes
+    stats : IcyStats, optional
+        The statistics to add the read bytes to
+    timeout : float
+        The maximum time in seconds for connecting and for each read
+
+    Returns
+    -------
+    bool
+        Whether the stream supports ICY metadata (False if the server didn't send icy-metaint)
+
+    Raises
+    ------
+    OSError, ValueError, asyncio.TimeoutError
+        If the connection failed, timed out or ended unexpectedly
+    """
+    stats = stats or IcyStats()
+    _, reader, writer, status_code, headers = await open_stream(url, timeout, icy_metadata=True)
+    try:
+        metaint = headers.get("icy-metaint", "")
+        if status_code != 200 or not metaint.isdigit() or int(metaint) <= 0:
+            return False
+        metaint = int(metaint)
+
+        title = None
+        while True:
+            # Skip the audio without keeping it
+            remaining = metaint
+            while remaining:
+                chunk = await asyncio.wait_for(reader.read(min(remaining, 65536)), timeout)
+                if not chunk:
+                    raise ConnectionError("The stream ended")
+                remaining -= len(chunk)
+                stats.audio_bytes += len(chunk)
+
+            length = (await asyncio.wait_for(reader.readexactly(1), timeout))[0] * 16
+            block = await asyncio.wait_for(reader.readexactly(length), timeout) if length else b""
+            stats.metadata_bytes += 1 + length
+            if not length:
+                # An empty block means the metadata hasn't changed
+                continue
+
+            stats.metadata_blocks += 1
+            fields = parse_metadata(block)
+            new_title = fields.get("StreamTitle")
+            if new_title is not None and new_title != title:
+                title = new_title
+                stats.title_changes += 1
+                callback(IcyMetadata(title, fields.get("StreamUrl") or None, datetime.now()))
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("The stream ended")
+    finally:
+        writer.close()
+
+
+class IcyMetadataReader:
+    """
+    Reads the ICY metadata of a stream on a background thread, reconnecting when the connection drops
+    """
+
+    def __init__(self, url: str, callback: Callable[[IcyMetadata], None], timeout: float=10.0, reconnect_delay: float=5.0) -> None:
+        """
+        Parameters
+        ----------
+        url : str
+            The url of the stream
+        callback : Callable
+            The function that is called (on the reader thread) with an IcyMetadata when the title changes
+        timeout : float
+            The maximum time in seconds for connecting and for each read
+        reconnect_delay : float
+            The time in seconds to wait before reconnecting
+
+        Returns
+        -------
+        None
+        """
+        self.url = url
+        self.callback = callback
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.stats = IcyStats()
+        self.now_playing = None
+        self.supported = None
+        self.thread = None
+        self._stopped = threading.Event()
+        self._loop = None
+        self._task = None
+
+    def start(self) -> threading.Thread:
+        """
+        Starts reading the metadata on a background thread
+
+        Returns
+        -------
+        Thread
+            The reader thread
+        """
+        self._stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self) -> None:
+        """
+        Stops reading the metadata and closes the connection
+
+        Returns
+        -------
+        None
+        """
+        self._stopped.set()
+        loop, task = self._loop, self._task
+        # The loop is closed once the reader thread exits (e.g. the stream doesn't support ICY metadata)
+        if loop and task and self.thread and self.thread.is_alive():
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # The loop closed after the check
+                pass
+
+    def _on_title(self, metadata: IcyMetadata) -> None:
+        """
+        Records the now playing title and calls the callback
+        """
+        self.now_playing = metadata
+        self.supported = True
+        try:
+            self.callback(metadata)
+        except Exception as e:
+            print(f"ICY metadata callback error: {e}")
+
+    def _run(self) -> None:
+        """
+        Reads the metadata until stopped or the stream doesn't support ICY metadata
+        """
+        self._loop = asyncio.new_event_loop()
+        try:
+            while not self._stopped.is_set():
+                self._task = self._loop.create_task(read_icy_metadata(self.url, self._on_title, self.stats, self.timeout))
+                try:
+                    self.supported = self._loop.run_until_complete(self._task)
+                    if not self.supported:
+                        print("The stream doesn't support ICY metadata")
+                        return
+                except asyncio.CancelledError:
+                    return
+                except (OSError, ValueError, asyncio.TimeoutError) as e:
+                    print(f"ICY metadata connection lost. Error: {e}")
+
+                if self._stopped.wait(self.reconnect_delay):
+                    return
+                self.stats.reconnects += 1
+        finally:
+            loop = self._loop
+            self._loop = None
+            self._task = None
+            loop.close()
+
+
+def test():
+    reader = IcyMetadataReader("http://stream.live.vc.bbcmedia.co.uk/bbc_world_service", print)
+    reader.start()
+    time.sleep(30)
+    reader.stop()
+    print(reader.stats)
+
+if __name__ == "__main__":
+    test()
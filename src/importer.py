@@ -0,0 +1,258 @@
+"""
+Imports batches of urls (e.g. the videos of a YouTube playlist) into the library.
+
+The import is a two stage pipeline. A bounded pool of workers resolves each url into its StreamData
+(page fetches, YouTube metadata, and the download if the playlist is downloaded), and a single writer stage
+(the thread running the import) inserts the resolved tracks into the database in batches.
+A url that fails doesn't stop the others; its error is reported in its result.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+import sqlalchemy as db
+
+from database import PlaylistManager
+from stream import StreamData
+
+
+class ImportResult:
+    """
+    The result of importing a single url
+    """
+
+    def __init__(self, url: str, track_id: Optional[int]=None, error: Optional[str]=None) -> None:
+        """
+        Parameters
+        ----------
+        url : str
+            The imported url
+        track_id : int, optional
+            The id of the imported track, or None if the import failed
+        error : str, optional
+            The error message if the import failed
+
+        Returns
+        -------
+        None
+        """
+        self.url = url
+        self.track_id = track_id
+        self.error = error
+
+    @property
+    def succeeded(self) -> bool:
+        """
+        Whether the url was imported
+        """
+        return self.track_id is not None
+
+    def __repr__(self) -> str:
+        return f"ImportResult({self.url!r}, track_id={self.track_id!r}, error={self.error!r})"
+
+
+class TrackImporter:
+    """
+    Imports urls into a playlist with concurrent metadata resolution and batched database writes
+    """
+
+    def __init__(self, playlist_name: Optional[str]=None, max_workers: int=4, batch_size: int=25, flush_interval: float=1.0,
+        progress_callback: Optional[Callable[[int, int, ImportResult], None]]=None,
+        resolver: Callable[[str], Any]=StreamData, bind: Optional[db.engine.Engine]=None) -> None:
+        """
+        Parameters
+        ----------
+        playlist_name : str, optional
+            The name of the playlist to add the tracks to (created if it doesn't exist).
+            If not specified, the tracks are created without a playlist
+        max_workers : int
+            The maximum number of urls resolved at the same time
+        batch_size : int
+            The maximum number of tracks inserted per database transaction
+        flush_interval : float
+            The maximum time in seconds resolved tracks wait before they are written
+        progress_callback : Callable, optional
+            The function that is called on the importing thread with the number of finished urls, the total number of urls
+            and the result of the last finished url
+        resolver : Callable
+            The function that resolves a url into its StreamData
+        bind : Engine, optional
+            The database engine to use. If not specified, uses the app database
+
+        Returns
+        -------
+        None
+        """
+        self.playlist_name = playlist_name
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.progress_callback = progress_callback
+        self.resolver = resolver
+        self.bind = bind
+        self.thread = None
+        self.results = []
+        self._cancelled = threading.Event()
+        self._download = False
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Whether the import was cancelled
+        """
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """
+        Stops the import. Urls that are already being resolved are still written; the remaining urls are skipped
+
+        Returns
+        -------
+        None
+        """
+        self._cancelled.set()
+
+    def run(self, urls: Iterable[str]) -> list[ImportResult]:
+        """
+        Imports urls, blocking until all of them are imported or the import is cancelled
+
+        Parameters
+        ----------
+        urls : Iterable[str]
+            The urls to import
+
+        Returns
+        -------
+        list[ImportResult]
+            The results of the finished urls, in the order they finished
+        """
+        urls = list(urls)
+        self.results = []
+        playlist_manager = PlaylistManager(self.bind)
+        playlist = playlist_manager.get_or_create_playlist(self.playlist_name) if self.playlist_name else None
+        # Downloads are done by the workers, so the writer only stores the paths
+        self._download = bool(playlist and playlist.downloaded)
+
+        start = time.perf_counter()
+        url_iterator = iter(urls)
+        pending = set()
+        batch = []
+        last_flush = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while True:
+                    # Keep at most two urls per worker queued, so cancelling doesn't leave much work behind
+                    while not self.cancelled and len(pending) < self.max_workers * 2:
+                        url = next(url_iterator, None)
+                        if url is None:
+                            break
+                        pending.add(executor.submit(self._resolve, url))
+                    if not pending:
+                        break
+
+                    done, pending = wait(pending, timeout=self.flush_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url, stream_data, path, error = future.result()
+                        if error:
+                            self._finish(ImportResult(url, error=error), len(urls))
+                        else:
+                            batch.append((url, stream_data, path))
+
+                    if len(batch) >= self.batch_size or (batch and time.perf_counter() - last_flush >= self.flush_interval):
+                        self._write(playlist_manager, playlist, batch, len(urls))
+                        batch, last_flush = [], time.perf_counter()
+            if batch:
+                self._write(playlist_manager, playlist, batch, len(urls))
+        finally:
+            playlist_manager.close_session()
+
+        imported = sum(result.succeeded for result in self.results)
+        print(f"Imported {imported} of {len(urls)} urls in {time.perf_counter() - start:.2f}s"
+            f"{' (cancelled)' if self.cancelled else ''}")
+        return self.results
+
+    def run_in_background(self, urls: Iterable[str], done_callback: Optional[Callable[[list[ImportResult]], None]]=None) -> threading.Thread:
+        """
+        Imports urls on a background thread
+
+        Parameters
+        ----------
+        urls : Iterable[str]
+            The urls to import
+        done_callback : Callable, optional
+            The function that is called with the results when the import ends
+
+        Returns
+        -------
+        Thread
+            The import thread
+        """
+        def run() -> None:
+            results = self.run(urls)
+            if done_callback:
+                done_callback(results)
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def _resolve(self, url: str) -> tuple[str, Any, Optional[str], Optional[str]]:
+        """
+        Resolves a url into its StreamData (and downloads it if the playlist is downloaded) on a worker thread.
+        Returns the url, StreamData, download path and error message
+        """
+        if self.cancelled:
+            return url, None, None, "Cancelled"
+        try:
+            stream_data = self.resolver(url)
+            path = stream_data.download_stream() if self._download else None
+            return url, stream_data, path, None
+        except Exception as e:
+            return url, None, None, f"{type(e).__name__}: {e}"
+
+    def _write(self, playlist_manager: PlaylistManager, playlist: Any, batch: list[tuple[str, Any, Optional[str]]], total: int) -> None:
+        """
+        Inserts a batch of resolved urls into the database
+        """
+        # YouTube streams are temporary, so store the video url instead
+        track_details = [{"title": stream_data.title, "artist": stream_data.artist, "album": stream_data.album,
+            "duration": stream_data.duration, "stream_url": stream_data.default_stream if not stream_data.youtube_streams else stream_data.url}
+            for _, stream_data, _ in batch]
+        # The whole batch is committed once, so either all of its tracks are stored or none of them are
+        try:
+            tracks = playlist_manager.get_or_create_tracks(track_details, commit=False)
+            for track, (_, stream_data, path) in zip(tracks, batch):
+                if path:
+                    track.path = path
+                    playlist_manager.add_tags_to_track(track, stream_data.genres, commit=False)
+            if playlist:
+                playlist_manager.add_tracks_to_playlist(tracks, playlist, commit=False)
+            playlist_manager.commit_session()
+        except db.exc.SQLAlchemyError as e:
+            playlist_manager.session.rollback()
+            for url, _, _ in batch:
+                self._finish(ImportResult(url, error=f"Database Error: {e}"), total)
+            return
+
+        for track, (url, _, _) in zip(tracks, batch):
+            self._finish(ImportResult(url, track_id=track.id), total)
+
+    def _finish(self, result: ImportResult, total: int) -> None:
+        """
+        Records the result of a url and reports the progress
+        """
+        self.results.append(result)
+        if not result.succeeded:
+            print(f"Could not import {result.url}. Error: {result.error}")
+        if self.progress_callback:
+            self.progress_callback(len(self.results), total, result)
+
+
+def test():
+    importer = TrackImporter("Imported Tracks", progress_callback=lambda finished, total, result: print(f"{finished}/{total}: {result}"))
+    importer.run(["https://www.youtube.com/watch?v=dQw4w9WgXcQ", "https://www.youtube.com/watch?v=invalid"])
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,248 @@
+"""
+Versioned schema migrations for existing databases.
+
+Base.metadata.create_all only creates missing tables, so changes to existing tables (new columns, indexes, triggers)
+are applied here. The schema version is stored in SQLite's user_version pragma.
+Each migration's schema change runs at startup in its own transaction and must be quick;
+filling in data for existing rows is done by the migration's backfill, in bounded batches on a background thread.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+import weakref
+
+import sqlalchemy as db
+
+
+class Migration:
+    def __init__(self, version: int, description: str, upgrade: Callable[[db.engine.Connection], None],
+        backfill: Optional[Callable[[db.engine.Connection, int], int]]=None) -> None:
+        """
+        Parameters
+        ----------
+        version : int
+            The schema version after the migration is applied
+        description : str
+            A short description of the schema change
+        upgrade : Callable
+            The function that applies the schema change to a connection.
+            It must also work on databases that were just created with the new schema
+        backfill : Callable, optional
+            The function that fills in data for at most batch_size existing rows and returns the number of rows it updated.
+            It is called repeatedly until it returns 0, so it must select the rows that still need updating
+
+        Returns
+        -------
+        None
+        """
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.backfill = backfill
+
+
+def column_exists(connection: db.engine.Connection, table: str, column: str) -> bool:
+    """
+    Returns whether a table has a column
+
+    Parameters
+    ----------
+    connection : Connection
+        The database connection
+    table : str
+        The table name
+    column : str
+        The column name
+
+    Returns
+    -------
+    bool
+        Whether the table has the column
+    """
+    return any(row[1] == column for row in connection.exec_driver_sql(f"PRAGMA table_info({table})"))
+
+def add_column(connection: db.engine.Connection, table: str, column: str, definition: str) -> None:
+    """
+    Adds a column to an existing table, unless the table already has it
+
+    Parameters
+    ----------
+    connection : Connection
+        The database connection
+    table : str
+        The table name
+    column : str
+        The column name
+    definition : str
+        The column type and constraints (e.g. "INTEGER DEFAULT 0")
+
+    Returns
+    -------
+    None
+    """
+    if not column_exists(connection, table, column):
+        connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _add_membership_indexes(connection: db.engine.Connection) -> None:
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_playlist_track_playlist_id_track_id ON playlist_track (playlist_id, track_id)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_playlist_track_track_id_playlist_id ON playlist_track (track_id, playlist_id)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_track_title ON track (title)")
+
+def _add_playlist_track_count(connection: db.engine.Connection) -> None:
+    add_column(connection, "playlist", "track_count", "INTEGER")
+    # Keep the counters up to date for every insert and delete, including bulk statements.
+    # Playlists that have not been backfilled yet (NULL) stay NULL
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS playlist_track_count_insert AFTER INSERT ON playlist_track
+        BEGIN
+            UPDATE playlist SET track_count = track_count + 1 WHERE id = NEW.playlist_id;
+        END
+    """)
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS playlist_track_count_delete AFTER DELETE ON playlist_track
+        BEGIN
+            UPDATE playlist SET track_count = track_count - 1 WHERE id = OLD.playlist_id;
+        END
+    """)
+
+def _backfill_playlist_track_count(connection: db.engine.Connection, batch_size: int) -> int:
+    return connection.exec_driver_sql("""
+        UPDATE playlist
+        SET track_count = (SELECT COUNT(*) FROM playlist_track WHERE playlist_track.playlist_id = playlist.id)
+        WHERE id IN (SELECT id FROM playlist WHERE track_count IS NULL LIMIT ?)
+    """, (batch_size,)).rowcount
+
+def _add_podcast_feed_synced_at(connection: db.engine.Connection) -> None:
+    add_column(connection, "podcast_feed", "synced_at", "DATETIME")
+
+
+# The migrations in version order. Never edit or reorder a released migration; add a new one instead
+MIGRATIONS = [
+    Migration(1, "Add playlist membership and track title indexes", _add_membership_indexes),
+    Migration(2, "Add playlist track counts", _add_playlist_track_count, _backfill_playlist_track_count),
+    Migration(3, "Add podcast feed sync markers", _add_podcast_feed_synced_at),
+]
+
+# The schema version of each engine upgraded in this process, so the migrations only run once per engine
+_upgraded_engines = weakref.WeakKeyDictionary()
+# The backfill thread of each engine
+_backfill_threads = weakref.WeakKeyDictionary()
+_upgrade_lock = threading.Lock()
+
+def get_schema_version(connection: db.engine.Connection) -> int:
+    """
+    Returns the schema version of the database
+
+    Parameters
+    ----------
+    connection : Connection
+        The database connection
+
+    Returns
+    -------
+    int
+        The schema version (0 for databases that were never migrated)
+    """
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+def is_upgraded(engine: db.engine.Engine) -> bool:
+    """
+    Returns whether the migrations were already applied to an engine in this process
+
+    Parameters
+    ----------
+    engine : Engine
+        The database engine
+
+    Returns
+    -------
+    bool
+        Whether the engine was upgraded
+    """
+    return engine in _upgraded_engines
+
+def upgrade(engine: db.engine.Engine, migrations: list[Migration]=MIGRATIONS, backfill_in_background: bool=True) -> int:
+    """
+    Applies the pending migrations, then starts the backfills on a background thread.
+    Each engine is only upgraded once per process; later calls return its schema version
+
+    Parameters
+    ----------
+    engine : Engine
+        The database engine
+    migrations : list[Migration]
+        The migrations in version order
+    backfill_in_background : bool
+        If set to false, runs the backfills on the calling thread before returning
+
+    Returns
+    -------
+    int
+        The schema version of the database
+    """
+    # Engines can be created from several threads (e.g. importer workers), so only one of them migrates
+    with _upgrade_lock:
+        if engine in _upgraded_engines:
+            return _upgraded_engines[engine]
+
+        with engine.connect() as connection:
+            version = get_schema_version(connection)
+            for migration in migrations:
+                if migration.version <= version:
+                    continue
+                print(f"Migrating the database to version {migration.version}: {migration.description}")
+                with connection.begin():
+                    migration.upgrade(connection)
+                    connection.exec_driver_sql(f"PRAGMA user_version = {int(migration.version)}")
+                version = migration.version
+        _upgraded_engines[engine] = version
+
+    # Backfills can be interrupted (e.g. by closing the app), so resume them once per run of each engine
+    backfills = [migration for migration in migrations if migration.backfill]
+    if not backfill_in_background:
+        run_backfills(engine, backfills)
+    elif backfills and engine not in _backfill_threads:
+        _backfill_threads[engine] = threading.Thread(target=run_backfills, args=(engine, backfills), daemon=True)
+        _backfill_threads[engine].start()
+    return version
+
+def run_backfills(engine: db.engine.Engine, migrations: list[Migration], batch_size: int=500, pause: float=0.01) -> None:
+    """
+    Runs the backfills of migrations in bounded batches, each in its own short transaction,
+    so the database stays available to other connections between batches
+
+    Parameters
+    ----------
+    engine : Engine
+        The database engine
+    migrations : list[Migration]
+        The migrations with backfills
+    batch_size : int
+        The maximum number of rows updated per transaction
+    pause : float
+        The time in seconds to wait between batches
+
+    Returns
+    -------
+    None
+    """
+    for migration in migrations:
+        start = time.perf_counter()
+        total = 0
+        try:
+            while True:
+                with engine.begin() as connection:
+                    updated = migration.backfill(connection, batch_size)
+                if not updated:
+                    break
+                total += updated
+                time.sleep(pause)
+        except db.exc.SQLAlchemyError as e:
+            # Unfinished rows are picked up again the next time the app starts
+            print(f"Could not finish the backfill for version {migration.version}. Error: {e}")
+            continue
+
+        if total:
+            print(f"Backfilled {total} rows for version {migration.version} in {time.perf_counter() - start:.2f}s")
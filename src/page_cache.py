@@ -0,0 +1,401 @@
+"""
+An on-disk HTTP cache for the web pages fetched to discover streams, so re-adding or refreshing a track doesn't
+download and scan its page again.
+
+Each page is stored with its ETag and Last-Modified validators, and is revalidated with a conditional GET:
+a 304 Not Modified reply reuses the stored page. The streams found in a page are stored with the hash of the page,
+so an unchanged page (revalidated, or downloaded again with the same content) skips the stream search entirely.
+The cache size is bounded, and the least recently used pages are evicted first.
+Pages can also be fetched on an asyncio event loop (fetch_async), with the file access and decoding run on a thread pool.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+import requests
+
+from charset import resolve_encoding
+from circuit_breaker import circuit_breakers
+from http_client import http_client
+from icy import open_stream
+
+# Default cache folder path
+CACHE_DIR = os.path.abspath(os.path.join("data", "cache", "pages"))
+# The maximum size of a page downloaded on the event loop
+ASYNC_MAX_BYTES = 20_000_000
+
+
+def hash_page(page: str) -> str:
+    """
+    Returns the hash of a page source
+
+    Parameters
+    ----------
+    page : str
+        The page source
+
+    Returns
+    -------
+    str
+        The SHA-1 hex digest of the UTF-8 encoded page
+    """
+    return hashlib.sha1(page.encode("utf-8", errors="replace")).hexdigest()
+
+async def _get_async(url: str, headers: dict[str, str], timeout: float, max_bytes: int=ASYNC_MAX_BYTES) -> tuple[int, dict[str, str], bytes]:
+    """
+    Downloads a page on the event loop, checking and updating the host's circuit breaker like the shared HTTP client.
+    Returns the status code, the (lowercase) response headers and the body
+    """
+    breaker = circuit_breakers.get(url)
+    breaker.before_request()
+    writer = None
+    try:
+        _, reader, writer, status_code, response_headers = await open_stream(url, timeout, headers=headers)
+        body = b""
+        while len(body) < max_bytes:
+            chunk = await asyncio.wait_for(reader.read(min(65536, max_bytes - len(body))), timeout)
+            if not chunk:
+                break
+            body += chunk
+    except (OSError, asyncio.TimeoutError, ValueError) as e:
+        breaker.record_failure()
+        raise requests.exceptions.ConnectionError(f"Could not open {url}: {e or type(e).__name__}")
+    finally:
+        if writer:
+            writer.close()
+    if status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return status_code, response_headers, body
+
+
+class PageCache:
+    """
+    A thread-safe, size bounded on-disk cache of web pages and the streams found in them
+    """
+
+    def __init__(self, cache_dir: str=CACHE_DIR, max_bytes: int=50_000_000) -> None:
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            The folder of the cache
+        max_bytes : int
+            The maximum total size of the cached pages in bytes
+
+        Returns
+        -------
+        None
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # The size and last access time of each cached page (loaded from the cache folder on first use)
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def fetch(self, url: str) -> str:
+        """
+        Returns the decoded source of a page, revalidating the cached copy with a conditional GET
+
+        Parameters
+        ----------
+        url : str
+            The url of the page
+
+        Returns
+        -------
+        str
+            The page source
+
+        Raises
+        ------
+        requests.exceptions.RequestException
+            If the page couldn't be opened
+        """
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        metadata = self._read_metadata(key)
+
+        response = http_client.get(url, headers=self._get_conditional_headers(metadata))
+        page = self._get_revalidated_page(key, metadata, response.status_code)
+        if page is not None:
+            return page
+        if response.status_code == 304:
+            # The page file is missing, so download the page again
+            response = http_client.get(url)
+        response.raise_for_status()
+        return self._store_response(key, url, metadata, response.headers, response.content)
+
+    async def fetch_async(self, url: str, timeout: Optional[float]=None) -> str:
+        """
+        Returns the decoded source of a page like fetch, downloading it on the running event loop.
+        The cache files are read and written, and the page is decoded, on the loop's default thread pool
+
+        Parameters
+        ----------
+        url : str
+            The url of the page
+        timeout : float, optional
+            The maximum time in seconds for connecting and for each read. If not specified, uses the HTTP client's read time out
+
+        Returns
+        -------
+        str
+            The page source
+
+        Raises
+        ------
+        requests.exceptions.RequestException
+            If the page couldn't be opened
+        """
+        loop = asyncio.get_running_loop()
+        timeout = timeout or http_client.timeout[1]
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        metadata = await loop.run_in_executor(None, self._read_metadata, key)
+
+        status_code, headers, body = await _get_async(url, self._get_conditional_headers(metadata), timeout)
+        page = await loop.run_in_executor(None, self._get_revalidated_page, key, metadata, status_code)
+        if page is not None:
+            return page
+        if status_code == 304:
+            # The page file is missing, so download the page again
+            status_code, headers, body = await _get_async(url, {}, timeout)
+        if status_code >= 400 or status_code == 0:
+            raise requests.exceptions.HTTPError(f"{status_code} Error for url: {url}")
+        return await loop.run_in_executor(None, self._store_response, key, url, metadata, headers, body)
+
+    def get_streams(self, url: str, page_hash: str) -> Optional[list[str]]:
+        """
+        Returns the streams stored for a page, if they were found in the same page source
+
+        Parameters
+        ----------
+        url : str
+            The url of the page
+        page_hash : str
+            The hash of the page source (see hash_page)
+
+        Returns
+        -------
+        list[str], optional
+            The stream urls, or None if the page has changed or its streams weren't stored
+        """
+        metadata = self._read_metadata(hashlib.sha1(url.encode("utf-8")).hexdigest())
+        if metadata and metadata.get("page_hash") == page_hash:
+            return metadata.get("streams")
+        return None
+
+    def put_streams(self, url: str, page_hash: str, streams: list[str]) -> None:
+        """
+        Stores the streams found in a cached page
+
+        Parameters
+        ----------
+        url : str
+            The url of the page
+        page_hash : str
+            The hash of the page source the streams were found in
+        streams : list[str]
+            The stream urls
+
+        Returns
+        -------
+        None
+        """
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        metadata = self._read_metadata(key)
+        if not metadata or metadata.get("page_hash") != page_hash:
+            return
+        metadata["streams"] = streams
+        try:
+            self._write_json(self._get_path(key, "json"), metadata)
+        except OSError as e:
+            print(f"Could not write the streams to the cache. Error: {e}")
+
+    def clear(self) -> None:
+        """
+        Removes all of the cached pages
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            for key in list(self._load_entries()):
+                self._remove(key)
+
+    def __str__(self) -> str:
+        with self._lock:
+            entries = self._load_entries()
+            size = sum(entry_size for entry_size, _ in entries.values())
+        return f"{len(entries)} pages ({size / 1e6:.1f}MB), {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+    def _get_conditional_headers(self, metadata: Optional[dict[str, Any]]) -> dict[str, str]:
+        """
+        Returns the If-None-Match and If-Modified-Since headers that revalidate a cached page
+        """
+        headers = {}
+        if metadata and metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata and metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+        return headers
+
+    def _get_revalidated_page(self, key: str, metadata: Optional[dict[str, Any]], status_code: int) -> Optional[str]:
+        """
+        Returns the cached page if the server replied 304 Not Modified, or None if it has to be downloaded
+        """
+        if status_code != 304 or not metadata:
+            return None
+        page = self._read_page(key)
+        if page is not None:
+            self.hits += 1
+            self._touch(key)
+        return page
+
+    def _store_response(self, key: str, url: str, metadata: Optional[dict[str, Any]], headers: Any, body: bytes) -> str:
+        """
+        Decodes a downloaded page and stores it with its validators. Returns the page source
+        """
+        self.misses += 1
+        # Decoding the page source (without running charset detection over the whole page)
+        encoding, _ = resolve_encoding(headers.get("content-type", ""), body)
+        page = str(body, encoding, errors="replace")
+        page_hash = hash_page(page)
+
+        new_metadata = {"url": url, "etag": headers.get("etag"), "last_modified": headers.get("last-modified"),
+            "page_hash": page_hash, "stored_at": time.time()}
+        # The content is unchanged, so the streams found in it still apply
+        if metadata and metadata.get("page_hash") == page_hash:
+            new_metadata["streams"] = metadata.get("streams")
+        self._store(key, new_metadata, page)
+        return page
+
+    def _get_path(self, key: str, extension: str) -> str:
+        """
+        Returns the path of a cache file
+        """
+        return os.path.join(self.cache_dir, f"{key}.{extension}")
+
+    def _load_entries(self) -> dict[str, list]:
+        """
+        Returns the size and last access time of each cached page, scanning the cache folder on first use.
+        Must be called with the lock held
+        """
+        if self._entries is None:
+            self._entries = {}
+            if os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    key, extension = os.path.splitext(name)
+                    if extension == ".html":
+                        stat = os.stat(os.path.join(self.cache_dir, name))
+                        self._entries[key] = [stat.st_size, stat.st_mtime]
+        return self._entries
+
+    def _read_metadata(self, key: str) -> Optional[dict[str, Any]]:
+        """
+        Returns the metadata of a cached page, or None if the page isn't cached
+        """
+        try:
+            with open(self._get_path(key, "json"), encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Could not read the cached page. Error: {e}")
+            return None
+
+    def _read_page(self, key: str) -> Optional[str]:
+        """
+        Returns the source of a cached page, or None if it is missing
+        """
+        try:
+            with open(self._get_path(key, "html"), encoding="utf-8") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def _write_json(self, path: str, data: dict[str, Any]) -> None:
+        """
+        Writes a JSON file through a temporary file, so a crash can't leave a partial file
+        """
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temporary_path, path)
+
+    def _store(self, key: str, metadata: dict[str, Any], page: str) -> None:
+        """
+        Stores a page and its metadata, then evicts the least recently used pages while the cache is too large
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            page_path = self._get_path(key, "html")
+            temporary_path = f"{page_path}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                file.write(page)
+            os.replace(temporary_path, page_path)
+            self._write_json(self._get_path(key, "json"), metadata)
+            size = os.path.getsize(page_path)
+        except OSError as e:
+            print(f"Could not write the page to the cache. Error: {e}")
+            return
+
+        with self._lock:
+            entries = self._load_entries()
+            entries[key] = [size, time.time()]
+            total = sum(entry_size for entry_size, _ in entries.values())
+            for old_key, (old_size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes or old_key == key:
+                    break
+                self._remove(old_key)
+                self.evictions += 1
+                total -= old_size
+
+    def _touch(self, key: str) -> None:
+        """
+        Marks a page as recently used (the access time is the page file's modification time, so it survives restarts)
+        """
+        now = time.time()
+        try:
+            os.utime(self._get_path(key, "html"), (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            entry = self._load_entries().get(key)
+            if entry:
+                entry[1] = now
+
+    def _remove(self, key: str) -> None:
+        """
+        Removes the files of a cached page. Must be called with the lock held
+        """
+        self._entries.pop(key, None)
+        for extension in ("html", "json"):
+            try:
+                os.remove(self._get_path(key, extension))
+            except OSError:
+                pass
+
+
+page_cache = PageCache()
+
+
+def test():
+    url = "https://www.example.com"
+    for _ in range(3):
+        start = time.perf_counter()
+        page = page_cache.fetch(url)
+        print(f"{len(page)} characters in {(time.perf_counter() - start) * 1000.0:.1f}ms")
+    print(page_cache)
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,126 @@
+"""
+Extracts the <title> of web pages without parsing the whole page.
+
+Pages are fed to an HTML tokenizer in chunks, and reading stops as soon as the title ends (or the <head> ends,
+or the <body> starts, without a title). When fetching a page, the response is streamed, so only the start of
+the page is downloaded, and at most max_bytes are read from pages whose head never ends.
+"""
+
+import codecs
+from html.parser import HTMLParser
+from typing import Optional
+
+from charset import resolve_encoding
+from http_client import http_client
+
+# The maximum number of bytes read from a page (the head of most pages is much smaller)
+MAX_TITLE_BYTES = 262144
+
+
+class TitleParser(HTMLParser):
+    """
+    An HTML tokenizer that collects the text of the first <title> and stops when the title or the head ends
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.done = False
+        self._in_title = False
+        self._parts = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        if tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._parts)
+            self.done = True
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self._parts.append(data)
+
+
+def _normalize(title: Optional[str]) -> Optional[str]:
+    """
+    Removes the white space and line breaks inside a title
+    """
+    title = " ".join(title.split()) if title else ""
+    return title or None
+
+def extract_title(page: str, chunk_size: int=8192) -> Optional[str]:
+    """
+    Returns the title of a page, only tokenizing the page up to the end of the title
+
+    Parameters
+    ----------
+    page : str
+        The page source
+    chunk_size : int
+        The number of characters tokenized at a time
+
+    Returns
+    -------
+    str, optional
+        The title with normalized white space, or None if the page has no title
+    """
+    parser = TitleParser()
+    for start in range(0, len(page), chunk_size):
+        parser.feed(page[start:start + chunk_size])
+        if parser.done:
+            break
+    return _normalize(parser.title)
+
+def fetch_title(url: str, max_bytes: int=MAX_TITLE_BYTES, chunk_size: int=8192) -> Optional[str]:
+    """
+    Downloads the start of a page and returns its title. The download stops as soon as the title is found
+
+    Parameters
+    ----------
+    url : str
+        The url of the page
+    max_bytes : int
+        The maximum number of bytes to download
+    chunk_size : int
+        The number of bytes read at a time
+
+    Returns
+    -------
+    str, optional
+        The title with normalized white space, or None if the page has no title
+
+    Raises
+    ------
+    requests.exceptions.RequestException
+        If the page couldn't be opened
+    """
+    parser = TitleParser()
+    with http_client.get(url, stream=True) as response:
+        response.raise_for_status()
+        decoder = None
+        bytes_read = 0
+        for chunk in response.iter_content(chunk_size):
+            if decoder is None:
+                # The encoding is resolved from the headers and the first chunk
+                encoding, _ = resolve_encoding(response.headers.get("Content-Type", ""), chunk)
+                decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            parser.feed(decoder.decode(chunk))
+            bytes_read += len(chunk)
+            if parser.done or bytes_read >= max_bytes:
+                break
+    return _normalize(parser.title)
+
+
+def test():
+    print(extract_title("<html><head><meta charset='utf-8'><title>\n  Radio &amp; Podcasts\n</title></head><body></body></html>"))
+    print(fetch_title("https://www.example.com"))
+
+if __name__ == "__main__":
+    test()
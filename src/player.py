@@ -7,13 +7,19 @@ from youtubesearchpython import VideosSearch
 import pytube
 
 from PIL import ImageTk, Image, ImageDraw
-import requests
 from io import BytesIO
 
 from tkinter import Canvas, PhotoImage, Tk
 
-from stream import Stream, StreamData
+from stream import Stream, StreamData, StreamUtility
+from http_client import http_client
+from importer import TrackImporter
+from rate_limit import genius_limiter, youtube_limiter
 from database import Playlist, Track, playlist_manager
+from recommendation import similarity_index
+from station_monitor import station_monitor
+from podcast import is_feed_page, is_feed_url, podcast_sync
+from radio_import import RadioImporter
 
 
 genius = None
@@ -111,6 +117,10 @@ def init(canvas: Canvas, elapsed_time_text: int, track_slider: "Slider",
     gui_album_cover_art = album_cover_art
     gui_album_cover_art_image = album_cover_art_image
 
+    # Check the saved radio stations and fetch the new podcast episodes in the background
+    station_monitor.start()
+    podcast_sync.sync_in_background()
+
 def toggle_track_like(track: Track) -> None:
     """
     Add or remove a track from Liked Songs
@@ -135,6 +145,9 @@ def toggle_track_like(track: Track) -> None:
     liked_track = not liked_track
     gui_canvas.itemconfig(gui_heart_button, image=gui_heart_full_image if liked_track else gui_heart_empty_image)
 
+    # Update the recommendations affected by the "Liked Songs" change
+    similarity_index.refresh_in_background()
+
 def set_position(percent: float) -> None:
     if not stream:
         return
@@ -338,10 +351,20 @@ def play_track(track: Track) -> None:
     track_duration = Utils.get_formatted_time(track.duration)
     gui_canvas.itemconfig(gui_total_time_text, text=track_duration)
 
+    # Warn about stations that failed their recent background health checks
+    health = playlist_manager.get_station_health(track)
+    if health and not health.healthy:
+        print(f"The station failed its last {health.consecutive_failures} health check(s). Error: {health.error}")
+
     stream = Stream(track.stream.url, _update_elapsed_time)
     stream.set_loop(looping)
     stream.play()
 
+    # Store the genres VLC reports for the track as tags
+    genres = stream.get_genres()
+    if genres:
+        playlist_manager.add_tags_to_track(track, genres)
+
     playing = True
     configure_play_state()
 
@@ -392,6 +415,7 @@ def genre_search(genre: str, time_period: str="month", songs: int=20, results_ty
     dict
         A dictionary containing data about the songs
     """
+    genius_limiter.acquire()
     results = genius.charts(time_period=time_period, chart_genre=genre, per_page=songs)
     return results
 
@@ -409,6 +433,7 @@ def fuzzy_search(search_term: str) -> dict:
     dict
         A dictionary containing data about the search results
     """
+    genius_limiter.acquire()
     results = genius.search(search_term)
     return results
 
@@ -426,19 +451,47 @@ def get_song_yt(search_term: str) -> dict:
     dict
         A dictionary containing data about the search results
     """
+    youtube_limiter.acquire()
     videosSearch = VideosSearch(search_term, limit = 1)
     result = videosSearch.result()["result"][0]
     return result
 
 def add_track_manually(url: str, playlist_name: str):
+    # Resolve the videos of YouTube playlists concurrently and insert the tracks in batches
     if "playlist?list=" in url:
-        playlist = pytube.Playlist(url)
+        youtube_limiter.acquire()
+        urls = list(pytube.Playlist(url))
+        TrackImporter(playlist_name).run(urls)
+    elif StreamUtility.is_youtube_url(url):
+        TrackImporter(playlist_name).run([url])
+    elif is_feed_url(url):
+        # Subscribe to podcast feeds, so their new episodes are added when the app starts
+        print(podcast_sync.subscribe(url, playlist_name))
+    else:
+        # Download the page once, both to recognize feeds without a feed path and to find the streams of other pages
+        page = StreamUtility.fetch_page(url)
+        if page is not None and is_feed_page(page):
+            print(podcast_sync.subscribe(url, playlist_name))
+        else:
+            TrackImporter(playlist_name, resolver=lambda url: StreamData(url, page=page)).run([url])
 
-        for video_url in playlist:
-            StreamData(video_url).add_to_playlist(playlist_name)
-        return
+    # Update the recommendations affected by the new playlist tracks
+    similarity_index.refresh_in_background()
+
+def import_radio_directory(path: str) -> None:
+    """
+    Imports the stations of a CSV or JSON radio directory into the Radio playlist on a background thread
+
+    Parameters
+    ----------
+    path : str
+        The path of the directory file
 
-    StreamData(url).add_to_playlist(playlist_name)
+    Returns
+    -------
+    None
+    """
+    RadioImporter().run_in_background(path)
 
 def create_image(image_url: str, size: tuple[int, int], radius: Optional[int]=None) -> PhotoImage:
     """
@@ -809,7 +862,7 @@ class WebImage:
         None
         """
         try:
-            request = requests.get(url)
+            request = http_client.get(url, verify=True)
             self.image = Image.open(BytesIO(request.content))
             self.photoimage = ImageTk.PhotoImage(self.image)
         except Exception as e:
@@ -0,0 +1,337 @@
+"""
+Expands radio station playlists (PLS, M3U and XSPF) into their stream entries, so the best entry can be played
+as a single media (with its duration and metadata) instead of handing the whole playlist to a VLC media list player.
+
+The entries are probed concurrently and the first healthy audio stream to respond is used.
+Expansions are cached per playlist url, since station playlists rarely change.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+from typing import Optional
+from urllib.parse import urljoin
+import xml.etree.ElementTree as ElementTree
+
+from http_client import http_client
+from probe import ProbeResult, probe_stream
+
+# Playlist files are small; anything larger isn't a station playlist
+MAX_PLAYLIST_SIZE = 1024 * 1024
+PLAYLIST_EXTENSIONS = ("pls", "m3u", "m3u8", "xspf")
+
+
+class PlaylistEntry:
+    """
+    A stream entry of a playlist
+    """
+
+    def __init__(self, url: str, title: Optional[str]=None, length: Optional[int]=None) -> None:
+        """
+        Parameters
+        ----------
+        url : str
+            The url of the stream
+        title : str, optional
+            The title of the entry
+        length : int, optional
+            The length of the entry in seconds (None or negative for live streams)
+
+        Returns
+        -------
+        None
+        """
+        self.url = url
+        self.title = title
+        self.length = length
+
+    def __repr__(self) -> str:
+        return f"PlaylistEntry({self.url!r}, title={self.title!r}, length={self.length!r})"
+
+
+def is_hls_playlist(text: str) -> bool:
+    """
+    Returns whether an M3U8 playlist is an HLS playlist (media segments or variant streams) rather than a list of stations.
+    HLS playlists are played by VLC as a single stream, so they are not expanded
+
+    Parameters
+    ----------
+    text : str
+        The playlist contents
+
+    Returns
+    -------
+    bool
+        Whether the playlist is an HLS playlist
+    """
+    return "#EXT-X-" in text
+
+def parse_playlist(text: str, base_url: str="") -> list[PlaylistEntry]:
+    """
+    Parses the entries of a PLS, M3U or XSPF playlist. The format is detected from the contents
+
+    Parameters
+    ----------
+    text : str
+        The playlist contents
+    base_url : str, optional
+        The url of the playlist, used to resolve relative entry urls
+
+    Returns
+    -------
+    list[PlaylistEntry]
+        The entries in playlist order (empty if the playlist couldn't be parsed)
+    """
+    text = text.lstrip("\ufeff \t\r\n")
+    lowered = text[:512].lower()
+    if lowered.startswith("[playlist]"):
+        entries = _parse_pls(text)
+    elif lowered.startswith("<?xml") or lowered.startswith("<playlist"):
+        entries = _parse_xspf(text)
+    else:
+        entries = _parse_m3u(text)
+
+    for entry in entries:
+        entry.url = urljoin(base_url, entry.url)
+    return [entry for entry in entries if entry.url.startswith(("http://", "https://", "mms://", "rtsp://", "rtmp://"))]
+
+def _parse_pls(text: str) -> list[PlaylistEntry]:
+    """
+    Parses a PLS playlist (File1=..., Title1=..., Length1=...)
+    """
+    fields = {}
+    for line in text.splitlines():
+        key, separator, value = line.partition("=")
+        key = key.strip().lower()
+        if not separator:
+            continue
+        for name in ("file", "title", "length"):
+            if key.startswith(name) and key[len(name):].isdigit():
+                fields.setdefault(int(key[len(name):]), {})[name] = value.strip()
+
+    entries = []
+    for _, entry_fields in sorted(fields.items()):
+        if not entry_fields.get("file"):
+            continue
+        length = entry_fields.get("length", "")
+        entries.append(PlaylistEntry(entry_fields["file"], entry_fields.get("title") or None,
+            int(length) if length.lstrip("-").isdigit() else None))
+    return entries
+
+def _parse_m3u(text: str) -> list[PlaylistEntry]:
+    """
+    Parses an M3U playlist, including the #EXTINF:<length>,<title> lines of extended M3U
+    """
+    entries = []
+    title, length = None, None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.upper().startswith("#EXTINF:"):
+            info, _, title = line[len("#EXTINF:"):].partition(",")
+            # Attributes may follow the length (e.g. #EXTINF:-1 tvg-id="...",Title)
+            info = info.split()[0] if info.split() else ""
+            length = int(float(info)) if info.lstrip("-").replace(".", "", 1).isdigit() else None
+            title = title.strip() or None
+        elif not line.startswith("#"):
+            entries.append(PlaylistEntry(line, title, length))
+            title, length = None, None
+    return entries
+
+def _parse_xspf(text: str) -> list[PlaylistEntry]:
+    """
+    Parses an XSPF playlist (<track><location>...</location><title>...</title><duration>ms</duration></track>)
+    """
+    try:
+        root = ElementTree.fromstring(text)
+    except ElementTree.ParseError as e:
+        print(f"Could not parse the XSPF playlist. Error: {e}")
+        return []
+
+    entries = []
+    # Ignore the namespace ({http://xspf.org/ns/0/}track)
+    for track in root.iter():
+        if track.tag.rpartition("}")[-1] != "track":
+            continue
+        children = {child.tag.rpartition("}")[-1]: (child.text or "").strip() for child in track}
+        if not children.get("location"):
+            continue
+        duration = children.get("duration", "")
+        entries.append(PlaylistEntry(children["location"], children.get("title") or None,
+            int(duration) // 1000 if duration.isdigit() else None))
+    return entries
+
+
+class PlaylistCache:
+    """
+    A thread-safe cache of playlist expansions, keyed by the playlist url
+    """
+
+    def __init__(self, ttl: float=600.0) -> None:
+        """
+        Parameters
+        ----------
+        ttl : float
+            The time in seconds an expansion is kept
+
+        Returns
+        -------
+        None
+        """
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[tuple[list[PlaylistEntry], Optional[PlaylistEntry]]]:
+        """
+        Returns the cached entries and best entry of a playlist, or None if it isn't cached (or has expired)
+        """
+        with self._lock:
+            cached = self._entries.get(url)
+            if cached and cached[0] > time.monotonic():
+                return cached[1], cached[2]
+            self._entries.pop(url, None)
+            return None
+
+    def put(self, url: str, entries: list[PlaylistEntry], best_entry: Optional[PlaylistEntry], ttl: Optional[float]=None) -> None:
+        """
+        Caches the entries and best entry of a playlist, for ttl seconds (the cache's ttl by default)
+        """
+        with self._lock:
+            self._entries[url] = (time.monotonic() + (ttl if ttl is not None else self.ttl), entries, best_entry)
+
+    def invalidate(self, url: str) -> None:
+        """
+        Removes a playlist from the cache (e.g. when its best entry stopped working)
+        """
+        with self._lock:
+            self._entries.pop(url, None)
+
+
+playlist_cache = PlaylistCache()
+
+
+def expand_playlist(playlist_url: str, depth: int=2) -> Optional[list[PlaylistEntry]]:
+    """
+    Downloads and parses a playlist. Entries that are playlists themselves are expanded in place
+
+    Parameters
+    ----------
+    playlist_url : str
+        The url of the playlist
+    depth : int
+        The maximum nesting depth of playlists
+
+    Returns
+    -------
+    list[PlaylistEntry], optional
+        The stream entries, or None if the url isn't a station playlist (e.g. an HLS playlist) or couldn't be downloaded
+    """
+    try:
+        with http_client.get(playlist_url, stream=True) as response:
+            response.raise_for_status()
+            content = response.raw.read(MAX_PLAYLIST_SIZE, decode_content=True) or b""
+            encoding = response.encoding
+    except Exception as e:
+        print(f"Could not download the playlist. Error: {e}")
+        return None
+
+    try:
+        text = content.decode(encoding or "utf-8")
+    except (LookupError, UnicodeDecodeError):
+        text = content.decode("latin-1")
+    if is_hls_playlist(text):
+        return None
+
+    entries = []
+    for entry in parse_playlist(text, response.url):
+        if depth > 0 and _has_playlist_extension(entry.url):
+            nested_entries = expand_playlist(entry.url, depth - 1)
+            if nested_entries is not None:
+                entries.extend(nested_entries)
+                continue
+        entries.append(entry)
+    return entries
+
+def select_best_entry(entries: list[PlaylistEntry], max_workers: int=8, timeout: tuple[float, float]=(3.05, 5.0)) -> Optional[PlaylistEntry]:
+    """
+    Probes the entries concurrently and returns the first one that responds as a healthy audio stream.
+    If none of them do, returns the first one that responded without an error that rules it out
+    (e.g. Shoutcast servers that reply with "ICY 200 OK" can only be checked by VLC)
+
+    Parameters
+    ----------
+    entries : list[PlaylistEntry]
+        The playlist entries
+    max_workers : int
+        The maximum number of concurrent probes
+    timeout : tuple[float, float]
+        The connect and read time outs of each probe in seconds
+
+    Returns
+    -------
+    PlaylistEntry, optional
+        The best entry, or None if all of the entries failed
+    """
+    if not entries:
+        return None
+    if len(entries) == 1:
+        return entries[0]
+
+    fallback = None
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(entries)))
+    try:
+        futures = {executor.submit(probe_stream, entry.url, timeout, 1024): entry for entry in entries}
+        for future in as_completed(futures):
+            result, entry = future.result(), futures[future]
+            if not result.error and result.kind == ProbeResult.AUDIO:
+                return entry
+            if fallback is None and (result.protocol_error or (not result.error and result.kind == ProbeResult.UNKNOWN)):
+                fallback = entry
+    finally:
+        # Don't wait for the slower probes to finish
+        executor.shutdown(wait=False, cancel_futures=True)
+    return fallback
+
+def resolve_playlist(playlist_url: str) -> Optional[PlaylistEntry]:
+    """
+    Returns the best stream entry of a playlist, using the cached expansion if there is one
+
+    Parameters
+    ----------
+    playlist_url : str
+        The url of the playlist
+
+    Returns
+    -------
+    PlaylistEntry, optional
+        The best entry, or None if the playlist couldn't be expanded or has no healthy entries
+    """
+    cached = playlist_cache.get(playlist_url)
+    if cached:
+        return cached[1]
+
+    entries = expand_playlist(playlist_url)
+    if entries is None:
+        return None
+    best_entry = select_best_entry(entries)
+    print(f"Expanded the playlist into {len(entries)} entries; using {best_entry.url if best_entry else None}")
+    playlist_cache.put(playlist_url, entries, best_entry)
+    return best_entry
+
+def _has_playlist_extension(url: str) -> bool:
+    """
+    Returns whether a url has a playlist file extension
+    """
+    return url.split("?")[0].split("#")[0].rpartition(".")[-1].lower() in PLAYLIST_EXTENSIONS
+
+
+def test():
+    print(parse_playlist("[playlist]\nFile1=http://example.com:8000/stream\nTitle1=Example\nLength1=-1\nNumberOfEntries=1\n"))
+    print(parse_playlist("#EXTM3U\n#EXTINF:-1,Example\nhttp://example.com/live.mp3\n"))
+    print(parse_playlist('<?xml version="1.0"?><playlist xmlns="http://xspf.org/ns/0/"><trackList><track>'
+        '<location>http://example.com/live.ogg</location><title>Example</title></track></trackList></playlist>'))
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,550 @@
+"""
+Subscribes to podcast RSS and Atom feeds and stores their episodes as tracks in a playlist per podcast.
+
+Feeds are parsed with a streaming XML parser straight from the response, and each episode element is discarded
+once it is read, so memory stays constant on feeds with thousands of episodes. Re-syncs send the feed's ETag and
+Last-Modified validators (unchanged feeds reply with 304 Not Modified and no body) and stop reading at the first
+episode that is already stored, since feeds list the newest episodes first.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+import threading
+import time
+from typing import IO, Iterator, Optional
+from xml.etree import ElementTree
+
+import requests
+import sqlalchemy as db
+from sqlalchemy.dialects.sqlite import insert
+
+from database import Playlist, PlaylistManager, Track, engine, podcast_episode, podcast_feed
+from http_client import http_client
+from rate_limit import page_limiter
+
+# The elements of a single episode in RSS and Atom feeds
+EPISODE_ELEMENTS = {"item", "entry"}
+# The elements that contain the podcast title and image
+FEED_ELEMENTS = {"channel", "feed"}
+
+
+class Episode:
+    """
+    A podcast episode read from a feed
+    """
+
+    def __init__(self, guid: str, title: str, url: str, duration: int=0, published: Optional[datetime]=None,
+        image_url: Optional[str]=None) -> None:
+        """
+        Parameters
+        ----------
+        guid : str
+            The unique id of the episode in its feed
+        title : str
+            The episode title
+        url : str
+            The url of the episode audio
+        duration : int
+            The episode duration in seconds (0 if the feed doesn't specify it)
+        published : datetime, optional
+            The time the episode was published
+        image_url : str, optional
+            The url of the episode cover art
+
+        Returns
+        -------
+        None
+        """
+        self.guid = guid
+        self.title = title
+        self.url = url
+        self.duration = duration
+        self.published = published
+        self.image_url = image_url
+
+    def __repr__(self) -> str:
+        return f"Episode({self.title!r}, {self.url!r})"
+
+
+class FeedInfo:
+    """
+    The podcast details read from a feed (filled in while the feed is parsed)
+    """
+
+    def __init__(self) -> None:
+        self.title = None
+        self.author = None
+        self.image_url = None
+
+
+class SyncResult:
+    """
+    The result of syncing a podcast feed
+    """
+
+    def __init__(self, url: str) -> None:
+        """
+        Parameters
+        ----------
+        url : str
+            The feed url
+
+        Returns
+        -------
+        None
+        """
+        self.url = url
+        self.new_episodes = 0
+        # Whether the server replied that the feed hasn't changed since the last sync
+        self.not_modified = False
+        self.error = None
+        # The time in milliseconds the sync took
+        self.elapsed = 0.0
+
+    def __str__(self) -> str:
+        if self.error:
+            return f"{self.url}: {self.error}"
+        status = "not modified" if self.not_modified else f"{self.new_episodes} new episodes"
+        return f"{self.url}: {status} in {self.elapsed:.0f}ms"
+
+
+def _local_name(tag: str) -> str:
+    """
+    Returns the name of an element without its namespace (e.g. "{http://www.itunes.com/dtds/podcast-1.0.dtd}duration" -> "duration")
+    """
+    return tag.rpartition("}")[2]
+
+def parse_duration(text: Optional[str]) -> int:
+    """
+    Parses an episode duration in seconds ("3723") or as [hours:]minutes:seconds ("1:02:03")
+
+    Parameters
+    ----------
+    text : str, optional
+        The itunes:duration text
+
+    Returns
+    -------
+    int
+        The duration in seconds, or 0 if it can't be parsed
+    """
+    seconds = 0
+    try:
+        for part in (text or "").strip().split(":"):
+            seconds = seconds * 60 + int(float(part))
+    except ValueError:
+        return 0
+    return seconds
+
+def parse_date(text: Optional[str]) -> Optional[datetime]:
+    """
+    Parses an RSS (RFC 822) or Atom (ISO 8601) date
+
+    Parameters
+    ----------
+    text : str, optional
+        The date text
+
+    Returns
+    -------
+    datetime, optional
+        The date, or None if it can't be parsed
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+    try:
+        return parsedate_to_datetime(text)
+    except (TypeError, ValueError, IndexError):
+        pass
+    try:
+        return datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+def _parse_episode(element: ElementTree.Element) -> Optional[Episode]:
+    """
+    Reads an RSS <item> or Atom <entry> element, returning None if it has no audio
+    """
+    guid = title = url = image_url = duration = published = None
+    for child in element:
+        name = _local_name(child.tag)
+        text = (child.text or "").strip()
+        if name == "title":
+            title = text
+        elif name in {"guid", "id"}:
+            guid = text
+        elif name == "enclosure" and child.get("url"):
+            url = child.get("url")
+        elif name == "link" and child.get("rel") == "enclosure" and child.get("href"):
+            url = child.get("href")
+        elif name == "content" and child.get("url") and not url:
+            # Media RSS
+            url = child.get("url")
+        elif name == "duration":
+            duration = text
+        elif name in {"pubDate", "published"} or (name == "updated" and not published):
+            published = text
+        elif name == "image" and child.get("href"):
+            image_url = child.get("href")
+
+    if not url:
+        return None
+    return Episode(guid or url, title or url.rsplit("/", 1)[-1], url, parse_duration(duration), parse_date(published), image_url)
+
+def iter_episodes(source: IO[bytes], feed_info: Optional[FeedInfo]=None) -> Iterator[Episode]:
+    """
+    Parses a feed incrementally, yielding its episodes in feed order (usually newest first).
+    Each episode element is removed from the tree once it is read, so memory doesn't grow with the number of episodes
+
+    Parameters
+    ----------
+    source : file object
+        The feed (e.g. a streamed response body)
+    feed_info : FeedInfo, optional
+        Filled in with the podcast title, author and image as they are read
+
+    Returns
+    -------
+    Iterator[Episode]
+        The episodes with audio
+
+    Raises
+    ------
+    ElementTree.ParseError
+        If the feed isn't well-formed XML
+    """
+    feed_info = feed_info or FeedInfo()
+    # The open elements, from the root to the parent of the current element
+    parents = []
+    for event, element in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+
+        parents.pop()
+        name = _local_name(element.tag)
+        parent_name = _local_name(parents[-1].tag) if parents else None
+        if name in EPISODE_ELEMENTS:
+            episode = _parse_episode(element)
+            if parents:
+                parents[-1].remove(element)
+            if episode:
+                yield episode
+        elif parent_name in FEED_ELEMENTS:
+            text = (element.text or "").strip()
+            if name == "title" and not feed_info.title:
+                feed_info.title = text
+            elif name == "author" and not feed_info.author:
+                feed_info.author = text or None
+            elif name == "image" and not feed_info.image_url:
+                # itunes:image has an href, and the RSS image has a url element
+                feed_info.image_url = element.get("href") or element.findtext("url") or None
+            elif name in {"logo", "icon"} and not feed_info.image_url:
+                feed_info.image_url = text or None
+        elif parent_name == "author" and name == "name" and len(parents) > 1 and _local_name(parents[-2].tag) in FEED_ELEMENTS \
+            and not feed_info.author:
+            # Atom authors
+            feed_info.author = (element.text or "").strip() or None
+
+
+class PodcastSync:
+    """
+    Subscribes to podcast feeds and syncs their new episodes into the library
+    """
+
+    def __init__(self, bind: db.engine.Engine=engine, max_workers: int=8, batch_size: int=500) -> None:
+        """
+        Parameters
+        ----------
+        bind : Engine
+            The database engine
+        max_workers : int
+            The maximum number of feeds synced at the same time
+        batch_size : int
+            The maximum number of episodes inserted per database transaction
+
+        Returns
+        -------
+        None
+        """
+        self.engine = bind
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.thread = None
+
+    def subscribe(self, url: str, playlist_name: Optional[str]=None) -> SyncResult:
+        """
+        Subscribes to a podcast feed and syncs its episodes. If the feed is already subscribed and a playlist is specified,
+        its synced episodes are added to the playlist and its new episodes are added there from now on
+
+        Parameters
+        ----------
+        url : str
+            The feed url
+        playlist_name : str, optional
+            The playlist to add the episodes to. If not specified, uses a playlist named after the podcast
+            (or keeps the playlist of an existing subscription)
+
+        Returns
+        -------
+        SyncResult
+            The result of the first sync
+        """
+        if not playlist_name:
+            with self.engine.begin() as connection:
+                connection.execute(insert(podcast_feed).values(url=url).on_conflict_do_nothing(index_elements=["url"]))
+                feed_id = connection.execute(db.select(podcast_feed.c.id).where(podcast_feed.c.url == url)).scalar()
+            return self.sync_feed(feed_id)
+
+        playlist_manager = PlaylistManager(self.engine)
+        try:
+            playlist = playlist_manager.get_or_create_playlist(playlist_name)
+            with self.engine.begin() as connection:
+                feed = connection.execute(db.select(podcast_feed).where(podcast_feed.c.url == url)).first()
+                if feed is None:
+                    feed_id = connection.execute(insert(podcast_feed).values(url=url, playlist_id=playlist.id)).inserted_primary_key[0]
+                else:
+                    feed_id = feed.id
+                    connection.execute(podcast_feed.update().where(podcast_feed.c.id == feed_id).values(playlist_id=playlist.id))
+            if feed is not None and feed.playlist_id != playlist.id:
+                # Re-adding a subscribed feed to another playlist adds the episodes that were already synced
+                tracks = playlist_manager.session.query(Track).join(podcast_episode, podcast_episode.c.track_id == Track.id) \
+                    .filter(podcast_episode.c.feed_id == feed_id).all()
+                added = playlist_manager.add_tracks_to_playlist(tracks, playlist)
+                print(f"New episodes of the podcast are now added to {playlist_name}; added {added} synced episodes")
+        finally:
+            playlist_manager.close_session()
+        return self.sync_feed(feed_id)
+
+    def unsubscribe(self, url: str) -> None:
+        """
+        Stops syncing a podcast feed. The synced episodes stay in the library
+
+        Parameters
+        ----------
+        url : str
+            The feed url
+
+        Returns
+        -------
+        None
+        """
+        with self.engine.begin() as connection:
+            feed_id = connection.execute(db.select(podcast_feed.c.id).where(podcast_feed.c.url == url)).scalar()
+            connection.execute(podcast_episode.delete().where(podcast_episode.c.feed_id == feed_id))
+            connection.execute(podcast_feed.delete().where(podcast_feed.c.id == feed_id))
+
+    def sync_feed(self, feed_id: int) -> SyncResult:
+        """
+        Downloads a feed if it changed since the last sync, and stores its new episodes
+
+        Parameters
+        ----------
+        feed_id : int
+            The id of the podcast_feed row
+
+        Returns
+        -------
+        SyncResult
+            The number of new episodes, or whether the feed wasn't modified or couldn't be synced
+        """
+        start = time.perf_counter()
+        with self.engine.connect() as connection:
+            feed = connection.execute(db.select(podcast_feed).where(podcast_feed.c.id == feed_id)).first()
+        result = SyncResult(feed.url)
+
+        headers = {}
+        if feed.etag:
+            headers["If-None-Match"] = feed.etag
+        if feed.last_modified:
+            headers["If-Modified-Since"] = feed.last_modified
+
+        try:
+            page_limiter.acquire(feed.url)
+            with http_client.get(feed.url, headers=headers, stream=True) as response:
+                if response.status_code == 304:
+                    result.not_modified = True
+                    self._update_feed(feed_id, checked_at=datetime.now())
+                else:
+                    response.raise_for_status()
+                    # Decompress gzipped feeds while they are parsed
+                    response.raw.decode_content = True
+                    feed_info = FeedInfo()
+                    result.new_episodes = self._store_new_episodes(feed, iter_episodes(response.raw, feed_info), feed_info)
+                    # The whole feed was read, so later syncs can stop at the first stored episode
+                    now = datetime.now()
+                    self._update_feed(feed_id, title=feed_info.title or feed.title, etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"), checked_at=now, synced_at=now)
+        except requests.exceptions.RequestException as e:
+            result.error = f"URL Error: {e}"
+        except ElementTree.ParseError as e:
+            result.error = f"Invalid Feed: {e}"
+        except db.exc.SQLAlchemyError as e:
+            result.error = f"Database Error: {e}"
+
+        result.elapsed = (time.perf_counter() - start) * 1000.0
+        return result
+
+    def sync_all(self) -> list[SyncResult]:
+        """
+        Syncs all of the subscribed feeds concurrently
+
+        Returns
+        -------
+        list[SyncResult]
+            The results in the order the feeds were subscribed
+        """
+        with self.engine.connect() as connection:
+            feed_ids = connection.execute(db.select(podcast_feed.c.id).order_by(podcast_feed.c.id)).scalars().all()
+        if not feed_ids:
+            return []
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.sync_feed, feed_ids))
+
+        new_episodes = sum(result.new_episodes for result in results)
+        not_modified = sum(result.not_modified for result in results)
+        print(f"Synced {len(results)} podcasts in {time.perf_counter() - start:.2f}s; "
+            f"{new_episodes} new episodes, {not_modified} not modified, {sum(bool(result.error) for result in results)} failed")
+        return results
+
+    def sync_in_background(self) -> threading.Thread:
+        """
+        Syncs all of the subscribed feeds on a background thread (unless a sync is already running)
+
+        Returns
+        -------
+        Thread
+            The sync thread
+        """
+        if self.thread and self.thread.is_alive():
+            return self.thread
+
+        self.thread = threading.Thread(target=self.sync_all, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def _store_new_episodes(self, feed: db.engine.Row, episodes: Iterator[Episode], feed_info: FeedInfo) -> int:
+        """
+        Stores the episodes up to the first one that is already stored, in batches. Until a sync has read the whole feed,
+        stored episodes are skipped instead, so episodes missed by an interrupted sync are still found.
+        Returns the number of stored episodes
+        """
+        with self.engine.connect() as connection:
+            known_guids = set(connection.execute(
+                db.select(podcast_episode.c.guid).where(podcast_episode.c.feed_id == feed.id)).scalars())
+
+        playlist_manager = None
+        playlist = None
+        stored = 0
+        batch = []
+        try:
+            for episode in episodes:
+                if episode.guid in known_guids:
+                    # Feeds list the newest episodes first, so after a full sync the rest of the feed is already stored
+                    if feed.synced_at:
+                        break
+                    continue
+                known_guids.add(episode.guid)
+                batch.append(episode)
+                if len(batch) < self.batch_size:
+                    continue
+
+                if playlist_manager is None:
+                    playlist_manager, playlist = self._open_playlist(feed, feed_info)
+                stored += self._write(playlist_manager, playlist, feed, feed_info, batch)
+                batch = []
+
+            if batch:
+                if playlist_manager is None:
+                    playlist_manager, playlist = self._open_playlist(feed, feed_info)
+                stored += self._write(playlist_manager, playlist, feed, feed_info, batch)
+        finally:
+            if playlist_manager:
+                playlist_manager.close_session()
+        return stored
+
+    def _open_playlist(self, feed: db.engine.Row, feed_info: FeedInfo) -> tuple[PlaylistManager, Playlist]:
+        """
+        Opens a session and returns the playlist of a feed (creating a playlist named after the podcast on the first sync)
+        """
+        playlist_manager = PlaylistManager(self.engine)
+        playlist = playlist_manager.session.get(Playlist, feed.playlist_id) if feed.playlist_id else None
+        if playlist is None:
+            playlist = playlist_manager.get_or_create_playlist(feed_info.title or feed.title or feed.url)
+            self._update_feed(feed.id, playlist_id=playlist.id)
+        return playlist_manager, playlist
+
+    def _write(self, playlist_manager: PlaylistManager, playlist: Playlist, feed: db.engine.Row, feed_info: FeedInfo,
+        episodes: list[Episode]) -> int:
+        """
+        Inserts a batch of episodes as tracks of the podcast playlist in a single transaction
+        """
+        podcast_title = feed_info.title or feed.title or feed.url
+        tracks = [Track(title=episode.title, artist=feed_info.author or podcast_title, album=podcast_title,
+            duration=episode.duration, playlists=[], stream_url=episode.url, cover_art_url=episode.image_url or feed_info.image_url or "")
+            for episode in episodes]
+        playlist_manager.session.add_all(tracks)
+        playlist_manager.session.flush()
+        playlist_manager.session.execute(podcast_episode.insert(), [{"feed_id": feed.id, "guid": episode.guid,
+            "track_id": track.id, "published_at": episode.published} for episode, track in zip(episodes, tracks)])
+        # Commits the tracks, the episodes and the playlist membership together
+        playlist_manager.add_tracks_to_playlist(tracks, playlist)
+        return len(tracks)
+
+    def _update_feed(self, feed_id: int, **values) -> None:
+        """
+        Updates the columns of a podcast_feed row
+        """
+        with self.engine.begin() as connection:
+            connection.execute(podcast_feed.update().where(podcast_feed.c.id == feed_id).values(**values))
+
+
+def is_feed_url(url: str) -> bool:
+    """
+    Returns whether a url looks like a podcast feed by its path (without sending a request)
+
+    Parameters
+    ----------
+    url : str
+        The url
+
+    Returns
+    -------
+    bool
+        Whether the url path is a common RSS or Atom feed path
+    """
+    path = url.split("?")[0].split("#")[0].lower().rstrip("/")
+    return path.endswith((".rss", ".atom", "/feed", "/rss", "/podcast.xml", "/feed.xml", "/rss.xml"))
+
+def is_feed_page(page: str) -> bool:
+    """
+    Returns whether a downloaded page is an RSS or Atom feed, from the start of its source
+
+    Parameters
+    ----------
+    page : str
+        The page source
+
+    Returns
+    -------
+    bool
+        Whether the page is an RSS or Atom feed
+    """
+    head = page[:1024].lstrip("\ufeff \t\r\n").lower()
+    return head.startswith("<?xml") and ("<rss" in head or "<feed" in head) or head.startswith(("<rss", "<feed"))
+
+
+podcast_sync = PodcastSync()
+
+
+def test():
+    result = podcast_sync.subscribe("https://feeds.npr.org/510289/podcast.xml")
+    print(result)
+    print(podcast_sync.subscribe("https://feeds.npr.org/510289/podcast.xml"))
+
+if __name__ == "__main__":
+    test()
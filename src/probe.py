@@ -0,0 +1,154 @@
+import time
+
+import requests
+
+from http_client import is_bad_status_line, probe_client
+
+# Content types that identify each kind of stream response
+AUDIO_CONTENT_TYPES = {"application/ogg", "application/octet-stream", "video/mp4", "video/mp2t", "video/x-ms-asf"}
+PLAYLIST_CONTENT_TYPES = {"audio/x-scpls", "audio/scpls", "audio/x-mpegurl", "audio/mpegurl", "application/x-mpegurl",
+    "application/vnd.apple.mpegurl", "application/xspf+xml", "video/x-ms-asx", "audio/x-ms-wax"}
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+
+# File signatures at the start of audio streams (signature, offset)
+AUDIO_SIGNATURES = [(b"ID3", 0), (b"OggS", 0), (b"fLaC", 0), (b"ftyp", 4), (b"#!AMR", 0),
+    (b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", 0)]
+
+
+class ProbeResult:
+    """
+    The result of probing a stream url
+    """
+
+    AUDIO = "audio"
+    PLAYLIST = "playlist"
+    HTML = "html"
+    UNKNOWN = "unknown"
+
+    def __init__(self, url: str) -> None:
+        """
+        Parameters
+        ----------
+        url : str
+            The probed url
+
+        Returns
+        -------
+        None
+        """
+        self.url = url
+        self.final_url = url
+        self.status_code = None
+        self.headers = {}
+        self.content_type = ""
+        self.first_bytes = b""
+        self.kind = ProbeResult.UNKNOWN
+        # The error message if the stream could not be opened
+        self.error = None
+        # Whether the server replied with a response that requests can't parse (e.g. Shoutcast's "ICY 200 OK")
+        self.protocol_error = False
+        # Time to first byte in milliseconds
+        self.time_to_first_byte = None
+
+    def __str__(self) -> str:
+        if self.error:
+            return f"{self.url}: {self.error}"
+        return f"{self.url}: {self.kind} ({self.content_type or 'no content type'}, {self.time_to_first_byte:.0f}ms)"
+
+
+def classify_stream(content_type: str, first_bytes: bytes, url: str="") -> str:
+    """
+    Classifies a stream response as audio, a playlist, or an HTML page.
+    The first bytes (file signature) take precedence over the Content-Type header, since many servers mislabel streams
+
+    Parameters
+    ----------
+    content_type : str
+        The Content-Type header value
+    first_bytes : bytes
+        The first bytes of the response body
+    url : str, optional
+        The url of the stream (used for the file extension as a last resort)
+
+    Returns
+    -------
+    str
+        ProbeResult.AUDIO, ProbeResult.PLAYLIST, ProbeResult.HTML or ProbeResult.UNKNOWN
+    """
+    head = first_bytes.lstrip(b"\xef\xbb\xbf \t\r\n")
+    lowered_head = head[:512].lower()
+
+    if head.startswith(b"#EXTM3U") or lowered_head.startswith(b"[playlist]") or b"<playlist" in lowered_head \
+        or lowered_head.startswith(b"<asx"):
+        return ProbeResult.PLAYLIST
+    if lowered_head.startswith((b"<!doctype html", b"<html")) or b"<head" in lowered_head:
+        return ProbeResult.HTML
+    if any(head[offset:offset + len(signature)] == signature for signature, offset in AUDIO_SIGNATURES) \
+        or (head[:4] == b"RIFF" and head[8:12] == b"WAVE"):
+        return ProbeResult.AUDIO
+    # MPEG audio and ADTS (AAC) frames start with an 11/12-bit frame sync
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return ProbeResult.AUDIO
+
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in PLAYLIST_CONTENT_TYPES:
+        return ProbeResult.PLAYLIST
+    if content_type in HTML_CONTENT_TYPES:
+        return ProbeResult.HTML
+    if content_type.startswith("audio/") or content_type in AUDIO_CONTENT_TYPES:
+        return ProbeResult.AUDIO
+
+    ext = url.split("?")[0].split("#")[0].rpartition(".")[-1].lower()
+    if ext in {"pls", "m3u", "m3u8", "xspf", "asx"}:
+        return ProbeResult.PLAYLIST
+    return ProbeResult.UNKNOWN
+
+def probe_stream(stream_url: str, timeout: tuple[float, float]=(3.05, 5.0), max_bytes: int=8192) -> ProbeResult:
+    """
+    Opens a stream url and reads only the response headers and the first few KB of the body,
+    so endless radio streams and large podcast files are never downloaded
+
+    Parameters
+    ----------
+    stream_url : str
+        The url of the stream
+    timeout : tuple[float, float]
+        The connect and read time outs in seconds
+    max_bytes : int
+        The maximum number of body bytes to read
+
+    Returns
+    -------
+    ProbeResult
+        The status, headers, first bytes and kind of the stream
+    """
+    result = ProbeResult(stream_url)
+    start = time.perf_counter()
+    try:
+        response = probe_client.get(stream_url, stream=True, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        result.error = f"URL Error: {e}"
+        result.protocol_error = is_bad_status_line(e)
+        return result
+    except Exception as e:
+        # Not a RequestException error (e.g. unknown url type)
+        result.error = f"Error: {e}"
+        return result
+
+    result.time_to_first_byte = (time.perf_counter() - start) * 1000.0
+    with response:
+        result.final_url = response.url
+        result.status_code = response.status_code
+        result.headers = dict(response.headers)
+        result.content_type = response.headers.get("Content-Type", "")
+        try:
+            response.raise_for_status()
+            result.first_bytes = response.raw.read(max_bytes, decode_content=True) or b""
+        except requests.exceptions.HTTPError as e:
+            result.error = f"HTTP Error: {e}"
+        except Exception as e:
+            result.error = f"Read Error: {e}"
+
+    if not result.error:
+        result.kind = classify_stream(result.content_type, result.first_bytes, result.final_url)
+    return result
@@ -0,0 +1,394 @@
+"""
+Imports a directory of radio stations (thousands of stations from a local CSV or JSON file) into a "Radio" playlist.
+
+Stations are deduplicated by their canonical url (against the file and the library) before any request is sent.
+A bounded pool of workers then validates the streams with header-only probes (no VLC), while the importing thread
+writes the valid stations in batches, each in a single transaction.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import csv
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import sqlalchemy as db
+
+from database import PlaylistManager, Stream, Tag, Track
+from probe import ProbeResult, probe_stream
+
+# The column or key names of each field in station directories (e.g. radio-browser.info exports)
+NAME_KEYS = ("name", "title", "station")
+URL_KEYS = ("url_resolved", "url", "stream_url", "stream")
+TAG_KEYS = ("tags", "genre", "genres")
+IMAGE_KEYS = ("favicon", "logo", "image", "cover_art_url")
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class RadioStation:
+    """
+    A station read from a directory file
+    """
+
+    def __init__(self, name: str, url: str, tags: Optional[list[str]]=None, image_url: Optional[str]=None) -> None:
+        """
+        Parameters
+        ----------
+        name : str
+            The station name
+        url : str
+            The stream url
+        tags : list[str], optional
+            The genres of the station
+        image_url : str, optional
+            The url of the station logo
+
+        Returns
+        -------
+        None
+        """
+        self.name = name
+        self.url = url
+        self.tags = tags or []
+        self.image_url = image_url
+
+    def __repr__(self) -> str:
+        return f"RadioStation({self.name!r}, {self.url!r})"
+
+
+class RadioImportReport:
+    """
+    The counts and throughput of a radio directory import
+    """
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.elapsed = 0.0
+
+    @property
+    def stations_per_second(self) -> float:
+        """
+        The number of stations (including duplicates and invalid stations) processed per second
+        """
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (f"Imported {self.imported} of {self.total} stations in {self.elapsed:.2f}s ({self.stations_per_second:.1f} stations/s); "
+            f"{self.duplicates} duplicates, {self.invalid} invalid")
+
+
+def canonical_url(url: str) -> str:
+    """
+    Returns the canonical form of a stream url, so the same stream written differently is only imported once.
+    Lowercases the scheme and host, removes default ports, fragments and a trailing slash
+
+    Parameters
+    ----------
+    url : str
+        The stream url
+
+    Returns
+    -------
+    str
+        The canonical url
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    # Shoutcast's "/;" path is kept, since some servers need it to send the stream instead of their status page
+    path = parts.path.rstrip("/") if parts.path not in {"/", "/;"} else parts.path
+    return urlunsplit((scheme, host, path or "/", parts.query, ""))
+
+def _get_field(row: dict[str, Any], keys: tuple[str, ...]) -> Optional[Any]:
+    """
+    Returns the first non-empty value of a row under any of the keys (case-insensitive)
+    """
+    lowered = {str(key).strip().lower(): value for key, value in row.items()}
+    for key in keys:
+        value = lowered.get(key)
+        if value:
+            return value
+    return None
+
+def _parse_station(row: dict[str, Any]) -> Optional[RadioStation]:
+    """
+    Creates a station from a row of a directory file, or returns None if it has no http(s) stream url
+    """
+    url = str(_get_field(row, URL_KEYS) or "").strip()
+    if not url.lower().startswith(("http://", "https://")):
+        return None
+    name = " ".join(str(_get_field(row, NAME_KEYS) or "").split()) or urlsplit(url).hostname
+    tags = _get_field(row, TAG_KEYS) or []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    tags = [" ".join(str(tag).split()) for tag in tags if str(tag).strip()]
+    return RadioStation(name, url, tags, _get_field(row, IMAGE_KEYS))
+
+def load_directory(path: str) -> list[RadioStation]:
+    """
+    Reads the stations of a CSV file (with a header row) or a JSON file (a list of objects, or an object with a
+    "stations" list). Rows without an http(s) stream url are skipped
+
+    Parameters
+    ----------
+    path : str
+        The path of the .csv or .json file
+
+    Returns
+    -------
+    list[RadioStation]
+        The stations in file order
+    """
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        if os.path.splitext(path)[1].lower() == ".json":
+            rows = json.load(file)
+            if isinstance(rows, dict):
+                rows = rows.get("stations", [])
+        else:
+            rows = list(csv.DictReader(file))
+    return [station for station in map(_parse_station, rows) if isinstance(station, RadioStation)]
+
+def validate_station(station: RadioStation) -> tuple[RadioStation, bool, str]:
+    """
+    Checks a station stream with a header-only probe (the headers and the first KB)
+
+    Parameters
+    ----------
+    station : RadioStation
+        The station
+
+    Returns
+    -------
+    RadioStation
+        The station
+    bool
+        Whether the stream is valid
+    str
+        The probe result or error
+    """
+    result = probe_stream(station.url, max_bytes=1024)
+    # Shoutcast servers reply with "ICY 200 OK", which is a valid stream
+    if result.protocol_error:
+        return station, True, "ICY stream"
+    if result.error:
+        return station, False, result.error
+    # Unrecognized content is kept (the station monitor checks it again later); web pages are not streams
+    return station, result.kind != ProbeResult.HTML, str(result)
+
+
+class RadioImporter:
+    """
+    Imports station directories with concurrent validation and batched database writes
+    """
+
+    def __init__(self, playlist_name: str="Radio", max_workers: int=32, batch_size: int=200,
+        progress_callback: Optional[Callable[[int, int], None]]=None,
+        validator: Callable[[RadioStation], tuple[RadioStation, bool, str]]=validate_station,
+        bind: Optional[db.engine.Engine]=None) -> None:
+        """
+        Parameters
+        ----------
+        playlist_name : str
+            The name of the playlist to add the stations to (created if it doesn't exist)
+        max_workers : int
+            The maximum number of streams validated at the same time
+        batch_size : int
+            The maximum number of stations inserted per database transaction
+        progress_callback : Callable, optional
+            The function that is called on the importing thread with the number of processed stations and the total
+        validator : Callable
+            The function that checks a station stream
+        bind : Engine, optional
+            The database engine to use. If not specified, uses the app database
+
+        Returns
+        -------
+        None
+        """
+        self.playlist_name = playlist_name
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+        self.validator = validator
+        self.bind = bind
+        self.thread = None
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """
+        Stops the import. Stations that are already being validated are still written
+
+        Returns
+        -------
+        None
+        """
+        self._cancelled.set()
+
+    def import_file(self, path: str) -> RadioImportReport:
+        """
+        Imports the stations of a CSV or JSON directory file
+
+        Parameters
+        ----------
+        path : str
+            The path of the file
+
+        Returns
+        -------
+        RadioImportReport
+            The counts and throughput of the import
+        """
+        return self.run(load_directory(path))
+
+    def run(self, stations: Iterable[RadioStation]) -> RadioImportReport:
+        """
+        Deduplicates, validates and imports stations, blocking until all of them are processed or the import is cancelled
+
+        Parameters
+        ----------
+        stations : Iterable[RadioStation]
+            The stations
+
+        Returns
+        -------
+        RadioImportReport
+            The counts and throughput of the import
+        """
+        stations = list(stations)
+        report = RadioImportReport()
+        report.total = len(stations)
+        start = time.perf_counter()
+
+        playlist_manager = PlaylistManager(self.bind)
+        try:
+            playlist = playlist_manager.get_or_create_playlist(self.playlist_name)
+            # Skip the stations that are already in the library or earlier in the file
+            seen = {canonical_url(url) for url, in playlist_manager.session.query(Stream.url).filter(Stream.url.isnot(None))}
+            unique = []
+            for station in stations:
+                url = canonical_url(station.url)
+                if url in seen:
+                    report.duplicates += 1
+                    continue
+                seen.add(url)
+                unique.append(station)
+            self._report_progress(report)
+
+            station_iterator = iter(unique)
+            pending = set()
+            batch = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while True:
+                    # Keep at most two stations per worker queued, so cancelling doesn't leave much work behind
+                    while not self._cancelled.is_set() and len(pending) < self.max_workers * 2:
+                        station = next(station_iterator, None)
+                        if station is None:
+                            break
+                        pending.add(executor.submit(self.validator, station))
+                    if not pending:
+                        break
+
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        station, valid, _ = future.result()
+                        if valid:
+                            batch.append(station)
+                        else:
+                            report.invalid += 1
+                    if len(batch) >= self.batch_size:
+                        report.imported += self._write(playlist_manager, playlist, batch)
+                        batch = []
+                    self._report_progress(report)
+            if batch:
+                report.imported += self._write(playlist_manager, playlist, batch)
+                self._report_progress(report)
+        finally:
+            playlist_manager.close_session()
+
+        report.elapsed = time.perf_counter() - start
+        print(report)
+        return report
+
+    def run_in_background(self, path: str, done_callback: Optional[Callable[[RadioImportReport], None]]=None) -> threading.Thread:
+        """
+        Imports a directory file on a background thread
+
+        Parameters
+        ----------
+        path : str
+            The path of the CSV or JSON file
+        done_callback : Callable, optional
+            The function that is called with the report when the import ends
+
+        Returns
+        -------
+        Thread
+            The import thread
+        """
+        def run() -> None:
+            report = self.import_file(path)
+            if done_callback:
+                done_callback(report)
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def _write(self, playlist_manager: PlaylistManager, playlist: Any, stations: list[RadioStation]) -> int:
+        """
+        Inserts a batch of stations (with their tags) and adds them to the playlist in a single transaction.
+        Returns the number of inserted stations
+        """
+        session = playlist_manager.session
+        try:
+            tag_names = {tag for station in stations for tag in station.tags}
+            tags = {tag.name.lower(): tag for tag in session.query(Tag).filter(Tag.name.in_(tag_names))} if tag_names else {}
+
+            # Stations have no duration, which is how the station monitor finds them
+            tracks = []
+            for station in stations:
+                track = Track(title=station.name, artist="Radio", album=station.name, duration=0, playlists=[],
+                    stream_url=station.url, cover_art_url=station.image_url or "")
+                for name in station.tags:
+                    if name.lower() not in tags:
+                        tags[name.lower()] = Tag(name)
+                    if tags[name.lower()] not in track.tags:
+                        track.tags.append(tags[name.lower()])
+                tracks.append(track)
+            session.add_all(tracks)
+            # Commits the tracks, tags and playlist membership together
+            playlist_manager.add_tracks_to_playlist(tracks, playlist)
+        except db.exc.SQLAlchemyError as e:
+            session.rollback()
+            print(f"Could not import {len(stations)} stations. Error: {e}")
+            return 0
+        return len(tracks)
+
+    def _report_progress(self, report: RadioImportReport) -> None:
+        """
+        Calls the progress callback with the number of processed stations
+        """
+        if self.progress_callback:
+            self.progress_callback(report.imported + report.duplicates + report.invalid, report.total)
+
+
+def test():
+    importer = RadioImporter(progress_callback=lambda processed, total: print(f"{processed}/{total}", end="\r"))
+    importer.import_file(os.path.join("data", "stations.json"))
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,280 @@
+"""
+Token bucket rate limiters for the external providers (YouTube, Genius and the scraped station pages),
+so bulk imports don't get throttled or blocked.
+
+Each bucket refills at a fixed rate up to its burst size, and every call takes a token, waiting when the bucket is empty.
+The buckets are shared by all threads and asyncio tasks: a call reserves its token under a lock and then waits
+(with time.sleep or asyncio.sleep) without holding the lock, so waiting calls are spread out at the refill rate.
+"""
+
+import asyncio
+from contextlib import contextmanager
+import threading
+import time
+from typing import Iterator
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket with a burst allowance and counters of how often and how long calls waited
+    """
+
+    def __init__(self, name: str, rate: float, burst: int) -> None:
+        """
+        Parameters
+        ----------
+        name : str
+            The name of the provider (used in the statistics)
+        rate : float
+            The number of tokens added per second
+        burst : int
+            The maximum number of tokens (the number of calls that can be made at once after being idle)
+
+        Returns
+        -------
+        None
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.calls = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """
+        Takes tokens from the bucket (going into debt if it is empty) and returns the time in seconds to wait for them
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+            self.calls += 1
+            if delay > 0:
+                self.waits += 1
+                self.total_wait += delay
+                self.max_wait = max(self.max_wait, delay)
+            return delay
+
+    def acquire(self, tokens: float=1.0) -> float:
+        """
+        Takes tokens from the bucket, blocking the thread until they are available
+
+        Parameters
+        ----------
+        tokens : float
+            The number of tokens to take
+
+        Returns
+        -------
+        float
+            The time in seconds the call waited
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, tokens: float=1.0) -> float:
+        """
+        Takes tokens from the bucket, waiting without blocking the event loop until they are available
+
+        Parameters
+        ----------
+        tokens : float
+            The number of tokens to take
+
+        Returns
+        -------
+        float
+            The time in seconds the call waited
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    @contextmanager
+    def limit(self) -> Iterator[None]:
+        """
+        Waits for a token before running the body of a with block
+
+        Implementation
+        ----------
+        with youtube_limiter.limit():
+            yt = YouTube(url)
+        """
+        self.acquire()
+        yield
+
+    def reset_stats(self) -> None:
+        """
+        Resets the wait counters
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self.calls = self.waits = 0
+            self.total_wait = self.max_wait = 0.0
+
+    def __str__(self) -> str:
+        average_wait = self.total_wait / self.waits if self.waits else 0.0
+        return (f"{self.name}: {self.calls} calls, {self.waits} waited "
+            f"(total {self.total_wait:.2f}s, average {average_wait * 1000.0:.0f}ms, max {self.max_wait * 1000.0:.0f}ms)")
+
+
+class HostRateLimiter:
+    """
+    A token bucket per host, for providers that are arbitrary websites (e.g. the pages of radio stations)
+    """
+
+    def __init__(self, name: str, rate: float, burst: int) -> None:
+        """
+        Parameters
+        ----------
+        name : str
+            The name of the provider (used in the statistics)
+        rate : float
+            The number of calls per second allowed per host
+        burst : int
+            The number of calls per host that can be made at once after being idle
+
+        Returns
+        -------
+        None
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, url: str) -> TokenBucket:
+        """
+        Returns the token bucket of the host of a url
+
+        Parameters
+        ----------
+        url : str
+            The requested url
+
+        Returns
+        -------
+        TokenBucket
+            The bucket of the host
+        """
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(f"{self.name} ({host})", self.rate, self.burst)
+            return bucket
+
+    def acquire(self, url: str) -> float:
+        """
+        Waits for a token of the host of a url, blocking the thread
+
+        Parameters
+        ----------
+        url : str
+            The requested url
+
+        Returns
+        -------
+        float
+            The time in seconds the call waited
+        """
+        return self.get_bucket(url).acquire()
+
+    async def acquire_async(self, url: str) -> float:
+        """
+        Waits for a token of the host of a url without blocking the event loop
+
+        Parameters
+        ----------
+        url : str
+            The requested url
+
+        Returns
+        -------
+        float
+            The time in seconds the call waited
+        """
+        return await self.get_bucket(url).acquire_async()
+
+    @property
+    def buckets(self) -> list[TokenBucket]:
+        """
+        The buckets of the hosts that have been requested
+        """
+        with self._lock:
+            return list(self._buckets.values())
+
+    @property
+    def calls(self) -> int:
+        """
+        The number of calls to all of the hosts
+        """
+        return sum(bucket.calls for bucket in self.buckets)
+
+    @property
+    def waits(self) -> int:
+        """
+        The number of calls to all of the hosts that waited
+        """
+        return sum(bucket.waits for bucket in self.buckets)
+
+    @property
+    def total_wait(self) -> float:
+        """
+        The total time in seconds calls to all of the hosts waited
+        """
+        return sum(bucket.total_wait for bucket in self.buckets)
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.calls} calls to {len(self.buckets)} hosts, {self.waits} waited (total {self.total_wait:.2f}s)"
+
+
+# YouTube extractions, searches and playlist listings
+youtube_limiter = TokenBucket("YouTube", rate=2.0, burst=5)
+# Genius API searches and charts
+genius_limiter = TokenBucket("Genius", rate=5.0, burst=10)
+# Scraped station and web pages, per host
+page_limiter = HostRateLimiter("Pages", rate=2.0, burst=4)
+
+
+def get_stats() -> list[str]:
+    """
+    Returns the wait statistics of all of the provider limiters
+
+    Returns
+    -------
+    list[str]
+        A summary line per provider
+    """
+    return [str(limiter) for limiter in (youtube_limiter, genius_limiter, page_limiter)]
+
+
+def test():
+    bucket = TokenBucket("Test", rate=10.0, burst=5)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"20 calls in {time.perf_counter() - start:.2f}s (expected ~1.5s)")
+    print(bucket)
+
+if __name__ == "__main__":
+    test()
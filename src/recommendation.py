@@ -0,0 +1,282 @@
+import threading
+from typing import Optional
+
+import numpy as np
+import sqlalchemy as db
+
+from database import engine, playlist_track, track_similarity, track_similarity_stale
+
+
+class SimilarityIndex:
+    """
+    Computes "more like this" track recommendations from playlist co-occurrence.
+
+    Tracks are rows of a sparse track x playlist matrix and two tracks are similar when they share playlists.
+    The similarity is the cosine of the rows, where each playlist is weighted by 1 / log2(2 + size)
+    so that very large playlists (e.g. "Liked Songs") count less than small, curated ones.
+    The top-k most similar tracks of each track are stored in the track_similarity table.
+    """
+
+    def __init__(self, bind: db.engine.Engine=engine, top_k: int=20, block_size: int=512) -> None:
+        """
+        Parameters
+        ----------
+        bind : Engine
+            The database engine to read memberships from and store similarities in
+        top_k : int
+            The number of similar tracks to store for each track
+        block_size : int
+            The number of tracks whose similarities are computed at once (bounds memory use)
+
+        Returns
+        -------
+        None
+        """
+        self.bind = bind
+        self.top_k = top_k
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def rebuild(self) -> int:
+        """
+        Recomputes the similar tracks of every track
+
+        Returns
+        -------
+        int
+            The number of stored similarity rows
+        """
+        with self._lock, self.bind.begin() as connection:
+            matrix = _IncidenceMatrix.load(connection)
+            connection.execute(track_similarity.delete())
+            connection.execute(track_similarity_stale.delete())
+            rows = self._compute(matrix, np.arange(matrix.track_ids.size))
+            self._insert(connection, rows)
+            return len(rows)
+
+    def refresh(self) -> int:
+        """
+        Recomputes the similar tracks of the tracks marked as stale after playlist membership changes
+
+        Returns
+        -------
+        int
+            The number of refreshed tracks
+        """
+        with self._lock, self.bind.begin() as connection:
+            stale_ids = np.array(
+                [row[0] for row in connection.execute(db.select(track_similarity_stale.c.track_id))], dtype=np.int64
+            )
+            if not stale_ids.size:
+                return 0
+
+            matrix = _IncidenceMatrix.load(connection)
+            # Tracks that are no longer in any playlist keep no similar tracks
+            present = np.isin(stale_ids, matrix.track_ids)
+            stale_rows = np.searchsorted(matrix.track_ids, stale_ids[present])
+
+            for chunk in np.array_split(stale_ids, max(1, stale_ids.size // 500)):
+                chunk = chunk.tolist()
+                connection.execute(track_similarity.delete().where(track_similarity.c.track_id.in_(chunk)))
+                connection.execute(track_similarity_stale.delete().where(track_similarity_stale.c.track_id.in_(chunk)))
+            self._insert(connection, self._compute(matrix, stale_rows))
+            return int(stale_ids.size)
+
+    def refresh_in_background(self) -> None:
+        """
+        Refreshes the stale tracks on a background thread, unless a refresh is already running
+
+        Returns
+        -------
+        None
+        """
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+
+        self._refresh_thread = threading.Thread(target=self.refresh, daemon=True)
+        self._refresh_thread.start()
+
+    def _compute(self, matrix: "_IncidenceMatrix", rows: np.ndarray) -> list[tuple[int, int, int, float]]:
+        """
+        Computes the top-k similar tracks of the specified matrix rows, one block of rows at a time
+
+        Parameters
+        ----------
+        matrix : _IncidenceMatrix
+            The track x playlist matrix
+        rows : np.ndarray
+            The matrix row indices of the tracks to compute
+
+        Returns
+        -------
+        list[tuple[int, int, int, float]]
+            (track_id, rank, similar_track_id, score) rows
+        """
+        results = []
+        n_tracks = matrix.track_ids.size
+        for start in range(0, rows.size, self.block_size):
+            block = rows[start:start + self.block_size]
+
+            # The playlists of each track in the block (row-local index, playlist)
+            local, playlists = matrix.track_playlists(block)
+            # Every track in those playlists, weighted by the squared playlist weight
+            lengths = matrix.playlist_indptr[playlists + 1] - matrix.playlist_indptr[playlists]
+            local = np.repeat(local, lengths)
+            columns = matrix.playlist_indices[_expand_ranges(matrix.playlist_indptr[playlists], lengths)]
+            weights = np.repeat(matrix.weights[playlists] ** 2, lengths)
+
+            # Sum the shared playlist weights of each (track, other track) pair
+            keys, inverse = np.unique(local * n_tracks + columns, return_inverse=True)
+            dots = np.bincount(inverse, weights=weights)
+            local, columns = keys // n_tracks, keys % n_tracks
+
+            not_self = columns != block[local]
+            local, columns, dots = local[not_self], columns[not_self], dots[not_self]
+            scores = dots / (matrix.norms[block[local]] * matrix.norms[columns])
+
+            # Keep the k highest scores of each track: sort by track, then by descending score
+            # (scores are in (0, 1], so a single float key orders both)
+            order = np.argsort(local + (1.0 - scores) * 0.5)
+            local, columns, scores = local[order], columns[order], scores[order]
+            row_starts = np.flatnonzero(np.diff(local, prepend=-1))
+            ranks = np.arange(local.size) - np.repeat(row_starts, np.diff(row_starts, append=local.size))
+            keep = ranks < self.top_k
+
+            results.extend(zip(
+                matrix.track_ids[block[local[keep]]].tolist(),
+                ranks[keep].tolist(),
+                matrix.track_ids[columns[keep]].tolist(),
+                scores[keep].tolist(),
+            ))
+        return results
+
+    @staticmethod
+    def _insert(connection: db.engine.Connection, rows: list[tuple[int, int, int, float]]) -> None:
+        """
+        Inserts similarity rows with a single executemany
+
+        Parameters
+        ----------
+        connection : Connection
+            The database connection
+        rows : list[tuple[int, int, int, float]]
+            (track_id, rank, similar_track_id, score) rows
+
+        Returns
+        -------
+        None
+        """
+        if not rows:
+            return
+        connection.exec_driver_sql(
+            "INSERT INTO track_similarity (track_id, rank, similar_track_id, score) VALUES (?, ?, ?, ?)", rows
+        )
+
+
+class _IncidenceMatrix:
+    """
+    A sparse track x playlist matrix stored in compressed sparse row form in both directions
+    """
+
+    def __init__(self, track_ids: np.ndarray, track_rows: np.ndarray, playlist_columns: np.ndarray) -> None:
+        """
+        Parameters
+        ----------
+        track_ids : np.ndarray
+            The sorted track ids (the id of each matrix row)
+        track_rows : np.ndarray
+            The row index of each membership
+        playlist_columns : np.ndarray
+            The column (playlist) index of each membership
+
+        Returns
+        -------
+        None
+        """
+        self.track_ids = track_ids
+        n_playlists = int(playlist_columns.max()) + 1 if playlist_columns.size else 0
+
+        order = np.argsort(track_rows, kind="stable")
+        self.track_indptr = _indptr(track_rows, track_ids.size)
+        self.track_indices = playlist_columns[order]
+
+        order = np.argsort(playlist_columns, kind="stable")
+        self.playlist_indptr = _indptr(playlist_columns, n_playlists)
+        self.playlist_indices = track_rows[order]
+
+        sizes = np.diff(self.playlist_indptr)
+        self.weights = 1.0 / np.log2(2.0 + sizes)
+        self.norms = np.sqrt(np.bincount(track_rows, weights=self.weights[playlist_columns] ** 2, minlength=track_ids.size))
+
+    @classmethod
+    def load(cls, connection: db.engine.Connection) -> "_IncidenceMatrix":
+        """
+        Loads the playlist memberships from the database
+
+        Parameters
+        ----------
+        connection : Connection
+            The database connection
+
+        Returns
+        -------
+        _IncidenceMatrix
+            The track x playlist matrix
+        """
+        memberships = connection.execute(
+            db.select(playlist_track.c.track_id, playlist_track.c.playlist_id).distinct()
+        ).fetchall()
+        pairs = np.array(memberships, dtype=np.int64).reshape(-1, 2)
+        track_ids, track_rows = np.unique(pairs[:, 0], return_inverse=True)
+        _, playlist_columns = np.unique(pairs[:, 1], return_inverse=True)
+        return cls(track_ids, track_rows, playlist_columns)
+
+    def track_playlists(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the playlists of the specified rows
+
+        Parameters
+        ----------
+        rows : np.ndarray
+            The matrix row indices
+
+        Returns
+        -------
+        np.ndarray
+            The position in rows of each membership
+        np.ndarray
+            The playlist column index of each membership
+        """
+        lengths = self.track_indptr[rows + 1] - self.track_indptr[rows]
+        local = np.repeat(np.arange(rows.size), lengths)
+        return local, self.track_indices[_expand_ranges(self.track_indptr[rows], lengths)]
+
+
+def _indptr(indices: np.ndarray, size: int) -> np.ndarray:
+    """
+    Returns the compressed sparse row pointer array for the (unsorted) row indices
+    """
+    return np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=size))))
+
+def _expand_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Returns the concatenation of range(start, start + length) for each start and length, without a Python loop
+    """
+    total = int(lengths.sum())
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(total) - offsets + np.repeat(starts, lengths)
+
+
+similarity_index = SimilarityIndex()
+
+def test(track_title: Optional[str]=None):
+    from database import Track, playlist_manager
+
+    print(f"Stored {similarity_index.rebuild()} similarities")
+    track = playlist_manager.get_track(title=track_title) if track_title else playlist_manager.session.query(Track).first()
+    for similar_track in playlist_manager.get_similar_tracks(track):
+        print(similar_track.title)
+
+if __name__ == "__main__":
+    test()
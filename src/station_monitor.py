@@ -0,0 +1,330 @@
+"""
+Periodically checks the health of the saved radio stations in the background, so stale stations are found before
+the user tries to play them and station lists can prefer healthy, low latency streams without probing at click time.
+
+The checks run on an asyncio event loop with bounded concurrency. Each check opens the stream, reads the response
+headers (including Shoutcast's "ICY 200 OK" responses, which HTTP clients reject) and the first few KB,
+and records the status, time to first byte and bitrate in the station_health table.
+The best entries of station playlists are also stored in the playlist cache used at playback.
+"""
+
+import asyncio
+from datetime import datetime
+import ssl
+import threading
+import time
+from typing import Optional
+
+import sqlalchemy as db
+from sqlalchemy.dialects.sqlite import insert
+
+from database import Stream, Track, engine, station_health
+from icy import open_stream
+from playlist_parser import PlaylistEntry, is_hls_playlist, parse_playlist, playlist_cache
+from probe import ProbeResult, classify_stream
+
+
+class StationStatus:
+    """
+    The result of checking a station stream
+    """
+
+    def __init__(self, url: str) -> None:
+        """
+        Parameters
+        ----------
+        url : str
+            The checked url
+
+        Returns
+        -------
+        None
+        """
+        self.url = url
+        # The best entry of a station playlist
+        self.resolved_url = None
+        self.status_code = None
+        self.content_type = ""
+        self.kind = ProbeResult.UNKNOWN
+        self.time_to_first_byte = None
+        self.bitrate = None
+        self.error = None
+        self.entries = None
+
+    @property
+    def healthy(self) -> bool:
+        """
+        Whether the station responded with an audio stream
+        """
+        return not self.error and self.kind == ProbeResult.AUDIO
+
+    def __str__(self) -> str:
+        if self.error:
+            return f"{self.url}: {self.error}"
+        return f"{self.url}: {self.kind} ({self.content_type or 'no content type'}, {self.time_to_first_byte:.0f}ms, {self.bitrate}kbps)"
+
+
+def _parse_bitrate(headers: dict[str, str]) -> Optional[int]:
+    """
+    Returns the bitrate in kbps advertised by a stream server (icy-br: 128 or ice-audio-info: bitrate=128;...)
+    """
+    value = headers.get("icy-br", "").split(",")[0].strip()
+    if not value:
+        for field in headers.get("ice-audio-info", "").split(";"):
+            key, _, field_value = field.partition("=")
+            if key.strip().lower() in {"bitrate", "ice-bitrate"}:
+                value = field_value.strip()
+    return int(value) if value.isdigit() else None
+
+async def probe_station(url: str, timeout: float=5.0, max_bytes: int=16384, max_redirects: int=3, depth: int=1) -> StationStatus:
+    """
+    Checks a station stream: reads the headers and the first few KB, and expands station playlists into their fastest healthy entry
+
+    Parameters
+    ----------
+    url : str
+        The url of the station stream
+    timeout : float
+        The maximum time in seconds for connecting and for each read
+    max_bytes : int
+        The maximum number of body bytes to read (playlists are read up to 64 KB)
+    max_redirects : int
+        The maximum number of redirects to follow
+    depth : int
+        The maximum nesting depth of station playlists
+
+    Returns
+    -------
+    StationStatus
+        The status, time to first byte and bitrate of the station
+    """
+    status = StationStatus(url)
+    start = time.perf_counter()
+    writer = None
+    try:
+        final_url, reader, writer, status.status_code, headers = await open_stream(url, timeout, max_redirects)
+        status.content_type = headers.get("content-type", "")
+        status.bitrate = _parse_bitrate(headers)
+        if status.status_code != 200:
+            status.error = f"HTTP Error: {status.status_code}"
+            return status
+
+        first_bytes = await asyncio.wait_for(reader.read(max_bytes), timeout)
+        status.time_to_first_byte = (time.perf_counter() - start) * 1000.0
+        status.kind = classify_stream(status.content_type, first_bytes, final_url)
+        if status.kind != ProbeResult.PLAYLIST:
+            return status
+
+        # Read the rest of the playlist, then check its entries concurrently
+        while len(first_bytes) < 65536:
+            chunk = await asyncio.wait_for(reader.read(65536 - len(first_bytes)), timeout)
+            if not chunk:
+                break
+            first_bytes += chunk
+        text = first_bytes.decode("utf-8", errors="replace")
+        if is_hls_playlist(text):
+            # HLS playlists (media segments or variant streams) are played by VLC as a single stream, so they aren't expanded
+            status.kind = ProbeResult.AUDIO
+            return status
+        status.entries = parse_playlist(text, final_url)
+        if depth <= 0 or not status.entries:
+            status.error = "The playlist has no entries" if not status.entries else "Too many nested playlists"
+            return status
+
+        entry_statuses = await asyncio.gather(*(probe_station(entry.url, timeout, max_bytes, max_redirects, depth - 1) for entry in status.entries))
+        healthy = [entry_status for entry_status in entry_statuses if entry_status.healthy]
+        if not healthy:
+            status.error = "None of the playlist entries are healthy"
+            return status
+        best = min(healthy, key=lambda entry_status: entry_status.time_to_first_byte)
+        status.resolved_url = best.resolved_url or best.url
+        status.kind, status.content_type, status.bitrate = best.kind, best.content_type, best.bitrate
+        status.time_to_first_byte = best.time_to_first_byte
+    except asyncio.TimeoutError:
+        status.error = "Timed out"
+    except (OSError, ValueError, ssl.SSLError) as e:
+        status.error = f"Connection Error: {e}"
+    finally:
+        if writer:
+            writer.close()
+    return status
+
+async def check_stations(urls: list[str], max_concurrency: int=16, timeout: float=5.0) -> list[StationStatus]:
+    """
+    Checks station streams concurrently
+
+    Parameters
+    ----------
+    urls : list[str]
+        The urls of the station streams
+    max_concurrency : int
+        The maximum number of stations checked at the same time
+    timeout : float
+        The maximum time in seconds for connecting and for each read
+
+    Returns
+    -------
+    list[StationStatus]
+        The statuses in the same order as the urls
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def check(url: str) -> StationStatus:
+        async with semaphore:
+            return await probe_station(url, timeout)
+
+    return await asyncio.gather(*(check(url) for url in urls))
+
+
+class StationMonitor:
+    """
+    Checks all of the saved radio stations on a background thread at a fixed interval.
+    Saved stations are the streamed (not downloaded) tracks without a duration, excluding YouTube videos
+    """
+
+    def __init__(self, bind: db.engine.Engine=engine, interval: float=900.0, max_concurrency: int=16, timeout: float=5.0) -> None:
+        """
+        Parameters
+        ----------
+        bind : Engine
+            The database engine
+        interval : float
+            The time in seconds between checks of all of the stations
+        max_concurrency : int
+            The maximum number of stations checked at the same time
+        timeout : float
+            The maximum time in seconds for connecting to a station and for each read
+
+        Returns
+        -------
+        None
+        """
+        self.engine = bind
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.thread = None
+        self._stop = threading.Event()
+
+    def get_stations(self) -> list[tuple[int, str]]:
+        """
+        Returns the stream id and url of every saved station
+
+        Returns
+        -------
+        list[tuple[int, str]]
+            The stream ids and urls
+        """
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                db.select(Stream.id, Stream.url)
+                .join(Track, Track.stream_id == Stream.id)
+                .where(Track.path.is_(None))
+                .where(db.or_(Track.duration.is_(None), Track.duration == 0))
+                .where(~Stream.url.contains("youtube.com/"))
+                .where(~Stream.url.contains("youtu.be/"))
+                .distinct()
+            ).all()
+        return [(stream_id, url) for stream_id, url in rows if url]
+
+    def check_once(self) -> list[StationStatus]:
+        """
+        Checks all of the saved stations and records the results
+
+        Returns
+        -------
+        list[StationStatus]
+            The statuses of the stations
+        """
+        stations = self.get_stations()
+        if not stations:
+            return []
+
+        start = time.perf_counter()
+        statuses = asyncio.run(check_stations([url for _, url in stations], self.max_concurrency, self.timeout))
+        self._record(stations, statuses)
+
+        # Playback reuses the checked best entries of station playlists instead of probing them again.
+        # They are kept until after the next check has finished (even if it runs late), so they never expire between checks
+        for status in statuses:
+            if status.resolved_url and status.entries:
+                playlist_cache.put(status.url, status.entries, PlaylistEntry(status.resolved_url), ttl=self.interval * 2)
+            elif status.entries:
+                # None of the entries are healthy any more, so playback probes the playlist again
+                playlist_cache.invalidate(status.url)
+
+        healthy = sum(status.healthy for status in statuses)
+        print(f"Checked {len(statuses)} stations in {time.perf_counter() - start:.2f}s; {healthy} healthy")
+        return statuses
+
+    def start(self) -> threading.Thread:
+        """
+        Starts checking the stations on a background thread (unless it is already running)
+
+        Returns
+        -------
+        Thread
+            The monitor thread
+        """
+        if self.thread and self.thread.is_alive():
+            return self.thread
+
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self) -> None:
+        """
+        Stops the background checks after the current check finishes
+
+        Returns
+        -------
+        None
+        """
+        self._stop.set()
+
+    def _run(self) -> None:
+        """
+        Checks the stations until stopped
+        """
+        while not self._stop.is_set():
+            try:
+                self.check_once()
+            except db.exc.SQLAlchemyError as e:
+                print(f"Could not record the station health. Error: {e}")
+            self._stop.wait(self.interval)
+
+    def _record(self, stations: list[tuple[int, str]], statuses: list[StationStatus]) -> None:
+        """
+        Inserts or updates the station_health rows in a single transaction
+        """
+        now = datetime.now()
+        rows = [{
+            "stream_id": stream_id, "url": url, "resolved_url": status.resolved_url, "healthy": status.healthy,
+            "status_code": status.status_code, "time_to_first_byte": status.time_to_first_byte, "bitrate": status.bitrate,
+            "content_type": status.content_type, "error": status.error, "checked_at": now,
+            "last_healthy_at": now if status.healthy else None, "consecutive_failures": 0 if status.healthy else 1,
+        } for (stream_id, url), status in zip(stations, statuses)]
+
+        statement = insert(station_health)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(index_elements=[station_health.c.stream_id], set_={
+            **{column: excluded[column] for column in ("url", "resolved_url", "healthy", "status_code", "time_to_first_byte",
+                "bitrate", "content_type", "error", "checked_at")},
+            "last_healthy_at": db.func.coalesce(excluded.last_healthy_at, station_health.c.last_healthy_at),
+            "consecutive_failures": db.case((excluded.healthy, 0), else_=station_health.c.consecutive_failures + 1),
+        })
+        with self.engine.begin() as connection:
+            connection.execute(statement, rows)
+
+
+station_monitor = StationMonitor()
+
+
+def test():
+    for status in station_monitor.check_once():
+        print(status)
+
+if __name__ == "__main__":
+    test()
@@ -1,19 +1,37 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import os
 import re
+import threading
 import time
-import requests
-from bs4 import BeautifulSoup
 
 from enum import Enum
 from typing import Any, Callable, Optional
+from urllib.parse import urlparse
 
-import pafy
 import vlc
-from pytube import YouTube
 from moviepy.editor import AudioFileClip
 import mutagen
 
 from database import PlaylistManager
+from duration import get_duration
+from hls import download_hls
+from http_client import http_client
+from icy import IcyMetadata, IcyMetadataReader
+from playlist_parser import resolve_playlist
+from page_cache import hash_page, page_cache
+from page_title import extract_title, fetch_title
+from probe import ProbeResult, probe_stream
+from rate_limit import page_limiter
+from station_monitor import probe_station
+from stream_scanner import find_streams
+from youtube_cache import youtube_cache
+import vlc_pool
+from vlc_pool import player_pool
+
+# Runs the blocking and CPU-bound parts of the async stream resolution (stream searches, YouTube extractions, VLC checks)
+# off the event loop, bounding how many run at the same time
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="stream")
 
 class StreamUtility:
     @staticmethod
@@ -45,12 +63,92 @@ class StreamUtility:
     def check_stream_validity(stream_url: str) -> tuple[bool, vlc.State]:
         """
         Checks if a stream is valid and is able to be played by the VLC player.
+        Probes the stream headers and first bytes first, and only falls back to playing the stream in VLC when needed.
 
         Parameters
         ----------
         stream_url : str
             The url of the stream
 
+        Returns
+        -------
+        bool
+            if the stream is valid
+        vlc.State, optional
+            the state of the VLC player while checking the stream (None if VLC wasn't needed)
+        """
+        # Read only the headers and the first few KB of the stream
+        result = probe_stream(stream_url)
+        print(f"Probed stream: {result}")
+
+        if result.error and not result.protocol_error:
+            # HTTP status errors (e.g. 404, 501, ...), connection errors and time outs
+            print("Stream is not valid!")
+            return False, None
+        if result.kind == ProbeResult.HTML:
+            print("Stream is not valid! The url is a web page")
+            return False, None
+        if result.kind == ProbeResult.AUDIO:
+            # The headers and file signature identify an audio stream, so VLC isn't needed
+            print("Stream is valid!")
+            return True, None
+        if result.kind == ProbeResult.PLAYLIST:
+            # Check the best entry of station playlists instead of handing the whole playlist to VLC
+            entry = resolve_playlist(stream_url)
+            if entry and entry.url != stream_url and not StreamUtility.is_stream_playlist(entry.url):
+                return StreamUtility.check_stream_validity(entry.url)
+
+        # Playlists, unrecognized content and non-HTTP responses (e.g. Shoutcast's "ICY 200 OK") are checked by VLC
+        return StreamUtility.probe_with_vlc(stream_url)
+
+    @staticmethod
+    async def check_stream_validity_async(stream_url: str) -> tuple[bool, vlc.State]:
+        """
+        Checks if a stream is valid like check_stream_validity, probing the stream on the running event loop.
+        Station playlists are expanded and their entries probed concurrently (HLS playlists are probed as a single stream).
+        Like the sync check, playlists, unrecognized content and non-HTTP responses fall back to VLC
+
+        Parameters
+        ----------
+        stream_url : str
+            The url of the stream
+
+        Returns
+        -------
+        bool
+            if the stream is valid
+        vlc.State, optional
+            the state of the VLC player while checking the stream (None if VLC wasn't needed)
+        """
+        # Reads the headers and the first few KB, and handles Shoutcast's "ICY 200 OK" responses
+        status = await probe_station(stream_url)
+        if status.healthy:
+            print("Stream is valid!")
+            return True, None
+        if status.kind == ProbeResult.HTML:
+            print("Stream is not valid! The url is a web page")
+            return False, None
+        # A status code of 0 is a response the probe couldn't parse, which VLC may still play
+        if status.error and status.kind != ProbeResult.PLAYLIST and status.status_code != 0:
+            # HTTP status errors (e.g. 404, 501, ...), connection errors and time outs
+            print(f"Stream is not valid! {status.error}")
+            return False, None
+
+        # Playlists without a healthy entry, unrecognized content and non-HTTP responses are checked by VLC
+        return await asyncio.get_running_loop().run_in_executor(_executor, StreamUtility.probe_with_vlc, stream_url)
+
+    @staticmethod
+    def probe_with_vlc(stream_url: str, time_out: float=5.0) -> tuple[bool, vlc.State]:
+        """
+        Checks if a stream is able to be played by the VLC player, using a pooled (muted) player
+
+        Parameters
+        ----------
+        stream_url : str
+            The url of the stream
+        time_out : float
+            The maximum time in seconds to wait for the stream to start playing
+
         Returns
         -------
         bool
@@ -58,53 +156,27 @@ class StreamUtility:
         vlc.State
             the state of the VLC player while checking the stream
         """
-        try:
-            # Try opening the stream url
-            response = requests.get(stream_url, verify=False)
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            # Return the HTTP status code error that was sent with the response (e.g. 404, 501, ...)
-            print(f"HTTP Error: {e}")
-        except requests.exceptions.RequestException as e:
-            # Not an HTTP-specific error (e.g. connection refused)
-            print(f"URL Error: {e}")
-        except Exception as e:
-            # Not an HTTP-specific or RequestException error (e.g. unknow url type)
-            print(f"Error: {e}")
-        else:
-            # Start a vlc instance and try playing the stream
-            instance = vlc.Instance()
-            player = instance.media_player_new()
-            player.audio_set_mute(True)
-
-            is_playlist = StreamUtility.is_stream_playlist(stream_url)
+        is_playlist = StreamUtility.is_stream_playlist(stream_url)
+        with player_pool.checkout(list_player=is_playlist) as player:
             if is_playlist:
-                player = instance.media_list_player_new()
-                media = instance.media_list_new([stream_url])
-                player.set_media_list(media)
+                player.set_media_list(vlc_pool.get_instance().media_list_new([stream_url]))
             else:
-                media = instance.media_new(stream_url)
-                player.set_media(media)
-
-            player.play()
+                player.set_media(vlc_pool.get_instance().media_new(stream_url))
 
             print("Checking the stream validity...")
-            # Wait until the vlc player starts playing
-            condition, current_time = True, 0.0
-            while condition:
-                condition, current_time = StreamUtility.wait_while(not player.is_playing(), current_time)
+            # Play and wait until the vlc player starts playing, fails or times out
+            _, time_taken = StreamUtility.play_until_ready(player, time_out)
+            print(f"Time to playing: {time_taken:.1f}ms")
 
             # Get the player state
             state = player.get_state()
-            # Return true if the state is not an error
-            if state != vlc.State.Error and state != vlc.State.Ended:
-                player.stop()
-                print("Stream is valid!")
-                return True, state
-            print(f"Stream is not valid! Player State: {state}")
-            return False, state
-        print("Stream is not valid!")
-        return False, None
+
+        # Return true if the state is not an error
+        if state != vlc.State.Error and state != vlc.State.Ended:
+            print("Stream is valid!")
+            return True, state
+        print(f"Stream is not valid! Player State: {state}")
+        return False, state
 
     @staticmethod
     def is_supported_stream(stream_url: str, supported_extensions: list[str]) -> bool:
@@ -146,7 +218,52 @@ class StreamUtility:
         return re.search(youtube_regex, url)
 
     @staticmethod
-    def get_streams(url: str) -> tuple[list[str], Optional[Any]]:
+    def fetch_page(url: str) -> Optional[str]:
+        """
+        Downloads and decodes the source of a web page.
+        Pages are cached on disk and revalidated with conditional requests, so unchanged pages aren't downloaded again
+
+        Parameters
+        ----------
+        url : str
+            The url of the website
+
+        Returns
+        -------
+        str, optional
+            the page source, or None if the page could not be opened
+        """
+        try:
+            page_limiter.acquire(url)
+            return page_cache.fetch(url)
+        except Exception as e:
+            print(f"Could not open the specified URL. Error: {e}")
+            return None
+
+    @staticmethod
+    async def fetch_page_async(url: str) -> Optional[str]:
+        """
+        Downloads and decodes the source of a web page like fetch_page, on the running event loop
+
+        Parameters
+        ----------
+        url : str
+            The url of the website
+
+        Returns
+        -------
+        str, optional
+            the page source, or None if the page could not be opened
+        """
+        try:
+            await page_limiter.acquire_async(url)
+            return await page_cache.fetch_async(url)
+        except Exception as e:
+            print(f"Could not open the specified URL. Error: {e}")
+            return None
+
+    @staticmethod
+    def get_streams(url: str, page: Optional[str]=None) -> tuple[list[str], Optional[Any]]:
         """
         Returns a list of stream urls (and optionally, a list of YouTube audio streams) from a URL.
 
@@ -154,6 +271,8 @@ class StreamUtility:
         ----------
         url : str
             The url of website to extract the streams from
+        page : str, optional
+            The page source of the website, if it was already downloaded
 
         Returns
         -------
@@ -169,43 +288,73 @@ class StreamUtility:
             return streams, youtube_streams
 
         # Try opening the url
-        response = requests.get(url, verify=False)
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            print(f"Could not open the specified URL. Error: {e}")
-            return streams, youtube_streams
+        if page is None:
+            page = StreamUtility.fetch_page(url)
+            if page is None:
+                return streams, youtube_streams
 
-        # Decoding the page source
-        response.encoding = response.apparent_encoding
-        raw_file = response.text
+        return StreamUtility.find_page_streams(url, page), youtube_streams
 
-        supported_extensions = {".wma", ".xspf", ".pls", ".m3u8", ".m3u", ".hls", ".mp3", ".aac", ".ogg", ".m4a", ".wav"}
-        regex_terms = {"stream", "file", "@id", "fileURL", "streamURL", "mediaURL", "associatedMedia"}
-        # Return the stream urls that match the regular expressions
-        for term in regex_terms:
-            if streams:
-                return streams, youtube_streams
-            streams = re.findall(f"{term}\":\"(.*?)\"", raw_file)
+    @staticmethod
+    async def get_streams_async(url: str, page: Optional[str]=None) -> tuple[list[str], Optional[Any]]:
+        """
+        Returns the stream urls (and YouTube audio streams) of a URL like get_streams, downloading the page on the running event loop.
+        The stream search and YouTube extractions run on a thread pool, so many URLs can be resolved concurrently
 
-            # Remove all results without the supported extensions (Due to these regular expressions being very generalized)
-            streams[:] = [stream for stream in streams if StreamUtility.is_supported_stream(stream, supported_extensions)]
+        Parameters
+        ----------
+        url : str
+            The url of website to extract the streams from
+        page : str, optional
+            The page source of the website, if it was already downloaded
 
-        # Search terms for Apple Podcasts, Google Podcasts, etc.
-        specialized_regex_terms = {r"assetUrl\\\":\\\"(.*?)\"" , r"jsdata=\"Kwyn5e;(.*?);", r"url\":\"(.*?)\"", r"src=\"(.*?)\"", r"href=\"(.*?)\""}
-        for term in specialized_regex_terms:
-            if streams:
-                return streams, youtube_streams
-            streams = re.findall(term, raw_file)
+        Returns
+        -------
+        list[str]
+            a list of stream urls
+        list[Stream], optional
+            an optional list of YouTube streams
+        """
+        loop = asyncio.get_running_loop()
+        if StreamUtility.is_youtube_url(url):
+            return await loop.run_in_executor(_executor, StreamUtility.get_youtube_audio_streams, url)
 
-            # Remove all results without the supported extensions (Due to these regular expressions being very generalized)
-            streams[:] = [stream for stream in streams if StreamUtility.is_supported_stream(stream, supported_extensions)]
-        return streams, youtube_streams
+        if page is None:
+            page = await StreamUtility.fetch_page_async(url)
+            if page is None:
+                return [], None
+        return await loop.run_in_executor(_executor, StreamUtility.find_page_streams, url, page), None
+
+    @staticmethod
+    def find_page_streams(url: str, page: str) -> list[str]:
+        """
+        Returns the stream urls found in the source of a web page, reusing the streams found in the same page source before
+
+        Parameters
+        ----------
+        url : str
+            The url of the website
+        page : str
+            The page source of the website
+
+        Returns
+        -------
+        list[str]
+            a list of stream urls
+        """
+        page_hash = hash_page(page)
+        streams = page_cache.get_streams(url, page_hash)
+        if streams is None:
+            # Return the stream urls of the highest priority search term, found in a single pass over the page
+            streams = find_streams(page)
+            page_cache.put_streams(url, page_hash, streams)
+        return streams
 
     @staticmethod
     def get_stream_duration(stream_url: str) -> int:
         """
-        Returns the duration of the stream in seconds
+        Returns the duration of the stream in seconds.
+        Uses the container headers if possible, otherwise plays the stream in VLC
 
         Parameters
         ----------
@@ -217,33 +366,61 @@ class StreamUtility:
         int
             the duration of the stream in seconds
         """
-        duration = 0
+        # Station playlists are played as their best entry, which is usually a live stream (with a length of -1)
+        if StreamUtility.is_stream_playlist(stream_url):
+            entry = resolve_playlist(stream_url)
+            return entry.length if entry and entry.length and entry.length > 0 else 0
 
-        instance = vlc.Instance()
-        player = instance.media_player_new()
-        player.audio_set_mute(True)
+        # Read the duration from the container headers, which only needs a few KB of the stream
+        header_duration = get_duration(stream_url)
+        if header_duration is not None:
+            return int(header_duration)
 
-        is_playlist = StreamUtility.is_stream_playlist(stream_url)
-        if is_playlist:
-            player = instance.media_list_player_new()
-            media = instance.media_list_new([stream_url])
-            player.set_media_list(media)
-        else:
-            media = instance.media_new(stream_url)
-            player.set_media(media)
+        # Otherwise, play the stream in VLC and read the duration
+        with player_pool.checkout() as player:
+            player.set_media(vlc_pool.get_instance().media_new(stream_url))
+
+            # Play and wait until the vlc player starts playing, fails or times out
+            StreamUtility.play_until_ready(player)
+            return max(player.get_length(), 0) // 1000
 
-        player.play()
+    @staticmethod
+    async def get_stream_duration_async(stream_url: str) -> int:
+        """
+        Returns the duration of the stream in seconds like get_stream_duration, without blocking the running event loop.
+        The container headers are read (and VLC is played, if needed) on a thread pool
+
+        Parameters
+        ----------
+        stream_url : str
+            The url of the stream
+
+        Returns
+        -------
+        int
+            the duration of the stream in seconds
+        """
+        return await asyncio.get_running_loop().run_in_executor(_executor, StreamUtility.get_stream_duration, stream_url)
 
-        # Wait until the vlc player starts playing
-        condition, current_time = True, 0.0
-        while condition:
-            condition, current_time = StreamUtility.wait_while(not player.is_playing(), current_time)
+    @staticmethod
+    def split_genres(genre: Optional[str]) -> list[str]:
+        """
+        Splits a genre metadata value into separate genres (e.g. "Rock; Pop" -> ["Rock", "Pop"])
 
-        if not is_playlist:
-            duration = player.get_length() // 1000
+        Parameters
+        ----------
+        genre : str, optional
+            The genre metadata value
 
-        player.stop()
-        return duration
+        Returns
+        -------
+        list[str]
+            a list of genre names
+        """
+        if not genre:
+            return []
+        genres = re.split(r"[;,\x00]", genre)
+        return [" ".join(g.split()) for g in genres if g.strip()]
 
     @staticmethod
     def get_youtube_audio_streams(url: str) -> tuple[list[str], list[Any]]:
@@ -259,49 +436,58 @@ class StreamUtility:
         -------
         list[str]
             a list of stream urls
-        list[Stream]
-            a list of YouTube streams
+        list[AudioFormat]
+            a list of YouTube audio formats
         """
-        yt = YouTube(url)
-        youtube_streams = yt.streams.filter(only_audio=True).order_by("bitrate").desc()
+        # Uses the cached extraction of the video if there is one
+        youtube_streams = youtube_cache.get(url).audio_formats
         streams = [stream.url for stream in youtube_streams]
         return streams, youtube_streams
 
-    @staticmethod # Move to another class/file
-    def wait_while(condition: bool, current_time: float, time_out: float=5.0, increment_steps: int=100) -> tuple[bool, float]:
+    @staticmethod
+    def play_until_ready(player: Any, time_out: float=5.0) -> tuple[bool, float]:
         """
-        Wait while a condition is true until the function times out.
-        You need to use this method as a conditional in a while loop
-
-        Implementation
-        ----------
-        condition, current_time = True, 0.0
-
-        while condition:
-            condition, current_time = Stream.wait_while(condition, current_time, ...)
+        Starts a VLC player and waits until it is playing, encounters an error or (for single media) reaches the end, or until it times out.
+        Waits on VLC's player events rather than polling the player state
 
         Parameters
         ----------
-        condition : bool
-            The condition to check for
-        current_time : float
-            The current time counter (to check for a time out)
+        player : vlc.MediaPlayer | vlc.MediaListPlayer
+            The VLC player to start
+        time_out : float
+            The maximum time in seconds to wait for the player
 
         Returns
         -------
         bool
-            whether the condition is True and it hasn't timed out yet
+            whether the player is playing
         float
-            the updated current time counter (to check for a time out)
+            the time taken until the player was ready (or timed out) in milliseconds
         """
-        current_time = 0.0
-        increment = time_out / float(increment_steps)
+        # List players report playback events through their media player
+        is_list_player = isinstance(player, vlc.MediaListPlayer)
+        media_player = player.get_media_player() if is_list_player else player
+        event_manager = media_player.event_manager()
+        ready = threading.Event()
+        ready_events = (vlc.EventType.MediaPlayerPlaying, vlc.EventType.MediaPlayerEncounteredError)
+        # A playlist item ends before VLC starts playing its entries, so only single media can end the wait by ending
+        if not is_list_player:
+            ready_events += (vlc.EventType.MediaPlayerEndReached,)
+
+        # Attach before playing so that an event can't be missed
+        for event_type in ready_events:
+            event_manager.event_attach(event_type, lambda event: ready.set())
+
+        start = time.perf_counter()
+        try:
+            player.play()
+            if not ready.wait(time_out):
+                print(f"Exceeded timeout: the player did not start within {time_out}s")
+        finally:
+            for event_type in ready_events:
+                event_manager.event_detach(event_type)
 
-        if condition and current_time < time_out:
-            current_time += increment
-            time.sleep(increment)
-            return True, current_time
-        return False, current_time
+        return player.is_playing(), (time.perf_counter() - start) * 1000.0
 
 
 class StreamData:
@@ -310,7 +496,7 @@ class StreamData:
     Also supports downloading streams
     """
 
-    def __init__(self, url: str, streams_override: list[str]=None, title_override:str=None) -> None:
+    def __init__(self, url: str, streams_override: list[str]=None, title_override:str=None, page: Optional[str]=None) -> None:
         """
         Parameters
         ----------
@@ -323,55 +509,21 @@ class StreamData:
         title_override : str, optional
             Overrides the track title.
             Otherwise, extracts the track title from the website url or original source
+        page : str, optional
+            The page source of the website, if it was already downloaded
         """
         self.streams = []
         self.player = None
+        self.genres = []
         if not streams_override:
-            self.url = url
+            # Download the page once for both the streams and the title
+            if page is None and not StreamUtility.is_youtube_url(url):
+                page = StreamUtility.fetch_page(url)
             # Get streams from url and if available, the youtube streams
-            self.streams, self.youtube_streams = StreamUtility.get_streams(url)
-            self.set_default_stream()
-
+            streams, youtube_streams = StreamUtility.get_streams(url, page)
+            self._set_details(url, page, streams, youtube_streams)
             if not self.youtube_streams:
-                # Get website title
-                soup = BeautifulSoup(requests.get(url, verify=False).text, features="html.parser")
-                # Get stream title and remove white spaces and special/escape characters
-                self.title = soup.title.text.replace("|", "").split()
-                self.title = " ".join(self.title)
-                self.album = self.title
-                self.artist = "Unknown"
                 self.duration = StreamUtility.get_stream_duration(self.default_stream)
-            else:
-                yt = YouTube(self.url)
-
-                # Get YouTube song metadata if it exists
-                if yt.metadata:
-                    if type(yt.metadata) is list:
-                        metadata = yt.metadata[0]
-                    elif type(yt.metadata.metadata) is list and yt.metadata.metadata:
-                        metadata = yt.metadata.metadata[0]
-                    elif yt.metadata.metadata:
-                        metadata = yt.metadata.metadata
-                    else:
-                        metadata = None
-                else:
-                    metadata = None
-
-                self.title = metadata.get("Song") if metadata else None
-                if not self.title:
-                    self.title = yt.title
-
-                self.artist = metadata.get("Artist") if metadata else None
-                if not self.artist:
-                    self.artist = yt.author
-                # Remove the Topic tag from YouTube's Topic channel names
-                self.artist = self.artist.replace(" - Topic", "")
-
-                self.album = metadata.get("Album") if metadata else None
-                if not self.album:
-                    self.album = self.title
-
-                self.duration = yt.length
         else:
             # Assign streams if streams are valid
             if StreamUtility.check_stream_validity(streams_override[0])[0]:
@@ -380,16 +532,88 @@ class StreamData:
 
             try:
                 # Try getting a website url from the default stream
-                url = requests.get(self.default_stream, stream=True, verify=False).headers.get("icy-url")
-                # Get website title
-                soup = BeautifulSoup(requests.get(url, verify=False).text, features="html.parser")
-                # Get stream title and remove white spaces and special/escape characters
-                self.title = " ".join(soup.title.text.split())
+                with http_client.get(self.default_stream, stream=True) as response:
+                    url = response.headers.get("icy-url")
+                # Get website title, only downloading the page up to the title
+                page_limiter.acquire(url)
+                self.title = fetch_title(url)
+                if not self.title:
+                    raise ValueError("The website has no title")
             except Exception as e:
                 print(f"Error: {e}")
                 if not title_override:
                     self.title = "New Radio Station"
 
+    @classmethod
+    async def create(cls, url: str) -> "StreamData":
+        """
+        Creates the stream data of a website url on the running event loop, so many urls can be resolved concurrently.
+        The page is downloaded on the loop, while the stream search, title parsing, YouTube extraction and
+        duration check run on a thread pool
+
+        Parameters
+        ----------
+        url : str
+            The website url to extract streams from
+
+        Returns
+        -------
+        StreamData
+            The stream data, as created by StreamData(url)
+        """
+        self = cls.__new__(cls)
+        self.streams = []
+        self.player = None
+        self.genres = []
+
+        loop = asyncio.get_running_loop()
+        page = await StreamUtility.fetch_page_async(url) if not StreamUtility.is_youtube_url(url) else None
+        streams, youtube_streams = await StreamUtility.get_streams_async(url, page)
+        await loop.run_in_executor(_executor, self._set_details, url, page, streams, youtube_streams)
+        if not self.youtube_streams:
+            self.duration = await StreamUtility.get_stream_duration_async(self.default_stream)
+        return self
+
+    def _set_details(self, url: str, page: Optional[str], streams: list[str], youtube_streams: Optional[list[Any]]) -> None:
+        """
+        Sets the streams, title, artist and album of a website url (and the duration of YouTube videos)
+        """
+        self.url = url
+        self.streams, self.youtube_streams = streams, youtube_streams
+        self.set_default_stream()
+
+        if not self.youtube_streams:
+            # Get website title (the page was already downloaded) and remove the white spaces and special characters
+            self.title = extract_title(page or "")
+            if self.title:
+                self.title = " ".join(self.title.replace("|", "").split())
+            else:
+                self.title = urlparse(url).hostname or url
+            self.album = self.title
+            self.artist = "Unknown"
+        else:
+            # The video was already extracted (and cached) while getting its streams
+            yt = youtube_cache.get(self.url)
+
+            # Get YouTube song metadata if it exists
+            metadata = yt.metadata
+
+            self.title = metadata.get("Song") if metadata else None
+            if not self.title:
+                self.title = yt.title
+
+            self.artist = metadata.get("Artist") if metadata else None
+            if not self.artist:
+                self.artist = yt.author
+            # Remove the Topic tag from YouTube's Topic channel names
+            self.artist = self.artist.replace(" - Topic", "")
+
+            self.album = metadata.get("Album") if metadata else None
+            if not self.album:
+                self.album = self.title
+
+            self.duration = yt.length
+
     def get_youtube_stream_bitrates(self) -> Optional[list[str]]:
         """
         Returns a list of the average bitrate of the streams in the same order (if there are supported YouTube streams)
@@ -498,7 +722,7 @@ class StreamData:
 
         if self.youtube_streams:
             # Download best stream and set filepath
-            video = self.youtube_streams[AudioQuality.ULTRA.value]
+            video = youtube_cache.get_pytube_stream(self.url, self.youtube_streams[AudioQuality.ULTRA.value].itag)
             file_path = os.path.join(download_dir, video.default_filename)
             file_extension = os.path.splitext(video.default_filename)[-1]
             file_path_mp3 = file_path.replace(file_extension, ".mp3")
@@ -539,7 +763,7 @@ class StreamData:
 
         stream_to_download = None
         # Supported stream types to download
-        supported_extensions = {".mp3", ".aac", ".ogg", ".m4a", ".wav", ".mpeg"}
+        supported_extensions = {".mp3", ".aac", ".ogg", ".m4a", ".wav", ".mpeg", ".m3u8"}
         # If the default stream does not match one of the supported stream extensions
         if not StreamUtility.is_supported_stream(self.default_stream, supported_extensions) and not self.youtube_streams:
             if download_only_default:
@@ -560,14 +784,32 @@ class StreamData:
             # If the default stream is a supported stream
             stream_to_download = self.default_stream
 
-        # Downloading the stream
-        stream_request = requests.get(stream_to_download, stream=True, verify=False)
+        if StreamUtility.is_supported_stream(stream_to_download, {".m3u8"}):
+            # Download the HLS segments in parallel into a single file
+            segments_path = download_hls(stream_to_download, file_path)
+            if not segments_path:
+                return None
+            # Use moviepy to convert the segments (e.g. MPEG-TS or AAC) to an mp3. Delete the segments file afterwards
+            if segments_path != file_path:
+                audio_clip = AudioFileClip(segments_path)
+                audio_clip.write_audiofile(file_path, verbose=False, logger=None)
+                audio_clip.close()
+                os.remove(segments_path)
+        else:
+            # Downloading the stream
+            with http_client.get(stream_to_download, stream=True, timeout=(3.05, 30.0)) as stream_request, open(file_path, "wb") as f:
+                # Write each chunk of the stream content to the created file
+                for block in stream_request.iter_content(65536):
+                    f.write(block)
 
-        with open(file_path, "wb") as f:
-            # Write each chunk of the stream content to the created file
-            for block in stream_request.iter_content(1024):
-                f.write(block)
-            return file_path
+        # Record the genres stored in the downloaded file's tags
+        try:
+            media_file = mutagen.File(file_path, easy=True)
+            if media_file and media_file.tags:
+                self.genres = [g for value in media_file.get("genre", []) for g in StreamUtility.split_genres(value)]
+        except Exception as e:
+            print(f"Could not read the downloaded file tags. Error: {e}")
+        return file_path
 
     def add_to_playlist(self, playlist_name: Optional[str]=None) -> int:
         """
@@ -604,6 +846,7 @@ class StreamData:
                 path = self.download_stream()
                 if path:
                     track.path = path
+                    playlist_manager.add_tags_to_track(track, self.genres)
         else:
             track = playlist_manager.get_or_create_track(self.title, self.artist, self.album, self.duration, stream)
 
@@ -637,20 +880,30 @@ class Stream():
             The function that is called when the stream is played and the time changes
         """
         if StreamUtility.is_youtube_url(url):
-            stream = pafy.new(url, ydl_opts={'nocheckcertificate': True}).getbestaudio().url
-
-            if "manifest" in stream and "webm" in stream:
-                stream = StreamUtility.get_youtube_audio_streams(url)[0][0]
+            # Play the highest bitrate audio stream, using the cached extraction of the video if there is one
+            stream = StreamUtility.get_youtube_audio_streams(url)[0][0]
         else:
             stream = url
 
+        # Play the best entry of station playlists as a single media, so its duration and metadata are available
+        self.playlist_url = None
+        if StreamUtility.is_stream_playlist(stream):
+            entry = resolve_playlist(stream)
+            if entry:
+                self.playlist_url, stream = stream, entry.url
+
         self.stream = stream
         self.time_elapsed_callback = time_elapsed_callback
         self.is_playlist = StreamUtility.is_stream_playlist(self.stream)
         self.looping = False
-
-        # Create a vlc instance and player
-        self.vlc_instace = vlc.Instance()
+        # The time in milliseconds the last play call took to start playing
+        self.time_to_playing = None
+        # The reader of the stream's ICY metadata and the latest title it reported
+        self.metadata_reader = None
+        self.now_playing = None
+
+        # Create a player on the shared vlc instance
+        self.vlc_instace = vlc_pool.get_instance()
         self.player = self.vlc_instace.media_player_new()
 
     def play(self, continuous_play: bool=False, start_time: float=0.0) -> None:
@@ -677,23 +930,23 @@ class Stream():
             self.player = self.vlc_instace.media_list_player_new()
             self.media = self.vlc_instace.media_list_new([self.stream])
             self.player.set_media_list(self.media)
+            if self.looping:
+                self.player.set_playback_mode(vlc.PlaybackMode.loop)
         else:
             # Set the default stream as the playable media
             self.media = self.vlc_instace.media_new(self.stream)
+            # Looping is a media option, since the vlc instance is shared
+            if self.looping:
+                self.media.add_option("input-repeat=65535")
             self.player.set_media(self.media)
 
         self.vlc_event_manager = self.player.event_manager()
         self.vlc_event_manager.event_attach(vlc.EventType.MediaPlayerTimeChanged, self._media_time_elapsed)
 
-        self.player.play()
-        # Wait until the vlc player starts playing
-        condition, current_time = True, 0.0
-        while condition:
-            condition, current_time = StreamUtility.wait_while(not self.player.is_playing(), current_time)
-
-        if current_time >= 5.0:
-            print(f"Exceeded timeout: Time taken was {current_time}")
-            self.play()
+        # Play and wait until the vlc player starts playing, fails or times out
+        playing, self.time_to_playing = StreamUtility.play_until_ready(self.player)
+        if not playing:
+            print(f"Could not play the stream. Player state: {self.player.get_state()}")
             return
 
         # Set the start time in ms
@@ -710,6 +963,10 @@ class Stream():
         if not continuous_play:
             return
 
+        # VLC reads the now playing title of radio streams itself. The metadata reader opens a second connection to the
+        # station, so it is only started if VLC hasn't reported a title after a few seconds
+        polls_without_title = 0
+
         # While the stream is still playing
         # Alternatively, use "self.player.get_state() != vlc.State.Ended" without the prior wait while
         while self.player.is_playing():
@@ -724,8 +981,15 @@ class Stream():
             # Playlist streams do not support media data
             if self.is_playlist:
                 continue
+            # The metadata reader reports song changes (unless the stream doesn't support ICY metadata)
+            if self.metadata_reader and self.metadata_reader.supported is not False:
+                continue
 
             now_playing = self.media.get_meta(12)
+            if not now_playing and not self.metadata_reader:
+                polls_without_title += 1
+                if polls_without_title == 10:
+                    self.watch_now_playing(lambda metadata: print("Now playing", metadata))
             if now_playing == previously_playing:
                 continue
 
@@ -738,6 +1002,61 @@ class Stream():
             if genre:
                 print("Genre:", genre)
 
+    def watch_now_playing(self, callback: Optional[Callable]=None) -> Optional[IcyMetadataReader]:
+        """
+        Starts reading the ICY metadata of an HTTP stream on a background thread.
+        The callback is only called when the now playing title changes, with an IcyMetadata (title and timestamp).
+        The reader opens its own connection to the station next to the player's, so the stream is downloaded twice
+        while it runs (play only starts it when VLC doesn't report the now playing title)
+
+        Parameters
+        ----------
+        callback : Callable, optional
+            The function that is called (on the reader thread) when the now playing title changes
+
+        Returns
+        -------
+        IcyMetadataReader, optional
+            The metadata reader, or None if the stream isn't an HTTP stream
+        """
+        if not self.stream.startswith(("http://", "https://")) or self.is_playlist:
+            return None
+
+        def on_title(metadata: IcyMetadata) -> None:
+            self.now_playing = metadata
+            if callback:
+                callback(metadata)
+
+        self.stop_watching_now_playing()
+        self.metadata_reader = IcyMetadataReader(self.stream, on_title)
+        self.metadata_reader.start()
+        return self.metadata_reader
+
+    def stop_watching_now_playing(self) -> None:
+        """
+        Stops reading the ICY metadata of the stream
+
+        Returns
+        -------
+        None
+        """
+        if self.metadata_reader:
+            self.metadata_reader.stop()
+            self.metadata_reader = None
+
+    def get_genres(self) -> list[str]:
+        """
+        Returns the genres of the playing media reported by VLC
+
+        Returns
+        -------
+        list[str]
+            a list of genre names (empty if the media has no genre metadata)
+        """
+        if self.is_playlist or not getattr(self, "media", None):
+            return []
+        return StreamUtility.split_genres(self.media.get_meta(vlc.Meta.Genre))
+
     def _media_time_elapsed(self, event=None) -> None:
         """
         A private callback method for vlc.EventType.MediaPlayerTimeChanged
@@ -767,6 +1086,7 @@ class Stream():
         """
         if self.player:
             self.player.stop()
+        self.stop_watching_now_playing()
 
     def pause(self) -> None:
         """
@@ -913,14 +1233,13 @@ class Stream():
             return
 
         self.looping = looping
-        self.vlc_instace = vlc.Instance("--input-repeat=999999" if self.looping else "")
 
         if not self.player:
             return
 
+        # Restart the media with the updated loop option
         current_time = self.player.get_time() / 1000.0
         self.player.stop()
-        self.player = self.vlc_instace.media_player_new()
         self.play(start_time=current_time)
 
 
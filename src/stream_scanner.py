@@ -0,0 +1,100 @@
+"""
+Finds stream urls in the source of a web page (radio station and podcast pages) in a single pass.
+
+Each search term is a pattern that captures a url, e.g. "streamURL":"<url>" in embedded JSON or src="<url>" in HTML.
+All of the terms are compiled into one regular expression, so the page is only scanned once.
+The terms are listed in priority order: the streams of the highest priority term that found any supported streams are used.
+"""
+
+import re
+
+# Stream file extensions (matched anywhere in the url, so query strings and path segments such as .m3u8/ are included)
+SUPPORTED_EXTENSIONS = (".wma", ".xspf", ".pls", ".m3u8", ".m3u", ".hls", ".mp3", ".aac", ".ogg", ".m4a", ".wav")
+
+# Keys of the JSON objects that commonly hold stream urls (e.g. "streamURL":"<url>")
+JSON_TERMS = ("stream", "file", "@id", "fileURL", "streamURL", "mediaURL", "associatedMedia")
+
+# (name, text before the url, text after the url) of the search terms, in priority order.
+# The more generalized terms (e.g. for Apple Podcasts and Google Podcasts pages) come last
+SEARCH_TERMS = [(term, f'{term}":"', '"') for term in JSON_TERMS] + [
+    ("assetUrl", 'assetUrl\\":\\"', '"'),
+    ("jsdata", 'jsdata="Kwyn5e;', ";"),
+    ("url", 'url":"', '"'),
+    ("src", 'src="', '"'),
+    ("href", 'href="', '"'),
+]
+
+_TERM_NAMES = [name for name, _, _ in SEARCH_TERMS]
+_GROUP_TERMS = {f"t{i}": name for i, name in enumerate(_TERM_NAMES)}
+# One alternative per term, each capturing the url in a group named after the term's index
+_SCANNER = re.compile("|".join(f"{re.escape(prefix)}(?P<t{i}>.*?){re.escape(suffix)}"
+    for i, (_, prefix, suffix) in enumerate(SEARCH_TERMS)))
+_SUPPORTED_EXTENSION = re.compile("|".join(re.escape(extension) for extension in SUPPORTED_EXTENSIONS))
+
+
+def is_supported_stream(stream_url: str) -> bool:
+    """
+    Returns whether a stream url contains any of the supported extensions
+
+    Parameters
+    ----------
+    stream_url : str
+        The url of the stream
+
+    Returns
+    -------
+    bool
+        Whether the stream url contains a supported extension
+    """
+    return _SUPPORTED_EXTENSION.search(stream_url) is not None
+
+def scan_streams(page: str) -> dict[str, list[str]]:
+    """
+    Finds the supported stream urls of every search term in a single pass over the page source
+
+    Parameters
+    ----------
+    page : str
+        The page source
+
+    Returns
+    -------
+    dict[str, list[str]]
+        The supported stream urls (in page order) of each search term that found any, keyed by the term name
+    """
+    candidates = {}
+    for match in _SCANNER.finditer(page):
+        stream_url = match.group(match.lastgroup)
+        if is_supported_stream(stream_url):
+            candidates.setdefault(_GROUP_TERMS[match.lastgroup], []).append(stream_url)
+    return candidates
+
+def find_streams(page: str) -> list[str]:
+    """
+    Returns the supported stream urls of the highest priority search term that found any
+
+    Parameters
+    ----------
+    page : str
+        The page source
+
+    Returns
+    -------
+    list[str]
+        The stream urls in page order (empty if the page doesn't have any supported streams)
+    """
+    candidates = scan_streams(page)
+    for name in _TERM_NAMES:
+        if name in candidates:
+            return candidates[name]
+    return []
+
+
+def test():
+    page = '<a href="/about">About</a><audio src="https://example.com/episode.mp3"></audio>' \
+        '<script>{"streamURL":"https://example.com/live.m3u8","url":"https://example.com/logo.png"}</script>'
+    print(scan_streams(page))
+    print(find_streams(page))
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,126 @@
+from contextlib import contextmanager
+import queue
+import threading
+from typing import Iterator, Optional, Union
+
+import vlc
+
+_instance = None
+_instance_lock = threading.Lock()
+
+def get_instance() -> vlc.Instance:
+    """
+    Returns the process-wide libVLC instance, creating it on first use.
+    Creating an instance loads all of the libVLC plugins, so it should only be done once
+
+    Returns
+    -------
+    vlc.Instance
+        The shared libVLC instance
+    """
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = vlc.Instance()
+        return _instance
+
+
+class PlayerPool:
+    """
+    A bounded pool of reusable VLC media players and media list players for short-lived work such as probing streams.
+    Players are checked out muted and are stopped and reset when they are returned
+    """
+
+    def __init__(self, size: int=4) -> None:
+        """
+        Parameters
+        ----------
+        size : int
+            The maximum number of players of each type (checkouts wait when all players are in use)
+
+        Returns
+        -------
+        None
+        """
+        self.size = size
+        self._idle = {False: queue.LifoQueue(), True: queue.LifoQueue()}
+        self._created = {False: 0, True: 0}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, list_player: bool=False, time_out: Optional[float]=None) -> Iterator[Union[vlc.MediaPlayer, vlc.MediaListPlayer]]:
+        """
+        Checks out a muted player for the duration of a with block
+
+        Implementation
+        ----------
+        with player_pool.checkout() as player:
+            player.set_media(...)
+
+        Parameters
+        ----------
+        list_player : bool
+            Whether to check out a media list player (for playlist streams) instead of a media player
+        time_out : float, optional
+            The maximum time in seconds to wait for a player when all of them are in use. Waits indefinitely if not specified
+
+        Raises
+        ------
+        queue.Empty
+            If no player became available within the time out
+        """
+        player = self._acquire(list_player, time_out)
+        try:
+            yield player
+        finally:
+            self._release(player, list_player)
+
+    def _acquire(self, list_player: bool, time_out: Optional[float]) -> Union[vlc.MediaPlayer, vlc.MediaListPlayer]:
+        """
+        Returns an idle player, creating a new one if the pool isn't full
+        """
+        try:
+            return self._idle[list_player].get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created[list_player] < self.size
+            if create:
+                self._created[list_player] += 1
+
+        if not create:
+            return self._idle[list_player].get(timeout=time_out)
+
+        instance = get_instance()
+        if list_player:
+            player = instance.media_list_player_new()
+            player.get_media_player().audio_set_mute(True)
+        else:
+            player = instance.media_player_new()
+            player.audio_set_mute(True)
+        return player
+
+    def _release(self, player: Union[vlc.MediaPlayer, vlc.MediaListPlayer], list_player: bool) -> None:
+        """
+        Stops and resets a player, then returns it to the pool
+        """
+        try:
+            player.stop()
+            if list_player:
+                player.set_media_list(get_instance().media_list_new())
+                player.get_media_player().audio_set_mute(True)
+            else:
+                player.set_media(None)
+                player.audio_set_mute(True)
+        except Exception as e:
+            # Don't reuse a player that couldn't be reset
+            print(f"Discarding VLC player. Error: {e}")
+            with self._lock:
+                self._created[list_player] -= 1
+            player.release()
+            return
+        self._idle[list_player].put(player)
+
+
+player_pool = PlayerPool()
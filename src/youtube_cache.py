@@ -0,0 +1,337 @@
+"""
+Caches YouTube extractions (video metadata and audio formats) per video id, so building a StreamData, playing the
+video and reading its bitrates all share a single extraction.
+
+Extractions are kept in memory and in a JSON file per video in the cache folder. Entries expire with their stream
+urls (YouTube's expire parameter) or after the cache's time to live, whichever comes first.
+The pytube objects (needed for downloading) are only kept in memory.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+import weakref
+
+from pytube import YouTube
+
+from rate_limit import youtube_limiter
+
+# Default cache folder path
+CACHE_DIR = os.path.abspath(os.path.join("data", "cache", "youtube"))
+
+_VIDEO_ID_REGEX = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})")
+
+
+class AudioFormat:
+    """
+    An audio stream format of a YouTube video
+    """
+
+    def __init__(self, url: str, itag: int, abr: Optional[str], mime_type: Optional[str]) -> None:
+        """
+        Parameters
+        ----------
+        url : str
+            The (temporary) stream url
+        itag : int
+            YouTube's format id
+        abr : str, optional
+            The average bitrate (e.g. "160kbps")
+        mime_type : str, optional
+            The mime type (e.g. "audio/webm")
+
+        Returns
+        -------
+        None
+        """
+        self.url = url
+        self.itag = itag
+        self.abr = abr
+        self.mime_type = mime_type
+
+
+class VideoInfo:
+    """
+    The metadata and audio formats of a YouTube video
+    """
+
+    def __init__(self, video_id: str, title: str, author: str, length: int, metadata: Optional[dict[str, str]],
+        audio_formats: list[AudioFormat], expires: float) -> None:
+        """
+        Parameters
+        ----------
+        video_id : str
+            The YouTube video id
+        title : str
+            The video title
+        author : str
+            The channel name
+        length : int
+            The video length in seconds
+        metadata : dict[str, str], optional
+            YouTube's music metadata (e.g. Song, Artist and Album)
+        audio_formats : list[AudioFormat]
+            The audio formats ordered by bitrate (highest bitrate first)
+        expires : float
+            The time (seconds since the epoch) the stream urls expire
+
+        Returns
+        -------
+        None
+        """
+        self.video_id = video_id
+        self.title = title
+        self.author = author
+        self.length = length
+        self.metadata = metadata
+        self.audio_formats = audio_formats
+        self.expires = expires
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Returns the info as a JSON serializable dictionary
+        """
+        return {"video_id": self.video_id, "title": self.title, "author": self.author, "length": self.length,
+            "metadata": self.metadata, "expires": self.expires, "audio_formats": [audio_format.__dict__ for audio_format in self.audio_formats]}
+
+    @staticmethod
+    def from_dict(data: dict[str, Any]) -> "VideoInfo":
+        """
+        Creates the info from a dictionary created by to_dict
+        """
+        return VideoInfo(data["video_id"], data["title"], data["author"], data["length"], data["metadata"],
+            [AudioFormat(**audio_format) for audio_format in data["audio_formats"]], data["expires"])
+
+
+def get_video_id(url: str) -> Optional[str]:
+    """
+    Returns the video id of a YouTube url
+
+    Parameters
+    ----------
+    url : str
+        The YouTube video url
+
+    Returns
+    -------
+    str, optional
+        The 11 character video id, or None if the url doesn't contain one
+    """
+    match = _VIDEO_ID_REGEX.search(url)
+    return match.group(1) if match else None
+
+def _get_music_metadata(yt: YouTube) -> Optional[dict[str, str]]:
+    """
+    Returns YouTube's music metadata of a video (the format differs between pytube versions)
+    """
+    if not yt.metadata:
+        return None
+    if type(yt.metadata) is list:
+        return dict(yt.metadata[0])
+    if type(yt.metadata.metadata) is list and yt.metadata.metadata:
+        return dict(yt.metadata.metadata[0])
+    if yt.metadata.metadata:
+        return dict(yt.metadata.metadata)
+    return None
+
+def _get_url_expiry(url: str) -> Optional[float]:
+    """
+    Returns the expire parameter of a stream url
+    """
+    expire = parse_qs(urlparse(url).query).get("expire", [""])[0]
+    return float(expire) if expire.isdigit() else None
+
+
+class YouTubeCache:
+    """
+    A thread-safe, per video id cache of YouTube extractions, in memory and on disk
+    """
+
+    def __init__(self, cache_dir: str=CACHE_DIR, ttl: float=3600.0, expiry_margin: float=600.0) -> None:
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            The folder of the on-disk cache
+        ttl : float
+            The maximum time in seconds an extraction is kept
+        expiry_margin : float
+            The time in seconds before the stream urls expire when an extraction is treated as expired
+            (so a stream doesn't expire while it is starting to play)
+
+        Returns
+        -------
+        None
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self.extractions = 0
+        self._videos = {}
+        self._pytube_streams = {}
+        self._lock = threading.Lock()
+        # The locks of the videos that are being extracted (a lock is dropped once no thread holds a reference to it)
+        self._video_locks = weakref.WeakValueDictionary()
+
+    def get(self, url: str) -> VideoInfo:
+        """
+        Returns the metadata and audio formats of a video, extracting them only if they aren't cached
+
+        Parameters
+        ----------
+        url : str
+            The YouTube video url
+
+        Returns
+        -------
+        VideoInfo
+            The video metadata and audio formats
+
+        Raises
+        ------
+        Exception
+            If the video couldn't be extracted (e.g. the video is unavailable)
+        """
+        video_id = get_video_id(url) or url
+        # Only one thread extracts a video at a time; the others wait for its result
+        with self._get_video_lock(video_id):
+            info = self._get_cached(video_id)
+            if info is None:
+                info = self._extract(url, video_id)
+            return info
+
+    def get_pytube_stream(self, url: str, itag: int) -> Any:
+        """
+        Returns the pytube stream of an audio format (used for downloading).
+        Extracts the video again if its pytube streams aren't in memory (e.g. it was loaded from the on-disk cache)
+
+        Parameters
+        ----------
+        url : str
+            The YouTube video url
+        itag : int
+            The format id
+
+        Returns
+        -------
+        pytube.Stream
+            The pytube stream
+        """
+        video_id = get_video_id(url) or url
+        with self._get_video_lock(video_id):
+            streams = self._pytube_streams.get(video_id)
+            if streams is None or self._get_cached(video_id) is None:
+                self._extract(url, video_id)
+                streams = self._pytube_streams[video_id]
+            return streams.get_by_itag(itag)
+
+    def invalidate(self, url: str) -> None:
+        """
+        Removes a video from the cache (e.g. when its stream urls stopped working)
+
+        Parameters
+        ----------
+        url : str
+            The YouTube video url
+
+        Returns
+        -------
+        None
+        """
+        video_id = get_video_id(url) or url
+        with self._lock:
+            self._videos.pop(video_id, None)
+            self._pytube_streams.pop(video_id, None)
+        try:
+            os.remove(self._get_path(video_id))
+        except OSError:
+            pass
+
+    def _get_video_lock(self, video_id: str) -> threading.Lock:
+        """
+        Returns the lock of a video id
+        """
+        with self._lock:
+            return self._video_locks.setdefault(video_id, threading.Lock())
+
+    def _get_path(self, video_id: str) -> str:
+        """
+        Returns the on-disk cache file path of a video id
+        """
+        file_name = re.sub(r"[^\w-]", "_", video_id)
+        return os.path.join(self.cache_dir, f"{file_name}.json")
+
+    def _get_cached(self, video_id: str) -> Optional[VideoInfo]:
+        """
+        Returns the unexpired info of a video from memory, or from disk
+        """
+        now = time.time()
+        with self._lock:
+            info = self._videos.get(video_id)
+        if info and info.expires > now:
+            return info
+
+        try:
+            with open(self._get_path(video_id), encoding="utf-8") as file:
+                info = VideoInfo.from_dict(json.load(file))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Could not read the cached YouTube video. Error: {e}")
+            return None
+        if info.expires <= now:
+            return None
+
+        with self._lock:
+            self._videos[video_id] = info
+        return info
+
+    def _extract(self, url: str, video_id: str) -> VideoInfo:
+        """
+        Extracts a video with pytube and caches it
+        """
+        youtube_limiter.acquire()
+        yt = YouTube(url)
+        youtube_streams = yt.streams.filter(only_audio=True).order_by("bitrate").desc()
+        audio_formats = [AudioFormat(stream.url, stream.itag, stream.abr, stream.mime_type) for stream in youtube_streams]
+        self.extractions += 1
+
+        expires = time.time() + self.ttl
+        url_expiry = min(filter(None, (_get_url_expiry(audio_format.url) for audio_format in audio_formats)), default=None)
+        if url_expiry:
+            expires = min(expires, url_expiry - self.expiry_margin)
+        info = VideoInfo(video_id, yt.title, yt.author, yt.length, _get_music_metadata(yt), audio_formats, expires)
+
+        with self._lock:
+            self._videos[video_id] = info
+            self._pytube_streams[video_id] = youtube_streams
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary file first so a crash can't leave a partial cache file
+            temporary_path = f"{self._get_path(video_id)}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(info.to_dict(), file)
+            os.replace(temporary_path, self._get_path(video_id))
+        except OSError as e:
+            print(f"Could not write the YouTube video to the cache. Error: {e}")
+        return info
+
+
+youtube_cache = YouTubeCache()
+
+
+def test():
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    for _ in range(3):
+        start = time.perf_counter()
+        info = youtube_cache.get(url)
+        print(f"{info.title} by {info.author}: {len(info.audio_formats)} audio formats in {(time.perf_counter() - start) * 1000.0:.1f}ms")
+    print(f"{youtube_cache.extractions} extraction(s)")
+
+if __name__ == "__main__":
+    test()